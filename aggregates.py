@@ -0,0 +1,299 @@
+import numpy as np
+import pandas as pd
+
+from data_processing import classify_credibility
+from instrumentation import instrument
+
+# --- Chart Cube ---
+# The dashboard charts only need counts, so they are computed once per analysis and
+# the browser receives one row per category combination instead of one row per post.
+# The time tables carry an 'inlier' flag so charts can drop Isolation Forest outliers.
+
+
+def _calendar_days(timestamps):
+    """Calendar day (local wall-clock time) of every timestamp, binned with datetime64 arithmetic."""
+    if getattr(timestamps.dt, 'tz', None) is not None:
+        timestamps = timestamps.dt.tz_localize(None)
+    days = timestamps.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    return days.astype('datetime64[ns]')
+
+
+def _period_starts(dates, period):
+    """First day of the day, week (Monday) or month containing each date."""
+    days = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    if period == 'date':
+        starts = days
+    elif period == 'week':
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 is the weekday with Monday = 0
+        starts = days - ((days.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+    else:
+        starts = days.astype('datetime64[M]').astype('datetime64[D]')
+    return starts.astype('datetime64[ns]')
+
+
+def _count(frame, keys):
+    """Counts rows per combination of `keys`, dropping combinations that never occur."""
+    counts = frame.groupby(keys, observed=True, sort=True).size().reset_index(name='count')
+    counts['count'] = counts['count'].astype(np.int64)
+    return counts
+
+
+@instrument("build_chart_cube")
+def build_chart_cube(data):
+    """
+    Aggregates the analysis data into the small count tables the charts use.
+
+    Parameters:
+        data: the analysis DataFrame (with 'label', and where available 'source',
+              'location', 'latitude', 'longitude', 'timestamp' and 'cluster').
+
+    Returns a dict of DataFrames, each with a 'count' column:
+        'source':   source x credibility
+        'location': location (with its coordinates) x credibility
+        'date':     calendar day x credibility x inlier
+        'week':     week (starting Monday, in 'date') x credibility x inlier
+        'month':    month (first day, in 'date') x credibility x inlier
+        'hour':     hour of day x credibility x inlier
+        'weekday':  day of week x credibility x inlier
+    Tables whose columns are missing from `data` are left out.
+    """
+    if 'credibility' in data.columns:
+        credibility = data['credibility']
+    elif 'label' in data.columns:
+        credibility = classify_credibility(data['label'])
+    else:
+        credibility = classify_credibility(pd.Series(np.nan, index=data.index))
+
+    frame = pd.DataFrame({'credibility': credibility}, index=data.index)
+    if 'cluster' in data.columns:
+        frame['inlier'] = data['cluster'].to_numpy() != -1
+    else:
+        frame['inlier'] = True
+
+    cube = {}
+    if 'source' in data.columns:
+        frame['source'] = data['source']
+        cube['source'] = _count(frame, ['source', 'credibility'])
+
+    if {'location', 'latitude', 'longitude'}.issubset(data.columns):
+        frame['location'] = data['location']
+        frame['latitude'] = data['latitude']
+        frame['longitude'] = data['longitude']
+        cube['location'] = _count(frame, ['location', 'latitude', 'longitude', 'credibility'])
+
+    if 'timestamp' in data.columns:
+        timestamps = data['timestamp']
+        frame['date'] = _calendar_days(timestamps)
+        frame['hour'] = timestamps.dt.hour
+        frame['day_of_week'] = timestamps.dt.dayofweek
+        cube['date'] = _count(frame, ['date', 'credibility', 'inlier'])
+        # Weekly and monthly series are rolled up from the (much smaller) daily table
+        for period in ('week', 'month'):
+            periods = cube['date'].assign(date=_period_starts(cube['date']['date'], period))
+            cube[period] = rollup(periods, ['date', 'credibility', 'inlier'])
+        cube['hour'] = _count(frame, ['hour', 'credibility', 'inlier'])
+        cube['weekday'] = _count(frame, ['day_of_week', 'credibility', 'inlier'])
+
+    return cube
+
+
+def get_chart_cube(analysis_results):
+    """
+    The chart cube of an analysis result, built (and kept on the result) the first
+    time it is needed if the analysis did not include one.
+    """
+    if 'cube' not in analysis_results:
+        analysis_results['cube'] = build_chart_cube(analysis_results['data'])
+    return analysis_results['cube']
+
+
+def rollup(table, keys, inliers_only=False):
+    """
+    Sums a cube table over every column not in `keys`, optionally counting only inliers.
+    """
+    if inliers_only and 'inlier' in table.columns:
+        table = table[table['inlier']]
+    return table.groupby(keys, observed=True, sort=True)['count'].sum().reset_index()
+
+
+# --- Time Series ---
+# Cube tables holding report counts per day, week and month, and the most points a
+# trend chart shows before switching to a coarser period.
+TIME_SERIES_PERIODS = {'Daily': 'date', 'Weekly': 'week', 'Monthly': 'month'}
+MAX_TIME_SERIES_POINTS = 500
+
+
+def time_series(cube, period, start=None, end=None):
+    """
+    Inlier report counts per period ('date', 'week' or 'month') for the periods that
+    overlap the window [start, end]. Periods are labelled by their first day.
+    """
+    counts = rollup(cube[period], ['date'], inliers_only=True)
+    if start is not None:
+        first = _period_starts(pd.Series([pd.Timestamp(start)]), period)[0]
+        counts = counts[counts['date'] >= first]
+    if end is not None:
+        counts = counts[counts['date'] <= pd.Timestamp(end)]
+    return counts.reset_index(drop=True)
+
+
+def choose_time_period(cube, start=None, end=None, max_points=MAX_TIME_SERIES_POINTS):
+    """The finest period whose series over the window has at most `max_points` points."""
+    for period in ('date', 'week'):
+        if len(time_series(cube, period, start, end)) <= max_points:
+            return period
+    return 'month'
+
+
+# --- Map Binning ---
+# With many distinct places the bubble map is drawn from a lat/lon grid instead of
+# exact locations. Cell sizes are in degrees (0.01 deg is roughly 1 km at PH latitudes).
+MAP_CELL_DEGREES = [0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0]
+MAX_MAP_MARKERS = 2000
+
+
+def _cell_keys(latitude, longitude, cell_degrees):
+    """One integer per grid cell of size `cell_degrees` (geohash-style row-major index)."""
+    rows = np.floor((latitude + 90.0) / cell_degrees).astype(np.int64)
+    cols = np.floor((longitude + 180.0) / cell_degrees).astype(np.int64)
+    return rows * (int(360.0 / cell_degrees) + 1) + cols
+
+
+def _marker_groups(table, cell_degrees):
+    """Group id of every row of a location table: one group per (cell, credibility)."""
+    credibility_codes = pd.factorize(table['credibility'])[0].astype(np.int64)
+    keys = _cell_keys(table['latitude'].to_numpy(dtype=float), table['longitude'].to_numpy(dtype=float),
+                      cell_degrees)
+    return pd.factorize(keys * (credibility_codes.max(initial=0) + 1) + credibility_codes)[0]
+
+
+def choose_cell_degrees(table, max_markers=MAX_MAP_MARKERS, min_cell_degrees=None):
+    """
+    Picks the finest map detail that keeps the number of markers within `max_markers`.
+
+    Parameters:
+        table: the 'location' table of the chart cube (one row per location and credibility).
+        max_markers: most markers the map may draw.
+        min_cell_degrees: finest cell size allowed (None allows exact locations).
+
+    Returns None for exact locations, else a cell size from MAP_CELL_DEGREES
+    (the coarsest one if none fits).
+    """
+    candidates = [None] if min_cell_degrees is None else []
+    candidates += [cell for cell in MAP_CELL_DEGREES if min_cell_degrees is None or cell >= min_cell_degrees]
+    for cell_degrees in candidates:
+        if cell_degrees is None:
+            markers = len(table)
+        else:
+            markers = _marker_groups(table, cell_degrees).max(initial=-1) + 1
+        if markers <= max_markers:
+            return cell_degrees
+    return candidates[-1] if candidates else MAP_CELL_DEGREES[-1]
+
+
+def bin_locations(table, cell_degrees):
+    """
+    Aggregates a location table onto a grid of `cell_degrees` cells.
+
+    Each (cell, credibility) becomes one marker placed at the count-weighted centre of
+    its locations and named after its busiest location. Returns a table with the same
+    columns (location, latitude, longitude, credibility, count) plus 'locations', the
+    number of places merged into each marker. `cell_degrees=None` keeps exact locations.
+    """
+    if cell_degrees is None or table.empty:
+        return table.assign(locations=1)
+
+    groups = _marker_groups(table, cell_degrees)
+    counts = table['count'].to_numpy(dtype=float)
+    latitude = table['latitude'].to_numpy(dtype=float)
+    longitude = table['longitude'].to_numpy(dtype=float)
+
+    totals = np.bincount(groups, weights=counts)
+    weights = np.where(totals > 0, totals, 1.0)
+    n_locations = np.bincount(groups)
+
+    # Busiest location of each group: sort by group, then by descending count
+    order = np.lexsort((-counts, groups))
+    sorted_groups = groups[order]
+    first = order[np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]]
+
+    names = table['location'].astype(str).to_numpy()[first]
+    extra = n_locations - 1
+    names = np.where(extra > 0, pd.Series(names) + " +" + pd.Series(extra).astype(str) + " more", names)
+
+    return pd.DataFrame({
+        'location': names,
+        'latitude': np.bincount(groups, weights=counts * latitude) / weights,
+        'longitude': np.bincount(groups, weights=counts * longitude) / weights,
+        'credibility': table['credibility'].to_numpy()[first],
+        'count': totals.astype(np.int64),
+        'locations': n_locations
+    })
+
+
+# --- Parallel Coordinates ---
+# The plot shows a stratified sample of at most PARALLEL_POINT_BUDGET inlier rows as
+# lines, over per-cluster mean lines and interquartile bands computed from every row.
+PARALLEL_FEATURES = ['latitude', 'longitude', 'hour', 'day_of_week']
+PARALLEL_POINT_BUDGET = 1500
+
+
+@instrument("parallel_coordinates_summary")
+def parallel_coordinates_summary(data, features=PARALLEL_FEATURES, point_budget=PARALLEL_POINT_BUDGET,
+                                 random_state=42):
+    """
+    Level-of-detail tables for the parallel coordinates plot. Features are scaled to
+    0-1 with the min/max of all inliers.
+
+    Parameters:
+        data: the analysis DataFrame (with 'cluster' and the feature columns).
+        features: feature columns, in axis order.
+        point_budget: most sample lines to return.
+
+    Returns a dict of long-format DataFrames (one row per line/cluster and feature):
+        'lines':     sampled rows ('line', 'cluster', 'Feature', 'normalized_value', 'location')
+        'centroids': per-cluster means ('cluster', 'Feature', 'normalized_value')
+        'bands':     per-cluster 25%-75% quantiles ('cluster', 'Feature', 'low', 'high')
+    plus 'total_points', the number of inlier rows summarized.
+    """
+    from analysis import stratified_sample_indices
+
+    clusters = data['cluster'].to_numpy()
+    rows = np.flatnonzero(clusters != -1)
+    clusters = clusters[rows].astype(np.int64)
+
+    # Only the feature columns of inlier rows are copied
+    values = np.column_stack([data[feature].to_numpy(dtype=float)[rows] for feature in features])
+    low = np.nanmin(values, axis=0) if len(values) else np.zeros(len(features))
+    span = (np.nanmax(values, axis=0) - low) if len(values) else np.ones(len(features))
+    normalized = (values - low) / np.where(span > 0, span, 1.0)
+
+    sample = stratified_sample_indices(len(rows), point_budget, strata=clusters, random_state=random_state)
+    n_features = len(features)
+    lines = pd.DataFrame({
+        'line': np.repeat(np.arange(len(sample)), n_features),
+        'cluster': np.repeat(clusters[sample], n_features),
+        'Feature': np.tile(features, len(sample)),
+        'normalized_value': normalized[sample].ravel()
+    })
+    if 'location' in data.columns:
+        lines['location'] = np.repeat(data['location'].iloc[rows[sample]].astype(str).to_numpy(), n_features)
+
+    by_cluster = pd.DataFrame(normalized, columns=features).groupby(clusters)
+    centroids = by_cluster.mean().rename_axis('cluster').reset_index().melt(
+        id_vars='cluster', var_name='Feature', value_name='normalized_value')
+    quantiles = by_cluster.quantile([0.25, 0.75])
+    quantiles.index = quantiles.index.set_names(['cluster', 'quantile'])
+    quantiles = quantiles.reset_index().melt(id_vars=['cluster', 'quantile'], var_name='Feature')
+    bands = quantiles.pivot_table(index=['cluster', 'Feature'], columns='quantile', values='value').reset_index()
+    bands = bands.rename(columns={0.25: 'low', 0.75: 'high'})
+    bands.columns.name = None
+
+    return {'lines': lines, 'centroids': centroids, 'bands': bands, 'total_points': len(rows)}
+
+
+def get_parallel_summary(analysis_results):
+    """The parallel coordinates summary of an analysis, computed once and kept on the result."""
+    if 'parallel_summary' not in analysis_results:
+        analysis_results['parallel_summary'] = parallel_coordinates_summary(analysis_results['data'])
+    return analysis_results['parallel_summary']
@@ -1,5 +1,14 @@
+import os
+import time
+import datetime
+import warnings
+
+import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+import joblib
+import sklearn
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score, davies_bouldin_score
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
@@ -7,62 +16,456 @@ from kneed import KneeLocator
 
 # --- Import your custom EnhancedKMeans algorithm ---
 from enhanced_kmeans import EnhancedKMeans
+from instrumentation import instrument, stage
+from result_cache import analysis_cache_key, get_result_cache
+from aggregates import build_chart_cube
+
+# --- Scalable K Selection ---
+# Above this many rows the elbow search runs on a sample (or MiniBatchKMeans) instead of all rows.
+LARGE_DATASET_ROWS = 100_000
+ELBOW_SAMPLE_SIZE = 20_000
+
+FEATURES = ['latitude', 'longitude', 'hour', 'day_of_week']
+
+# Feature matrices are float64 unless FEATURE_DTYPE=float32 is set (half the memory,
+# slightly different results).
+FEATURE_DTYPE = os.environ.get("FEATURE_DTYPE", "float64")
+
+# Bumped whenever the saved pipeline layout changes; older files are refused on load.
+PIPELINE_FORMAT_VERSION = 1
+
+# --- Partitioned Analysis ---
+# National-scale data can be clustered per region (or per spatial tile when there is no
+# region column), one partition per worker process, then merged into one global view.
+# Partitions smaller than MIN_PARTITION_ROWS are pooled into a single "Other areas" one.
+PARTITION_JOBS = int(os.environ.get("PARTITION_JOBS", -1))
+PARTITION_TILE_DEGREES = 4.0
+MIN_PARTITION_ROWS = 2000
+OTHER_PARTITION = "Other areas"
+
+def build_feature_matrix(df, features=FEATURES, dtype=None):
+    """
+    Builds the clustering features straight into one C-contiguous NumPy array, copying
+    only these four columns (never the whole frame).
 
-def prepare_data_for_clustering(df, n_components=None):
+    Parameters:
+        df: DataFrame with 'latitude', 'longitude' and a datetime 'timestamp'.
+        features: feature names, in column order.
+        dtype: float64 by default (see FEATURE_DTYPE); float32 halves the memory.
+
+    Returns (X, derived) where `derived` holds the 'hour' and 'day_of_week' arrays.
+    """
+    timestamps = df['timestamp'].dt
+    derived = {
+        'hour': timestamps.hour.to_numpy(),
+        'day_of_week': timestamps.dayofweek.to_numpy()
+    }
+    X = np.empty((len(df), len(features)), dtype=np.dtype(dtype or FEATURE_DTYPE))
+    for i, feature in enumerate(features):
+        X[:, i] = derived[feature] if feature in derived else df[feature].to_numpy()
+    return X, derived
+
+@instrument("prepare_data_for_clustering")
+def prepare_data_for_clustering(df, n_components=None, return_transformers=False, scaler=None, dtype=None):
     """
     Extracts features from timestamp, scales the data, and applies PCA if requested.
+
+    `df` is not copied or modified: the derived columns ('hour', 'day_of_week' and any
+    'principal_component_<i>') are returned as arrays in a dict next to the features.
+    Pass the `scaler` fitted by an earlier call on the same data to skip refitting it.
+
+    With `return_transformers=True`, also returns the fitted StandardScaler and PCA
+    (None without PCA) so new records can be transformed the same way.
     """
-    # Use a deep copy to ensure the original DataFrame is not modified.
-    df_copy = df.copy(deep=True) 
-    
-    df_copy['hour'] = df_copy['timestamp'].dt.hour
-    df_copy['day_of_week'] = df_copy['timestamp'].dt.dayofweek
-    
-    features = ['latitude', 'longitude', 'hour', 'day_of_week']
-    X = df_copy[features]
+    X, derived = build_feature_matrix(df, dtype=dtype)
 
-    # Step 1: Scale the data
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    # Step 1: Scale the data (in place; X is our own fresh array)
+    if scaler is None:
+        scaler = StandardScaler(copy=False)
+        X_scaled = scaler.fit_transform(X)
+    else:
+        X_scaled = scaler.transform(X, copy=False)
 
     # Step 2: Apply PCA if n_components is specified and > 0
+    pca = None
     if n_components is not None and n_components > 0:
-        pca = PCA(n_components=n_components, random_state=42)
-        X_processed = pca.fit_transform(X_scaled)
+        with stage("pca", rows_in=len(X_scaled)):
+            pca = PCA(n_components=n_components, random_state=42)
+            X_processed = pca.fit_transform(X_scaled)
         
-        # Add PCA component columns to the DataFrame for visualization
+        # PCA component columns for visualization
         for i in range(n_components):
-            df_copy[f'principal_component_{i+1}'] = X_processed[:, i]
+            derived[f'principal_component_{i+1}'] = X_processed[:, i]
     else:
         # If no PCA, return the scaled data
         X_processed = X_scaled
-        
-    return X_processed, df_copy
 
-def find_optimal_k(scaled_data, k_range=(2, 11)):
+    if return_transformers:
+        return X_processed, derived, scaler, pca
+    return X_processed, derived
+
+
+def _with_columns(df, columns):
+    """A shallow copy of `df` with extra columns; the existing columns are not copied."""
+    df_with_columns = df.copy(deep=False)
+    for name, values in columns.items():
+        df_with_columns[name] = values
+    return df_with_columns
+
+class ClusteringPipeline:
     """
-    Finds the optimal k using the Elbow Method on the base scaled data (without PCA).
+    The fitted analysis pipeline: feature extraction, StandardScaler, optional PCA and
+    EnhancedKMeans. Scores new records without refitting anything.
     """
-    inertias = []
-    ks = range(k_range[0], k_range[1])
-    for k in ks:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-        kmeans.fit(scaled_data)
-        inertias.append(kmeans.inertia_)
-    
+    def __init__(self, model, scaler, pca=None, features=FEATURES):
+        self.model = model
+        self.scaler = scaler
+        self.pca = pca
+        self.features = list(features)
+
+    def _prepare(self, df):
+        X, _ = build_feature_matrix(df, self.features)
+        if hasattr(self.scaler, 'feature_names_in_'):
+            X = pd.DataFrame(X, columns=self.features)  # Scaler fitted on a DataFrame
+        X = self.scaler.transform(X)
+        return self.pca.transform(X) if self.pca is not None else X
+
+    def predict(self, df):
+        """Cluster label for each record; -1 marks outliers."""
+        return self.model.predict(self._prepare(df))
+
+    def score_samples(self, df):
+        """Isolation Forest anomaly score for each record (lower is more abnormal)."""
+        return self.model.score_samples(self._prepare(df))
+
+    def transform(self, df):
+        """Distance from each record to every cluster centroid."""
+        return self.model.transform(self._prepare(df))
+
+    def partial_fit(self, df):
+        """
+        Feeds newly arrived records to an incremental model (IncrementalEnhancedKMeans).
+        The scaler and PCA stay fixed; check `model.needs_refit()` to know when to rerun
+        the full analysis.
+        """
+        if not hasattr(self.model, 'partial_fit'):
+            raise TypeError("This pipeline's model does not support incremental updates.")
+        self.model.partial_fit(self._prepare(df))
+        return self
+
+    def save(self, path):
+        """
+        Saves the pipeline with joblib, tagged with the format and scikit-learn versions.
+        """
+        payload = {
+            'format_version': PIPELINE_FORMAT_VERSION,
+            'sklearn_version': sklearn.__version__,
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'model': self.model,
+            'scaler': self.scaler,
+            'pca': self.pca,
+            'features': self.features
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        joblib.dump(payload, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a pipeline saved with `save`. Raises ValueError if it was written by an
+        incompatible version of this app.
+        """
+        payload = joblib.load(path)
+        version = payload.get('format_version') if isinstance(payload, dict) else None
+        if version != PIPELINE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported pipeline format version {version!r} (expected {PIPELINE_FORMAT_VERSION}). Please re-run the analysis.")
+        if payload.get('sklearn_version') != sklearn.__version__:
+            warnings.warn(f"Pipeline was saved with scikit-learn {payload.get('sklearn_version')}, running {sklearn.__version__}.")
+        return cls(payload['model'], payload['scaler'], payload['pca'], payload['features'])
+
+def _add_seeds(X, centers, n_new, rng):
+    """
+    Extends a set of centroids with `n_new` seeds picked by k-means++ D^2 sampling,
+    so a fit for k can start from the converged centroids of a smaller k.
+    """
+    centers = np.asarray(centers, dtype=float)
+    closest = np.full(len(X), np.inf)
+    for center in centers:
+        closest = np.minimum(closest, ((X - center) ** 2).sum(axis=1))
+    for _ in range(n_new):
+        total = closest.sum()
+        idx = rng.choice(len(X), p=closest / total) if total > 0 else rng.integers(len(X))
+        centers = np.vstack([centers, X[idx]])
+        closest = np.minimum(closest, ((X - X[idx]) ** 2).sum(axis=1))
+    return centers
+
+def _warm_fit(X, k, warm_centers, random_state):
+    """One k-means fit started from a smaller k's centroids plus new k-means++ seeds."""
+    rng = np.random.default_rng(random_state + k)
+    init = _add_seeds(X, warm_centers, k - len(warm_centers), rng)
+    return KMeans(n_clusters=k, init=init, n_init=1, random_state=random_state).fit(X)
+
+def _fit_k(X, k, warm_centers, n_init, random_state):
+    """
+    Fits one k for the elbow sweep: a cold k-means++ fit and, when available, a fit
+    warm-started from a smaller k's centroids. Returns (k, inertia, centroids) of the better one.
+    """
+    best = KMeans(n_clusters=k, random_state=random_state, n_init=n_init).fit(X)
+    if warm_centers is not None:
+        warm = _warm_fit(X, k, warm_centers, random_state)
+        if warm.inertia_ < best.inertia_:
+            best = warm
+    return k, best.inertia_, best.cluster_centers_
+
+def _refine_k(X, k, warm_centers, random_state):
+    """The warm-started half of _fit_k alone. Returns (k, inertia, centroids)."""
+    warm = _warm_fit(X, k, warm_centers, random_state)
+    return k, warm.inertia_, warm.cluster_centers_
+
+def _find_knee(ks, inertias):
     try:
         kn = KneeLocator(list(ks), inertias, curve='convex', direction='decreasing')
-        optimal_k = kn.elbow if kn.elbow else 4
+        return kn.elbow
     except Exception:
-        optimal_k = 4
-        
+        return None
+
+@instrument("find_optimal_k")
+def find_optimal_k(scaled_data, k_range=(2, 11), n_jobs=-1, warm_start=True, early_stop=False, patience=2):
+    """
+    Finds the optimal k using the Elbow Method on the base scaled data (without PCA).
+
+    The k values are fitted in parallel waves of one k per core. Each k after the first
+    wave is warm-started from the centroids of the largest k already fitted (plus new
+    k-means++ seeds), alongside a cold fit with half the usual restarts; the lower
+    inertia wins. First-wave k values use the usual 10 restarts, then get one warm fit
+    each from the next smaller k's centroids, so even a sweep that fits in one wave
+    (at least as many cores as k values) is warm-started.
+
+    With `early_stop`, the sweep ends once the knee has stayed the same for `patience`
+    further k values past it, so the returned inertias may be shorter than the full
+    range. It is off by default because KneeLocator normalizes over the k values it is
+    given, so a truncated curve can place the knee one k lower.
+    """
+    fitted = _elbow_sweep(scaled_data, list(range(k_range[0], k_range[1])), n_jobs, warm_start, early_stop, patience)
+    done = sorted(fitted)
+    inertias = [fitted[k][0] for k in done]
+    knee = _find_knee(done, inertias)
+    optimal_k = knee if knee else 4
+
     return inertias, optimal_k
 
+def _elbow_sweep(scaled_data, ks, n_jobs=-1, warm_start=True, early_stop=False, patience=2):
+    """
+    Runs the parallel elbow sweep and returns a dict of k -> (inertia, centroids).
+    """
+    X = np.ascontiguousarray(scaled_data, dtype=float)
+    n_workers = effective_n_jobs(n_jobs)
+    wave_size = max(1, min(n_workers, len(ks)))
+
+    fitted = {}
+    last_knee, stable_since = None, None
+    with Parallel(n_jobs=wave_size) as parallel:
+        for start in range(0, len(ks), wave_size):
+            wave = ks[start:start + wave_size]
+            jobs = []
+            for k in wave:
+                smaller = [j for j in fitted if j < k]
+                warm_centers = fitted[max(smaller)][1] if warm_start and smaller else None
+                # Warm-started k values need fewer cold restarts to reach the same inertia
+                n_init = 10 if warm_centers is None else 5
+                jobs.append(delayed(_fit_k)(X, k, warm_centers, n_init, 42))
+            for k, inertia, centers in parallel(jobs):
+                fitted[k] = (inertia, centers)
+
+            if start == 0 and warm_start and len(wave) > 1:
+                # Nothing smaller was fitted while the first wave ran, so each of its k
+                # values gets one warm fit from the next smaller k now (one restart each)
+                jobs = [delayed(_refine_k)(X, k, fitted[previous][1], 42)
+                        for previous, k in zip(wave, wave[1:])]
+                for k, inertia, centers in parallel(jobs):
+                    if inertia < fitted[k][0]:
+                        fitted[k] = (inertia, centers)
+
+            if not early_stop:
+                continue
+            done = sorted(fitted)
+            knee = _find_knee(done, [fitted[k][0] for k in done]) if len(done) >= 3 else None
+            if knee is None or knee != last_knee:
+                last_knee, stable_since = knee, done[-1]
+            elif done[-1] - knee >= patience and done[-1] > stable_since:
+                break
+
+    return fitted
+
+def build_strata(df):
+    """
+    Builds stratum codes for sampling: region (when present) crossed with calendar month.
+    """
+    months = (df['timestamp'].dt.year * 12 + df['timestamp'].dt.month).to_numpy(dtype=np.int64)
+    if 'region' in df.columns:
+        region_codes, _ = pd.factorize(df['region'])
+        months = region_codes.astype(np.int64) * (months.max() + 1) + months
+    codes, _ = pd.factorize(months)
+    return codes
+
+def stratified_sample_indices(n_rows, sample_size, strata=None, random_state=42):
+    """
+    Returns sorted row indices of a sample of about `sample_size` rows. With `strata`,
+    every stratum is sampled in proportion to its size (and keeps at least one row).
+    """
+    rng = np.random.default_rng(random_state)
+    if sample_size >= n_rows:
+        return np.arange(n_rows)
+    if strata is None:
+        return np.sort(rng.choice(n_rows, size=sample_size, replace=False))
+
+    strata = np.asarray(strata)
+    order = np.argsort(strata, kind='stable')
+    groups, starts, counts = np.unique(strata[order], return_index=True, return_counts=True)
+    quotas = np.maximum(1, np.round(counts * sample_size / n_rows).astype(int))
+
+    picked = []
+    for start, count, quota in zip(starts, counts, quotas):
+        members = order[start:start + count]
+        picked.append(rng.choice(members, size=min(quota, count), replace=False))
+    return np.sort(np.concatenate(picked))
+
+def _minibatch_sweep(X, ks, random_state=42):
+    """Fits MiniBatchKMeans on the full data for each k. Returns k -> (inertia, centroids)."""
+    fitted = {}
+    for k in ks:
+        model = MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=3, batch_size=4096).fit(X)
+        fitted[k] = (model.inertia_, model.cluster_centers_)
+    return fitted
+
+def _full_data_inertia(X, centers, chunk_rows=200_000):
+    """Inertia of the full data against fixed centroids, computed in chunks."""
+    total = 0.0
+    for start in range(0, len(X), chunk_rows):
+        chunk = X[start:start + chunk_rows]
+        distances = np.full(len(chunk), np.inf)
+        for center in centers:
+            distances = np.minimum(distances, ((chunk - center) ** 2).sum(axis=1))
+        total += distances.sum()
+    return total
+
+@instrument("select_k")
+def select_k(scaled_data, strata=None, k_range=(2, 11), large_threshold=LARGE_DATASET_ROWS,
+             sample_size=ELBOW_SAMPLE_SIZE, method='sample', n_jobs=-1):
+    """
+    Chooses k with the Elbow Method, switching to a scalable mode for large datasets.
+
+    Up to `large_threshold` rows this is `find_optimal_k` on all the data. Above it, k is
+    chosen either on a stratified sample of `sample_size` rows ('sample') or with
+    MiniBatchKMeans on all rows ('minibatch'). The chosen elbow is then checked on the
+    full data at k-1, k and k+1: the centroids found for those k values are scored
+    against every row, and the elbow counts as confirmed when the drop in full-data
+    inertia is still larger before k than after it.
+
+    In 'sample' mode the confidence is how closely the sample's (scaled) inertias match
+    the full data's, halved when the elbow is not confirmed. MiniBatchKMeans inertias
+    are full-data inertias already, so in 'minibatch' mode it is the elbow's strength,
+    1 - (drop after k) / (drop before k): near 1 for a sharp elbow, near 0 for a smooth
+    curve with no real elbow (0 when k is at the edge of the range).
+
+    Returns a dict with 'inertias', 'optimal_k', 'mode', 'rows_used' and, in the
+    scalable modes, 'confidence' (0-1), 'elbow_confirmed' and 'full_data_inertias'.
+    """
+    X = np.ascontiguousarray(scaled_data, dtype=float)
+    n_rows = len(X)
+    ks = list(range(k_range[0], k_range[1]))
+
+    if n_rows <= large_threshold:
+        inertias, optimal_k = find_optimal_k(X, k_range=k_range, n_jobs=n_jobs)
+        return {'inertias': inertias, 'optimal_k': optimal_k, 'mode': 'full', 'rows_used': n_rows}
+
+    if method == 'minibatch':
+        fitted = _minibatch_sweep(X, ks)
+        scale, rows_used = 1.0, n_rows
+    else:
+        sample = stratified_sample_indices(n_rows, sample_size, strata)
+        fitted = _elbow_sweep(X[sample], ks, n_jobs=n_jobs)
+        scale, rows_used = n_rows / len(sample), len(sample)
+
+    inertias = [fitted[k][0] for k in ks]
+    knee = _find_knee(ks, inertias)
+    optimal_k = int(knee) if knee else 4
+
+    # --- Full-data check on the neighbourhood of the chosen k ---
+    check_ks = [k for k in (optimal_k - 1, optimal_k, optimal_k + 1) if k in fitted]
+    full = {k: _full_data_inertia(X, fitted[k][1]) for k in check_ks}
+
+    elbow_confirmed = None
+    if len(check_ks) == 3:
+        before = full[optimal_k - 1] - full[optimal_k]
+        after = full[optimal_k] - full[optimal_k + 1]
+        elbow_confirmed = bool(before > after)
+
+    if method == 'minibatch':
+        confidence = min(max(1.0 - after / before, 0.0), 1.0) if elbow_confirmed is not None and before > 0 else 0.0
+    else:
+        errors = [abs(fitted[k][0] * scale - full[k]) / full[k] for k in check_ks if full[k] > 0]
+        agreement = max(0.0, 1.0 - float(np.mean(errors))) if errors else 0.0
+        confidence = agreement if elbow_confirmed is not False else agreement * 0.5
+    return {
+        'inertias': inertias,
+        'optimal_k': optimal_k,
+        'mode': method,
+        'rows_used': rows_used,
+        'confidence': round(confidence, 3),
+        'elbow_confirmed': elbow_confirmed,
+        'full_data_inertias': full
+    }
+
 # --- STANDARD ANALYSIS FUNCTION HAS BEEN REMOVED ---
 
-def run_enhanced_analysis(df, n_clusters):
+def _results_from_cache(df, cached, n_components, pipeline_path, dtype=None):
+    """
+    Rebuilds the run_enhanced_analysis result from stored labels and PCA projection
+    without refitting anything. The projection is stored as float32 and returned in
+    the feature dtype, as a fresh run returns it.
+    """
+    X_processed = cached['X_processed'].astype(np.dtype(dtype or FEATURE_DTYPE))
+    labels = cached['labels'].astype(int)
+
+    derived = {
+        'hour': df['timestamp'].dt.hour.to_numpy(),
+        'day_of_week': df['timestamp'].dt.dayofweek.to_numpy()
+    }
+    for i in range(n_components):
+        derived[f'principal_component_{i+1}'] = X_processed[:, i]
+    if 'cluster' in df.columns:
+        df = df.drop(columns=['cluster'])
+    derived['cluster'] = labels
+    df_with_features = _with_columns(df, derived)
+
+    try:
+        pipeline = ClusteringPipeline.load(pipeline_path) if os.path.exists(pipeline_path) else None
+    except Exception:
+        pipeline = None  # A stale or unreadable model only costs the ability to score new records
+
+    return {
+        'data': df_with_features,
+        'pca_components': n_components,
+        'X_processed': X_processed,
+        'inlier_mask': labels != -1,
+        'pipeline': pipeline,
+        'cluster_centers': cached['cluster_centers'],
+        'cube': build_chart_cube(df_with_features),
+        'from_cache': True
+    }
+
+@instrument("run_enhanced_analysis")
+def run_enhanced_analysis(df, n_clusters, use_cache=True, scaler=None, dtype=None):
     """
     Runs the enhanced analysis (IF + K-Means) WITH hard-coded best parameters.
+
+    `scaler` may be the StandardScaler already fitted on `df` for the elbow search.
+
+    Results are shared across sessions through the result cache, keyed by a fingerprint
+    of `df` and the parameters, so a repeat analysis of the same data returns at once.
     """
     # --- HARD-CODED OPTIMAL PARAMETERS ---
     # We use the best parameters we found during our research.
@@ -71,7 +474,18 @@ def run_enhanced_analysis(df, n_clusters):
     CONTAMINATION = 0.1
     # --- ---------------------------- ---
 
-    X_processed, df_with_features = prepare_data_for_clustering(df, n_components=N_COMPONENTS)
+    cache_key = None
+    if use_cache:
+        cache_key = analysis_cache_key(df, n_clusters=n_clusters, contamination=CONTAMINATION,
+                                       n_components=N_COMPONENTS, random_state=42,
+                                       feature_dtype=str(np.dtype(dtype or FEATURE_DTYPE)))
+        cached = get_result_cache().get(cache_key)
+        if cached is not None:
+            return _results_from_cache(df, cached, N_COMPONENTS, get_result_cache().pipeline_path(cache_key), dtype=dtype)
+
+    X_processed, derived, scaler, pca = prepare_data_for_clustering(
+        df, n_components=N_COMPONENTS, return_transformers=True, scaler=scaler, dtype=dtype
+    )
 
     try:
         enhanced_model = EnhancedKMeans(
@@ -88,19 +502,202 @@ def run_enhanced_analysis(df, n_clusters):
              return {'error': "Not enough data points remained after outlier removal to calculate performance metrics."}
 
         # --- ROBUST FIX for 'cluster' column ---
-        if 'cluster' in df_with_features.columns:
-            df_with_features = df_with_features.drop(columns=['cluster'])
-        df_with_features['cluster'] = labels
+        if 'cluster' in df.columns:
+            df = df.drop(columns=['cluster'])
+        derived['cluster'] = labels
         # --- END FIX ---
+        df_with_features = _with_columns(df, derived)
+
+        pipeline = ClusteringPipeline(enhanced_model, scaler, pca)
+        if cache_key is not None:
+            # Compact copy: int16 labels and float32 projection are plenty for display
+            result_cache = get_result_cache()
+            pipeline.save(result_cache.pipeline_path(cache_key))
+            result_cache.put(
+                cache_key,
+                labels=labels.astype(np.int16),
+                cluster_centers=enhanced_model.cluster_centers_,
+                X_processed=X_processed.astype(np.float32)
+            )
         
         results = {
             # We no longer need to calculate metrics, but we pass the data
             'data': df_with_features,
             'pca_components': N_COMPONENTS, # Pass n_components for visualization logic
             'X_processed': X_processed, 
-            'inlier_mask': inlier_mask 
+            'inlier_mask': inlier_mask,
+            # The fitted pipeline scores new records without refitting
+            'pipeline': pipeline,
+            'cluster_centers': enhanced_model.cluster_centers_,
+            # Pre-aggregated counts the dashboard charts are drawn from
+            'cube': build_chart_cube(df_with_features)
         }
         return results
 
     except ValueError as e:
-        return {'error': str(e)}
\ No newline at end of file
+        return {'error': str(e)}
+
+
+def _partition_codes(df, partition_by, tile_degrees, min_rows):
+    """
+    Partition code of every row and the partition names. `partition_by` is 'region',
+    'tile' or 'auto' (region when the data has one, else tiles).
+    """
+    if partition_by == 'auto':
+        partition_by = 'region' if 'region' in df.columns else 'tile'
+    if partition_by == 'region':
+        keys = df['region'].astype(object).fillna("Unknown region").astype(str).to_numpy()
+    else:
+        rows = np.floor(df['latitude'].to_numpy(dtype=float) / tile_degrees).astype(np.int64)
+        cols = np.floor(df['longitude'].to_numpy(dtype=float) / tile_degrees).astype(np.int64)
+        keys = (rows + 90) * 1000 + (cols + 180)
+    codes, uniques = pd.factorize(keys, sort=True)
+    if partition_by == 'region':
+        names = list(uniques)
+    else:
+        # Named after the tile's south-west corner
+        names = [f"Tile {(key // 1000 - 90) * tile_degrees:g}°, {(key % 1000 - 180) * tile_degrees:g}°" for key in uniques]
+
+    # Partitions too small to cluster on their own are pooled together
+    sizes = np.bincount(codes, minlength=len(names))
+    small = sizes < min_rows
+    if small.any() and len(names) > 1:
+        remap = np.where(small, -1, np.cumsum(~small) - 1)
+        names = [name for name, is_small in zip(names, small) if not is_small]
+        remap[small] = len(names)
+        names.append(OTHER_PARTITION)
+        codes = remap[codes]
+    return codes, names
+
+def _fit_partition(X, n_clusters, contamination, random_state):
+    """Fits one partition's Isolation Forest + K-Means. Returns (labels, centers, seconds)."""
+    started = time.perf_counter()
+    # A pooled partition can still be tiny; it gets at most as many clusters as inliers
+    model = EnhancedKMeans(n_clusters=max(1, min(n_clusters, int(len(X) * (1 - contamination)))),
+                           contamination=contamination,
+                           random_state=random_state)
+    labels = model.fit_predict(X)
+    return labels, model.cluster_centers_, time.perf_counter() - started
+
+def _merge_partition_clusters(centers, sizes, n_clusters, random_state):
+    """
+    Groups every partition's clusters into `n_clusters` global clusters with a k-means on
+    their centroids, weighted by cluster size. Returns the global cluster of each local
+    cluster and the global centroids.
+    """
+    k = min(n_clusters, len(centers))
+    merge = KMeans(n_clusters=k, random_state=random_state, n_init=10)
+    mapping = merge.fit_predict(centers, sample_weight=np.maximum(sizes, 1))
+    return mapping, merge.cluster_centers_
+
+def _partition_summary(partition_codes, partition_names, labels, seconds=None):
+    counts = np.bincount(partition_codes, minlength=len(partition_names))
+    outliers = np.bincount(partition_codes[labels == -1], minlength=len(partition_names))
+    summary = pd.DataFrame({'partition': partition_names, 'rows': counts, 'outliers': outliers})
+    if seconds is not None:
+        summary['seconds'] = seconds
+    return summary
+
+@instrument("run_partitioned_analysis")
+def run_partitioned_analysis(df, n_clusters, partition_by='auto', tile_degrees=PARTITION_TILE_DEGREES,
+                             min_partition_rows=MIN_PARTITION_ROWS, n_jobs=PARTITION_JOBS,
+                             use_cache=True, scaler=None, dtype=None):
+    """
+    Runs the enhanced analysis per partition in parallel, then merges the results.
+
+    Rows are split by region or spatial tile (see `_partition_codes`). Every partition
+    gets its own Isolation Forest + K-Means on the same global scaling and PCA, in a
+    pool of `n_jobs` worker processes, largest partitions first. The partitions' clusters
+    are then merged into `n_clusters` global clusters, so the result has the same shape
+    as run_enhanced_analysis and every chart works unchanged. Outlier flags come from
+    each partition's own Isolation Forest.
+
+    Extra result keys: 'partitions' (rows, outliers and fit seconds per partition), and
+    the data gains 'partition' and 'partition_cluster' (the cluster within its partition).
+    """
+    N_COMPONENTS = 2
+    CONTAMINATION = 0.1
+
+    min_rows = max(min_partition_rows, 20 * n_clusters)
+    partition_codes, partition_names = _partition_codes(df, partition_by, tile_degrees, min_rows)
+
+    cache_key = None
+    if use_cache:
+        cache_key = analysis_cache_key(df, n_clusters=n_clusters, contamination=CONTAMINATION,
+                                       n_components=N_COMPONENTS, random_state=42,
+                                       feature_dtype=str(np.dtype(dtype or FEATURE_DTYPE)),
+                                       partitions=partition_names, min_partition_rows=min_rows)
+        cached = get_result_cache().get(cache_key)
+        if cached is not None:
+            results = _results_from_cache(df, cached, N_COMPONENTS, get_result_cache().pipeline_path(cache_key), dtype=dtype)
+            results['data'] = _with_columns(results['data'], {
+                'partition': pd.Categorical.from_codes(partition_codes, categories=partition_names),
+                'partition_cluster': cached['partition_labels'].astype(int)
+            })
+            results['partitions'] = _partition_summary(partition_codes, partition_names, results['data']['cluster'].to_numpy())
+            return results
+
+    X_processed, derived, scaler, pca = prepare_data_for_clustering(
+        df, n_components=N_COMPONENTS, return_transformers=True, scaler=scaler, dtype=dtype
+    )
+
+    # Rows of each partition, largest first so the long fits start before the short ones
+    order = np.argsort(partition_codes, kind='stable')
+    bounds = np.searchsorted(partition_codes[order], np.arange(len(partition_names) + 1))
+    members = [order[bounds[p]:bounds[p + 1]] for p in range(len(partition_names))]
+    schedule = sorted(range(len(members)), key=lambda p: -len(members[p]))
+
+    try:
+        with Parallel(n_jobs=min(effective_n_jobs(n_jobs), len(schedule))) as parallel:
+            fits = parallel(
+                delayed(_fit_partition)(X_processed[members[p]], n_clusters, CONTAMINATION, 42)
+                for p in schedule
+            )
+    except ValueError as e:
+        return {'error': str(e)}
+
+    # Local clusters get one id across all partitions, then map onto the merged clusters
+    partition_labels = np.full(len(df), -1, dtype=int)
+    local_centers, local_sizes, seconds = [], [], np.zeros(len(members))
+    for p, (labels, centers, elapsed) in zip(schedule, fits):
+        offset = len(local_centers)
+        inliers = labels != -1
+        partition_labels[members[p][inliers]] = labels[inliers] + offset
+        local_centers.extend(centers)
+        local_sizes.extend(np.bincount(labels[inliers], minlength=len(centers)))
+        seconds[p] = elapsed
+    mapping, cluster_centers = _merge_partition_clusters(np.asarray(local_centers), np.asarray(local_sizes),
+                                                         n_clusters, 42)
+    labels = np.where(partition_labels >= 0, mapping[np.maximum(partition_labels, 0)], -1)
+
+    inlier_mask = labels != -1
+    if inlier_mask.sum() < 2:
+        return {'error': "Not enough data points remained after outlier removal to calculate performance metrics."}
+
+    if 'cluster' in df.columns:
+        df = df.drop(columns=['cluster'])
+    derived['cluster'] = labels
+    derived['partition'] = pd.Categorical.from_codes(partition_codes, categories=partition_names)
+    derived['partition_cluster'] = partition_labels
+    df_with_features = _with_columns(df, derived)
+
+    if cache_key is not None:
+        get_result_cache().put(
+            cache_key,
+            labels=labels.astype(np.int16),
+            partition_labels=partition_labels.astype(np.int32),
+            cluster_centers=cluster_centers,
+            X_processed=X_processed.astype(np.float32)
+        )
+
+    return {
+        'data': df_with_features,
+        'pca_components': N_COMPONENTS,
+        'X_processed': X_processed,
+        'inlier_mask': inlier_mask,
+        # Each partition has its own models, so there is no single pipeline to score new records
+        'pipeline': None,
+        'cluster_centers': cluster_centers,
+        'cube': build_chart_cube(df_with_features),
+        'partitions': _partition_summary(partition_codes, partition_names, labels, seconds)
+    }
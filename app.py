@@ -1,14 +1,18 @@
 # app.py
+import os
+import time
+
 import streamlit as st
 import streamlit_authenticator as stauth
-import yaml
-from yaml.loader import SafeLoader
-import base64
 
-# --- Function to encode image ---
-def get_base64_image(image_path):
-    with open(image_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode()
+from static_cache import get_base64_image, load_auth_config
+from instrumentation import record_duration
+
+# --- Latency Budget ---
+# Every complete run of this page is recorded as the "page.landing" stage (see the
+# metrics file); runs slower than this are logged as over budget.
+LANDING_PAGE_BUDGET_SECONDS = float(os.environ.get("LANDING_PAGE_BUDGET_SECONDS", 0.5))
+page_started = time.time()
 
 # --- App Configuration ---
 st.set_page_config(
@@ -110,8 +114,7 @@ st.markdown(
 )
 
 # --- USER AUTHENTICATION ---
-with open('config.yaml') as file:
-    config = yaml.load(file, Loader=SafeLoader)
+config = load_auth_config('config.yaml')
 
 authenticator = stauth.Authenticate(
     config['credentials'],
@@ -123,7 +126,9 @@ authenticator = stauth.Authenticate(
 # --- SESSION STATE ---
 default_session_state = {
     "step": "upload", "data": None, "detected_cols": {}, "prepared_data": None,
-    "analysis_results": None, "optimal_k": 4, "inertias": None
+    "analysis_results": None, "optimal_k": 4, "inertias": None, "dataset_hash": None,
+    "elbow_report": None, "prepare_job_id": None, "analysis_job_id": None,
+    "upload_sha": None, "upload_name": None, "upload_file_id": None
 }
 for key, value in default_session_state.items():
     if key not in st.session_state:
@@ -131,9 +136,9 @@ for key, value in default_session_state.items():
 
 authentication_status = st.session_state.get('authentication_status')
 
-# --- Encode background images ---
+# --- Encode background images (cached once per process) ---
 bg_image = get_base64_image("assets/blb.jpg")
-login_bg_image = get_base64_image("assets/blb.jpg")
+login_bg_image = bg_image
 
 # --- PAGE LAYOUT (Two Columns) ---
 col1, col2 = st.columns([1.5, 1], gap="large")
@@ -323,4 +328,6 @@ with col2:
 st.markdown(
     '<div class="footer">All Rights Reserved 2025</div>', 
     unsafe_allow_html=True
-)
\ No newline at end of file
+)
+
+record_duration("page.landing", page_started, LANDING_PAGE_BUDGET_SECONDS)
\ No newline at end of file
@@ -0,0 +1,302 @@
+"""
+Benchmark harness for the TalaSuri pipeline:
+ingestion -> geocoding -> feature preparation -> k selection -> clustering -> chart aggregation.
+
+Runs fully offline: datasets are synthetic Philippine news reports and geocoding goes
+through a deterministic stub geocoder with a throwaway geocode cache. Each dataset size
+runs in a fresh process so peak RSS is measured per size.
+
+Usage:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --sizes 1000,10000,100000,1000000,10000000
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/<earlier>.json
+    python benchmarks/bench_pipeline.py --partition-jobs 1,2,4   # partitioned analysis scaling
+
+Results are written as JSON to benchmarks/results/ (one file per run). With --compare,
+stages that got slower than --tolerance are listed and the exit code is 1.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import platform
+import datetime
+import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from instrumentation import rss_mb, peak_rss_mb
+
+RESULTS_DIRECTORY = os.path.join(REPO_ROOT, "benchmarks", "results")
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+# --- Synthetic Data Vocabulary ---
+CITIES = [
+    "Manila", "Quezon City", "Caloocan", "Davao City", "Cebu City", "Zamboanga City", "Taguig",
+    "Antipolo", "Pasig", "Cagayan de Oro", "Paranaque", "Dasmarinas", "Valenzuela", "Bacoor",
+    "General Santos", "Las Pinas", "Makati", "San Jose del Monte", "Bacolod", "Muntinlupa",
+    "Calamba", "Marikina", "Iloilo City", "Pasay", "Angeles", "Mandaluyong", "Baguio",
+    "Tacloban", "Legazpi", "Puerto Princesa", "Butuan", "Iligan", "Cotabato City", "Naga",
+    "Lucena", "Batangas City", "Olongapo", "Tarlac City", "Dagupan", "Laoag", "Tuguegarao",
+]
+REGIONS = ["NCR", "Region III", "Region IV-A", "Region VII", "Region XI", "Region X", "CAR", "Region VIII"]
+SOURCES = ["GMA News", "ABS-CBN", "Rappler", "Inquirer", "Philstar", "Manila Bulletin", "Unknown Page", "Viral Blog"]
+LABELS = ["Credible", "Not Credible", "Fake", "Real"]
+
+# Bounding box of the Philippines used by the stub geocoder
+PH_LAT = (5.0, 19.0)
+PH_LON = (117.0, 126.5)
+
+
+class StubGeocoder:
+    """
+    Deterministic offline geocoder: hashes the location into the Philippine bounding box.
+    Names containing "unknown" are reported as not found.
+    """
+    name = "stub"
+
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+
+    def geocode(self, location):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if "unknown" in str(location).lower():
+            return None
+        digest = hashlib.md5(str(location).encode()).digest()
+        u = int.from_bytes(digest[:4], "little") / 2 ** 32
+        v = int.from_bytes(digest[4:8], "little") / 2 ** 32
+        return (PH_LAT[0] + u * (PH_LAT[1] - PH_LAT[0]), PH_LON[0] + v * (PH_LON[1] - PH_LON[0]))
+
+
+def write_synthetic_csv(path, n_rows, seed=42, chunk_rows=500_000):
+    """
+    Writes a synthetic news export with the column names the app auto-detects,
+    plus a free-text column that the ingestion step should skip.
+    """
+    rng = np.random.default_rng(seed)
+    n_locations = max(len(CITIES), min(20_000, n_rows // 20))
+    barangays = np.array([f"Barangay {i}, {CITIES[i % len(CITIES)]}" for i in range(n_locations - len(CITIES))] + CITIES)
+    start = np.datetime64("2015-01-01T00:00")
+    span_minutes = int((np.datetime64("2024-12-31T23:59") - start) / np.timedelta64(1, "m"))
+
+    with open(path, "w", encoding="utf-8") as f:
+        for offset in range(0, n_rows, chunk_rows):
+            n = min(chunk_rows, n_rows - offset)
+            minutes = rng.integers(0, span_minutes, n)
+            stamps = pd.to_datetime(start + minutes.astype("timedelta64[m]"))
+            chunk = pd.DataFrame({
+                "Location": barangays[rng.integers(0, len(barangays), n)],
+                "Date Published": stamps.strftime("%d/%m/%Y %H:%M"),
+                "Region": np.array(REGIONS)[rng.integers(0, len(REGIONS), n)],
+                "Label": np.array(LABELS)[rng.integers(0, len(LABELS), n)],
+                "Brand": np.array(SOURCES)[rng.integers(0, len(SOURCES), n)],
+                "Headline": "Lorem ipsum dolor sit amet consectetur",
+            })
+            chunk.to_csv(f, header=(offset == 0), index=False)
+
+
+class StageTimer:
+    """Collects wall time, rows in/out, throughput and memory for each pipeline stage."""
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, func, rows_in, *args, **kwargs):
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        error = None
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:  # Recorded, so one failing stage does not hide the others
+            result, error = None, f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        rows_out = len(result) if hasattr(result, "__len__") and not isinstance(result, (tuple, dict)) else None
+        self.stages.append({
+            "stage": name,
+            "seconds": round(seconds, 4),
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "rows_per_second": round(rows_in / seconds, 1) if seconds > 0 and rows_in else None,
+            "rss_delta_mb": round(rss_mb() - rss_before, 1) if rss_before is not None else None,
+            "peak_rss_mb": round(peak_rss_mb() or 0, 1),
+            "error": error,
+        })
+        return result
+
+
+def _quiet_streamlit():
+    """Silences the 'missing ScriptRunContext' noise of calling Streamlit code in bare mode."""
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+
+
+def benchmark_size(n_rows, work_dir, geocoder_latency=0.0, include_render=True, partition_jobs=()):
+    """
+    Runs the whole pipeline once on a synthetic dataset of `n_rows` rows, plus the
+    partitioned analysis once per worker count in `partition_jobs`.
+    Meant to be called in a fresh process.
+    """
+    import data_processing
+    import analysis
+    from geocode_cache import GeocodeCache
+    _quiet_streamlit()
+
+    csv_path = os.path.join(work_dir, f"synthetic_{n_rows}.csv")
+    gen_start = time.perf_counter()
+    write_synthetic_csv(csv_path, n_rows)
+    generate_seconds = time.perf_counter() - gen_start
+
+    # Route geocoding through the stub and a throwaway cache
+    data_processing.get_geocoder = lambda: StubGeocoder(geocoder_latency)
+    cache = GeocodeCache(os.path.join(work_dir, f"geocode_{n_rows}.sqlite"))
+    data_processing.get_geocode_cache = lambda: cache
+
+    timer = StageTimer()
+
+    # As on the upload page: names and a bounded sample of values are scored together
+    sample = timer.run("read_csv_sample", data_processing.read_csv_sample,
+                       min(n_rows, data_processing.DETECTION_SAMPLE_ROWS), csv_path)
+    detected = timer.run("auto_detect_columns", data_processing.auto_detect_columns, len(sample),
+                         sample.columns, sample=sample, geocode_cache=cache)
+    usecols = [col for col in detected.values() if col]
+    category_cols = [detected[key] for key in ("location", "source", "label", "region") if detected[key]]
+
+    raw = timer.run("load_and_clean_data", data_processing.load_and_clean_data, n_rows,
+                    csv_path, usecols=usecols, category_cols=category_cols)
+
+    prepared = timer.run("geocode_dataframe", data_processing.geocode_dataframe, len(raw), raw,
+                         detected["location"], detected["timestamp"], detected["source"], detected["label"], detected["region"])
+
+    if prepared is not None and len(prepared):
+        features = timer.run("prepare_data_for_clustering", analysis.prepare_data_for_clustering, len(prepared), prepared)
+        if features is not None:
+            timer.run("select_k", analysis.select_k, len(prepared), features[0], strata=analysis.build_strata(prepared))
+        # Without the result cache, or repeat runs and --compare would time cache hits
+        results = timer.run("run_enhanced_analysis", analysis.run_enhanced_analysis, len(prepared),
+                            prepared, 4, use_cache=False)
+        for n_jobs in partition_jobs:
+            timer.run(f"run_partitioned_analysis[{n_jobs} jobs]", analysis.run_partitioned_analysis, len(prepared),
+                      prepared, 4, use_cache=False, n_jobs=n_jobs)
+        if include_render and isinstance(results, dict) and "error" not in results:
+            _benchmark_render(timer, results)
+
+    return {
+        "rows": n_rows,
+        "csv_mb": round(os.path.getsize(csv_path) / 1024 ** 2, 1),
+        "generate_seconds": round(generate_seconds, 3),
+        "total_seconds": round(sum(stage["seconds"] for stage in timer.stages), 4),
+        "peak_rss_mb": round(peak_rss_mb() or 0, 1),
+        "stages": timer.stages,
+    }
+
+
+def _benchmark_render(timer, results):
+    """Times the chart-building functions of ui_components (Streamlit calls are no-ops in bare mode)."""
+    import ui_components
+    n = len(results["data"])
+    for name in ("display_source_credibility", "display_bubble_map", "display_temporal_heatmap"):
+        timer.run(f"ui.{name}", getattr(ui_components, name), n, results)
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import sklearn
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "scikit_learn": sklearn.__version__,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Returns a list of (rows, stage, old_seconds, new_seconds) for stages that got slower
+    than `tolerance` (a fraction, 0.2 = 20%). Stages under 50 ms are ignored as noise.
+    """
+    old = {(size["rows"], stage["stage"]): stage["seconds"]
+           for size in baseline["results"] for stage in size.get("stages", [])}
+    regressions = []
+    for size in current["results"]:
+        for stage in size.get("stages", []):
+            before = old.get((size["rows"], stage["stage"]))
+            if before is None or max(before, stage["seconds"]) < 0.05:
+                continue
+            if stage["seconds"] > before * (1 + tolerance):
+                regressions.append((size["rows"], stage["stage"], before, stage["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+                        help="Comma-separated dataset sizes in rows.")
+    parser.add_argument("--geocoder-latency", type=float, default=0.0,
+                        help="Seconds the stub geocoder sleeps per lookup, to model a remote service.")
+    parser.add_argument("--no-render", action="store_true", help="Skip the ui_components stages.")
+    parser.add_argument("--partition-jobs", default="",
+                        help="Comma-separated worker counts to time the partitioned analysis with (e.g. 1,2,4).")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--compare", help="Earlier results file to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown per stage (0.2 = 20%%).")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    partition_jobs = [int(jobs) for jobs in args.partition_jobs.split(",") if jobs.strip()]
+    work_dir = tempfile.mkdtemp(prefix="talasuri_bench_")
+    report = {"environment": _environment(), "results": []}
+
+    try:
+        for n_rows in sizes:
+            # A fresh process per size keeps peak RSS figures independent
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(benchmark_size, n_rows, work_dir, args.geocoder_latency, not args.no_render,
+                                     partition_jobs).result()
+            report["results"].append(result)
+            print(f"{n_rows:>10,} rows  {result['total_seconds']:>9.2f} s  peak {result['peak_rss_mb']:>8.1f} MB")
+            for stage in result["stages"]:
+                flag = f"  !! {stage['error']}" if stage["error"] else ""
+                rate = f"{stage['rows_per_second']:>14,.0f} rows/s" if stage["rows_per_second"] else " " * 21
+                print(f"    {stage['stage']:<34} {stage['seconds']:>9.3f} s {rate}{flag}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for rows, stage, before, after in regressions:
+            print(f"REGRESSION {rows:,} rows {stage}: {before:.3f} s -> {after:.3f} s")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Startup and rerun latency check for the landing page and the Analytics page redirect.
+
+Each scenario runs in a fresh interpreter through Streamlit's AppTest, inside a scratch
+copy of the app with a throwaway config.yaml, so nothing in the repository is touched:
+  - landing:  first (cold) run of app.py, then --reruns warm reruns
+  - redirect: a logged-out visit to the Analytics page, and which heavy modules it imported
+(AppTest cannot follow st.switch_page, so the redirect itself logs a page-not-found error.)
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --cold-budget 3 --rerun-budget 0.2
+
+The exit code is 1 when a budget is exceeded or the redirect imported a heavy module.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import statistics
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Modules the login redirect should never need
+HEAVY_MODULES = ["sklearn", "kneed", "plotly", "altair", "geopy"]
+
+
+def _prepare_app_directory(work_dir):
+    """A scratch copy of the app: the page scripts, linked assets and a throwaway config."""
+    import yaml
+    import streamlit_authenticator as stauth
+
+    shutil.copy(os.path.join(REPO_ROOT, "app.py"), work_dir)
+    shutil.copytree(os.path.join(REPO_ROOT, "pages"), os.path.join(work_dir, "pages"))
+    os.symlink(os.path.join(REPO_ROOT, "assets"), os.path.join(work_dir, "assets"))
+    config = {
+        "credentials": {"usernames": {"bench": {
+            "email": "bench@example.com", "first_name": "Bench", "last_name": "User",
+            "name": "Bench User", "password": stauth.Hasher.hash("bench")
+        }}},
+        "cookie": {"name": "talasuri_bench", "key": "bench-cookie-key-" + "x" * 16, "expiry_days": 1}
+    }
+    with open(os.path.join(work_dir, "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f)
+
+
+def run_scenario(scenario, work_dir, reruns):
+    """Runs one scenario in this (fresh) process and returns its timings."""
+    os.chdir(work_dir)
+    os.environ["METRICS_FILE"] = ""
+    from streamlit.testing.v1 import AppTest
+    # Some Streamlit versions import plotly themselves; only count what the page adds
+    preloaded = {name for name in HEAVY_MODULES if name in sys.modules}
+
+    script = os.path.join(work_dir, "app.py" if scenario == "landing" else os.path.join("pages", "2_Analytics_Tool.py"))
+    started = time.perf_counter()
+    app = AppTest.from_file(script, default_timeout=120)
+    app.run()
+    cold = time.perf_counter() - started
+    errors = [str(e.message) for e in app.exception] if scenario == "landing" else []
+
+    warm = []
+    for _ in range(reruns if scenario == "landing" else 0):
+        started = time.perf_counter()
+        app.run()
+        warm.append(time.perf_counter() - started)
+
+    return {
+        "scenario": scenario,
+        "cold_seconds": round(cold, 4),
+        "rerun_median_seconds": round(statistics.median(warm), 4) if warm else None,
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules and name not in preloaded],
+        "errors": errors
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=10, help="Warm reruns of the landing page.")
+    parser.add_argument("--cold-budget", type=float, default=3.0, help="Seconds allowed for a cold landing page run.")
+    parser.add_argument("--rerun-budget", type=float, default=float(os.environ.get("LANDING_PAGE_BUDGET_SECONDS", 0.5)),
+                        help="Seconds allowed for the median warm rerun.")
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="talasuri_startup_")
+    try:
+        _prepare_app_directory(work_dir)
+        results = []
+        for scenario in ("landing", "redirect"):
+            # A fresh interpreter per scenario, so the first run really is cold
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results.append(pool.submit(run_scenario, scenario, work_dir, args.reruns).result())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    failures = []
+    landing, redirect = results
+    print(f"landing   cold {landing['cold_seconds']:.3f} s (budget {args.cold_budget:.3f} s)  "
+          f"rerun median {landing['rerun_median_seconds']:.3f} s (budget {args.rerun_budget:.3f} s)")
+    print(f"redirect  {redirect['cold_seconds']:.3f} s  heavy modules imported: {', '.join(redirect['heavy_modules']) or 'none'}")
+    if landing["errors"]:
+        failures.append(f"landing page raised: {landing['errors']}")
+    if landing["cold_seconds"] > args.cold_budget:
+        failures.append("cold landing page run over budget")
+    if landing["rerun_median_seconds"] > args.rerun_budget:
+        failures.append("landing page rerun over budget")
+    if redirect["heavy_modules"]:
+        failures.append("logged-out Analytics page imported " + ", ".join(redirect["heavy_modules"]))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"results": results, "failures": failures}, f, indent=2)
+
+    for failure in failures:
+        print(f"OVER BUDGET {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,81 +1,382 @@
+import os
+import threading
+from contextlib import contextmanager
+
 import streamlit as st
 import pandas as pd
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
+import numpy as np
+from pandas.api.types import union_categoricals
+
+from geocode_cache import GeocodeCache, normalize_location
+from geocoders import build_default_geocoder, geocode_locations
+from timestamps import parse_timestamps
+from instrumentation import instrument, peak_rss_mb
+
+# --- Ingestion Settings ---
+# Files larger than this are streamed in chunks instead of parsed in one go.
+STREAMING_THRESHOLD_BYTES = 50 * 1024 * 1024
+CHUNK_ROWS = 200_000
 
-def load_and_clean_data(uploaded_file):
+# --- User Messages ---
+# Status messages go to the page through _notify. Background jobs run where st.* calls
+# do nothing, so while collect_messages is active they are also collected, to be
+# handed back with the job's result and shown on the page.
+_message_sink = threading.local()
+
+
+@contextmanager
+def collect_messages():
+    """Collects the messages shown in this thread as (level, text) pairs into the yielded list."""
+    messages = []
+    previous = getattr(_message_sink, 'messages', None)
+    _message_sink.messages = messages
+    try:
+        yield messages
+    finally:
+        _message_sink.messages = previous
+
+
+def _notify(level, text):
+    """Shows a message with st.<level> ('info', 'success', 'warning' or 'error') and collects it."""
+    getattr(st, level)(text)
+    messages = getattr(_message_sink, 'messages', None)
+    if messages is not None:
+        messages.append((level, text))
+
+# --- Credibility Rules ---
+# Checked in order against each distinct label (lower-cased); the first pattern that
+# matches decides the category. Labels matching nothing are 'Uncategorized'.
+CREDIBILITY_RULES = [
+    ('Not Credible', r'not|fake|false'),
+    ('Credible', r'credible|real|true'),
+]
+CREDIBILITY_DEFAULT = 'Uncategorized'
+CREDIBILITY_CATEGORIES = ['Credible', 'Not Credible', 'Uncategorized']
+
+def read_csv_columns(uploaded_file):
+    """
+    Reads only the header row of a CSV and returns its column names.
+    """
+    columns = pd.read_csv(uploaded_file, nrows=0).columns
+    if hasattr(uploaded_file, 'seek'):
+        uploaded_file.seek(0)
+    return [col for col in columns if not str(col).startswith('Unnamed')]
+
+def _concat_chunks(chunks, category_cols):
+    """
+    Concatenates chunk frames, merging per-chunk categoricals without
+    falling back to object dtype.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    merged = {}
+    for col in chunks[0].columns:
+        if col in category_cols:
+            merged[col] = pd.Series(union_categoricals([chunk[col] for chunk in chunks]), name=col)
+        else:
+            merged[col] = pd.concat([chunk[col] for chunk in chunks], ignore_index=True)
+    return pd.DataFrame(merged)
+
+@instrument("load_and_clean_data")
+def load_and_clean_data(uploaded_file, usecols=None, category_cols=None, chunksize=None):
     """
     Loads data from an uploaded CSV and removes empty 'Unnamed' columns.
+
+    Parameters:
+    - usecols (list): Only these columns are read. Reads everything when None.
+    - category_cols (list): Columns stored as pandas categoricals (e.g. source, label, location).
+    - chunksize (int): Rows per chunk. When None, files on disk above
+      STREAMING_THRESHOLD_BYTES are streamed in CHUNK_ROWS chunks automatically.
     """
     try:
-        # Allow loading from a path (string) or an uploaded file object
-        df = pd.read_csv(uploaded_file)
-        df = df.loc[:, ~df.columns.str.startswith('Unnamed')]
-       
+        category_cols = [col for col in (category_cols or []) if usecols is None or col in usecols]
+        dtype = {col: 'category' for col in category_cols} or None
+
+        file_size = os.path.getsize(uploaded_file) if isinstance(uploaded_file, str) else None
+        if chunksize is None and file_size and file_size > STREAMING_THRESHOLD_BYTES:
+            chunksize = CHUNK_ROWS
+
+        if not chunksize:
+            # Allow loading from a path (string) or an uploaded file object
+            df = pd.read_csv(uploaded_file, usecols=usecols, dtype=dtype)
+            df = df.loc[:, ~df.columns.str.startswith('Unnamed')]
+            return df
+
+        # --- Streaming mode: parse in chunks so only the compact result stays resident ---
+        progress_bar = st.progress(0, text="Reading file...")
+        chunks = []
+        rows_read = 0
+        handle = open(uploaded_file, 'rb') if isinstance(uploaded_file, str) else uploaded_file
+        try:
+            reader = pd.read_csv(handle, usecols=usecols, dtype=dtype, chunksize=chunksize)
+            for chunk in reader:
+                chunk = chunk.loc[:, ~chunk.columns.str.startswith('Unnamed')]
+                chunks.append(chunk)
+                rows_read += len(chunk)
+                if file_size:
+                    progress_bar.progress(min(handle.tell() / file_size, 1.0), text=f"Reading file... {rows_read:,} rows")
+        finally:
+            if handle is not uploaded_file:
+                handle.close()
+        progress_bar.empty()
+
+        if not chunks:
+            return pd.DataFrame()
+        df = _concat_chunks(chunks, category_cols)
+
+        resident_mb = df.memory_usage(deep=True).sum() / (1024 * 1024)
+        peak_mb = peak_rss_mb()
+        peak_text = f" Peak process memory: {peak_mb:,.0f} MB." if peak_mb is not None else ""
+        _notify('info', f"Loaded {len(df):,} rows in {len(chunks)} chunks. In-memory size: {resident_mb:,.1f} MB.{peak_text}")
         return df
     except Exception as e:
-        st.error(f"Error loading data: {e}")
+        _notify('error', f"Error loading data: {e}")
         return pd.DataFrame()
 
+@instrument("filter_for_fake_news")
 def filter_for_fake_news(df, label_col, filter_text):
     """
     Filters the DataFrame to keep only rows matching the fake news label.
     """
     if label_col not in df.columns:
-        st.warning(f"Label column '{label_col}' not found. Skipping fake news filter.")
+        _notify('warning', f"Label column '{label_col}' not found. Skipping fake news filter.")
         return df
         
     rows_before = len(df)
     df_filtered = df[df[label_col].astype(str).str.contains(filter_text, case=False, na=False)].copy()
     rows_after = len(df_filtered)
     
-    st.info(f"Filtered for rows where '{label_col}' contains '{filter_text}'. Kept {rows_after} out of {rows_before} rows.")
+    _notify('info', f"Filtered for rows where '{label_col}' contains '{filter_text}'. Kept {rows_after} out of {rows_before} rows.")
 
     if rows_after == 0:
-        st.error("No data remained after filtering. Please check your label column and the text you provided.")
+        _notify('error', "No data remained after filtering. Please check your label column and the text you provided.")
         return None
         
     return df_filtered
 
-def auto_detect_columns(columns):
+# --- Column Detection ---
+# Every column is scored for every role from its name and, when a data sample is given,
+# from a profile of its values. Keywords are listed from most to least likely.
+COLUMN_KEYWORDS = {
+    'location': ['location', 'loc', 'city', 'address', 'area'],
+    'timestamp': ['timestamp', 'time', 'date'],
+    'region': ['region', 'province'],
+    'label': ['label', 'credible', 'credibility', 'type'],
+    'source': ['brand', 'source', 'publisher', 'news_source']
+}
+DETECTION_SAMPLE_ROWS = 1000
+DETECTION_MAX_DISTINCT = 200  # Most frequent distinct values profiled per column
+MIN_DETECTION_CONFIDENCE = 0.3
+
+def read_csv_sample(uploaded_file, nrows=DETECTION_SAMPLE_ROWS):
+    """
+    Reads only the first `nrows` rows of a CSV, as text, for column detection.
+    """
+    sample = pd.read_csv(uploaded_file, nrows=nrows, dtype=str)
+    if hasattr(uploaded_file, 'seek'):
+        uploaded_file.seek(0)
+    return sample.loc[:, ~sample.columns.str.startswith('Unnamed')]
+
+def _name_scores(columns):
+    """
+    Keyword scores of all column names at once: a roles x columns DataFrame in [0, 1].
+    Earlier keywords score higher; an exact name match scores 1.
     """
-    Scans column names and automatically detects the most likely candidates
-    for location, timestamp, region, label, and source.
+    names = pd.Index([str(col) for col in columns]).str.lower()
+    scores = pd.DataFrame(0.0, index=list(COLUMN_KEYWORDS), columns=list(columns))
+    for role, keywords in COLUMN_KEYWORDS.items():
+        role_scores = np.zeros(len(names))
+        for rank, keyword in enumerate(keywords):
+            weight = 1.0 - 0.1 * rank
+            role_scores = np.maximum(role_scores, np.where(names == keyword, 1.0, 0.0))
+            role_scores = np.maximum(role_scores, np.where(names.str.contains(keyword, regex=False), 0.8 * weight, 0.0))
+        scores.loc[role] = role_scores
+    return scores
+
+def _content_profile(values, geocode_cache=None):
     """
-    detected_cols = {
-        'location': None,
-        'timestamp': None,
-        'region': None,
-        'label': None,
-        'source': None  # NEW
+    Profile of one sampled column: datetime parse rate, share of values known to the
+    geocode cache, share of values that look like credibility labels, and cardinality.
+    """
+    values = values.dropna().astype(str).str.strip()
+    values = values[values != '']
+    if values.empty:
+        return {'datetime': 0.0, 'geocoded': 0.0, 'label_vocabulary': 0.0, 'cardinality': 0.0,
+                'distinct': 0, 'numeric': 0.0}
+
+    # Profile the most frequent distinct values, weighted by how often each occurs
+    all_counts = values.value_counts()
+    counts = all_counts.head(DETECTION_MAX_DISTINCT)
+    uniques = counts.index.to_series()
+    weights = counts.to_numpy() / counts.sum()
+
+    numeric = pd.to_numeric(uniques, errors='coerce').notna().to_numpy()
+    # Plain numbers (ids, counts, years) are not timestamps, so only the rest is parsed
+    parsed = np.zeros(len(uniques), dtype=bool)
+    if not numeric.all():
+        parsed[~numeric] = pd.to_datetime(uniques[~numeric], errors='coerce', format='mixed', dayfirst=True).notna().to_numpy()
+    datetime_rate = float(weights[parsed].sum())
+
+    geocoded = 0.0
+    if geocode_cache is not None:
+        keys = [normalize_location(value) for value in uniques]
+        known = geocode_cache.get_many(keys)
+        hits = np.array([known.get(key, (None, None))[0] is not None for key in keys])
+        geocoded = float(weights[hits].sum())
+
+    # Uninstrumented, so profiling a wide upload is not one metrics record per column
+    labelled = (_classify_credibility(uniques.reset_index(drop=True)) != CREDIBILITY_DEFAULT).to_numpy()
+
+    return {
+        'datetime': datetime_rate,
+        'geocoded': geocoded,
+        'label_vocabulary': float(weights[labelled].sum()),
+        'cardinality': len(all_counts) / len(values),
+        'distinct': len(all_counts),
+        'numeric': float(weights[numeric].sum())
     }
-    
-    # Define keywords for each type of column, from most to least likely
-    col_keywords = {
-        'location': ['location', 'loc', 'city', 'address', 'area'],
-        'timestamp': ['timestamp', 'time', 'date'],
-        'region': ['region', 'province'],
-        'label': ['label', 'credible', 'credibility', 'type'],
-        'source': ['brand', 'source', 'publisher', 'news_source'] # UPDATED to check for 'brand' first
+
+def _content_scores(profile):
+    """
+    Role scores in [0, 1] from a column's content profile, and a plausibility factor
+    per role that discounts names the contents contradict (e.g. a numeric 'area_code'
+    column is not a location).
+    """
+    text = 1.0 - max(profile['numeric'], profile['datetime'])
+    varied = 1.0 if profile['distinct'] > 1 else 0.2
+    few_values = 1.0 if 1 < profile['distinct'] <= 10 else 0.0
+    some_values = 1.0 if 1 < profile['distinct'] and profile['cardinality'] <= 0.5 else 0.0
+    scores = {
+        'timestamp': profile['datetime'] * varied,
+        'location': max(profile['geocoded'], 0.5 * text * some_values),
+        'region': profile['geocoded'] * few_values,
+        'label': profile['label_vocabulary'] * few_values,
+        'source': 0.6 * text * some_values * (1.0 - profile['label_vocabulary']) * (1.0 - profile['geocoded'])
     }
+    text_plausible = 0.3 if text < 0.1 else 1.0
+    plausible = {role: text_plausible for role in scores}
+    plausible['timestamp'] = (0.3 if profile['datetime'] < 0.1 else 1.0) * varied
+    return scores, plausible
+
+def rank_column_candidates(columns, sample=None, geocode_cache=None, top_n=3):
+    """
+    Scores every column for every role (location, timestamp, region, label, source).
 
-    remaining_columns = list(columns)
-
-    for col_type, keywords in col_keywords.items():
-        for keyword in keywords:
-            # Find the first column that contains the keyword and hasn't been used yet
-            match = next((col for col in remaining_columns if keyword in col.lower()), None)
-            if match:
-                detected_cols[col_type] = match
-                remaining_columns.remove(match) # Ensure a column isn't used twice
-                break # Move to the next column type
-                
+    Parameters:
+    - columns (list): Column names.
+    - sample (DataFrame): Optional bounded sample of rows (see read_csv_sample). Without
+      it only the names are scored.
+    - geocode_cache (GeocodeCache): Optional; values already geocoded mark location columns.
+
+    Returns {role: [(column, confidence), ...]}, best first, at most `top_n` per role.
+    """
+    columns = list(columns)
+    scores = _name_scores(columns)
+    if sample is not None and len(sample):
+        profiles = {col: _content_scores(_content_profile(sample[col], geocode_cache))
+                    for col in columns if col in sample.columns}
+        content = pd.DataFrame({col: profile[0] for col, profile in profiles.items()}).reindex(
+            index=scores.index, columns=scores.columns, fill_value=0.0)
+        plausible = pd.DataFrame({col: profile[1] for col, profile in profiles.items()}).reindex(
+            index=scores.index, columns=scores.columns, fill_value=1.0)
+        # Names and contents count equally; a strong, uncontradicted name alone still passes
+        scores = np.maximum(0.5 * scores + 0.5 * content, 0.6 * scores * plausible)
+
+    ranked = {}
+    for role in scores.index:
+        row = scores.loc[role].sort_values(ascending=False, kind='stable')
+        ranked[role] = [(col, round(float(score), 3)) for col, score in row.head(top_n).items() if score > 0]
+    return ranked
+
+@instrument("auto_detect_columns")
+def auto_detect_columns(columns, sample=None, geocode_cache=None, return_candidates=False):
+    """
+    Detects the most likely columns for location, timestamp, region, label, and source.
+
+    Every (role, column) pair is scored at once (see rank_column_candidates); the best
+    pairs are assigned first and no column is used twice. Pairs scoring below
+    MIN_DETECTION_CONFIDENCE are left undetected (None).
+
+    With `return_candidates=True`, also returns {role: [(column, confidence), ...]}.
+    """
+    columns = list(columns)
+    candidates = rank_column_candidates(columns, sample, geocode_cache, top_n=len(columns))
+
+    pairs = sorted(
+        ((score, role, col) for role, ranked in candidates.items() for col, score in ranked),
+        key=lambda pair: -pair[0]
+    )
+    detected_cols = {role: None for role in COLUMN_KEYWORDS}
+    used = set()
+    for score, role, col in pairs:
+        if score < MIN_DETECTION_CONFIDENCE:
+            break
+        if detected_cols[role] is None and col not in used:
+            detected_cols[role] = col
+            used.add(col)
+
+    if return_candidates:
+        return detected_cols, {role: ranked[:3] for role, ranked in candidates.items()}
     return detected_cols
 
-@st.cache_data
-def geocode_dataframe(df_processed, loc_col, time_col, source_col, label_col, region_col=None):
+@instrument("classify_credibility")
+def classify_credibility(labels, rules=None, default=CREDIBILITY_DEFAULT):
+    """
+    Classifies credibility labels into a categorical Series using a (category, regex) rule table.
+
+    Only the distinct label values are matched; the result is broadcast back to every
+    row through the factorized codes, so the cost depends on the label vocabulary,
+    not the number of rows.
+    """
+    return _classify_credibility(labels, rules, default)
+
+def _classify_credibility(labels, rules=None, default=CREDIBILITY_DEFAULT):
+    """classify_credibility without the instrumentation, for per-column use."""
+    rules = CREDIBILITY_RULES if rules is None else rules
+    categories = list(dict.fromkeys([category for category, _ in rules] + [default]))
+    for category in CREDIBILITY_CATEGORIES:
+        if category not in categories:
+            categories.append(category)
+
+    codes, uniques = pd.factorize(labels)
+    lowered = pd.Series(np.asarray(uniques, dtype=object)).astype(str).str.lower()
+
+    unique_codes = np.full(len(uniques), categories.index(default), dtype=np.int8)
+    assigned = np.zeros(len(uniques), dtype=bool)
+    for category, pattern in rules:
+        matched = lowered.str.contains(pattern, regex=True).to_numpy() & ~assigned
+        unique_codes[matched] = categories.index(category)
+        assigned |= matched
+
+    # Missing labels (code -1) fall into the default category
+    row_codes = np.where(codes >= 0, unique_codes[codes] if len(uniques) else 0, categories.index(default))
+    index = labels.index if hasattr(labels, 'index') else None
+    return pd.Series(pd.Categorical.from_codes(row_codes, categories=categories), index=index, name='credibility')
+
+@st.cache_resource
+def get_geocode_cache():
+    """
+    Returns the process-wide persistent geocode cache shared by all sessions.
+    """
+    return GeocodeCache()
+
+@st.cache_resource
+def get_geocoder():
+    """
+    Returns the process-wide geocoder: the offline gazetteer (if a gazetteer file is
+    present in data/) with Nominatim as a fallback for misses.
+    """
+    return build_default_geocoder()
+
+# Not st.cache_data: this runs in long-lived job workers, where cached frames would pile
+# up. Geocoded places persist in the geocode cache and prepared data as an artifact.
+@instrument("geocode_dataframe")
+def geocode_dataframe(df_processed, loc_col, time_col, source_col, label_col, region_col=None, on_progress=None):
     """
     Takes a DataFrame, keeps only the essential columns, and geocodes the location column.
+
+    `on_progress(done, total)` is called as new locations are looked up, besides the
+    page's progress bar (which background jobs do not have).
     """
     # Step 1: Select only the essential columns the user mapped
     columns_to_keep = [loc_col, time_col, source_col, label_col] # ADDED source and label
@@ -90,48 +391,88 @@ def geocode_dataframe(df_processed, loc_col, time_col, source_col, label_col, re
     rows_after = len(df_clean)
     
     if rows_after < rows_before:
-        st.success(f"Preprocessing: Removed {rows_before - rows_after} empty rows (based on mapped columns).")
+        _notify('success', f"Preprocessing: Removed {rows_before - rows_after} empty rows (based on mapped columns).")
     
     if len(df_clean) == 0:
-        st.error("No valid data remained after cleaning empty rows.")
+        _notify('error', "No valid data remained after cleaning empty rows.")
         return None
 
-    # Step 3: Geocoding
-    st.info("Starting geocoding process... This may take a while for large datasets.")
+    # Step 3: Timestamps, parsed before geocoding so rows that cannot be used are never looked up
+    timestamps, report = parse_timestamps(df_clean[time_col], return_report=True)
+    if report['failed']:
+        _notify('warning', f"{report['failed']} of {report['total']} timestamps ({report['failure_rate']:.1%}) could not be parsed. Those rows were removed.")
+    df_clean['timestamp'] = timestamps
+    df_clean.dropna(subset=['timestamp'], inplace=True)
+
+    if len(df_clean) == 0:
+        _notify('error', "None of the timestamps could be parsed. Please check the date format of your file.")
+        return None
+
+    # Step 4: Geocoding
+    _notify('info', "Starting geocoding process... This may take a while for large datasets.")
     try:
-        geolocator = Nominatim(user_agent="spatiotemporal_analysis_app", timeout=10)
-        geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
-        
-        unique_locations = df_clean[loc_col].unique()
-        location_dict = {}
-        
-        progress_bar = st.progress(0, text="Geocoding locations...")
-        
-        for i, loc in enumerate(unique_locations):
-            location_data = geocode(f"{loc}, Philippines")
-            location_dict[loc] = (location_data.latitude, location_data.longitude) if location_data else (None, None)
-            progress_bar.progress((i + 1) / len(unique_locations), text=f"Geocoding: {loc}")
+        # Factorize once: every later step works on unique locations, then broadcasts back by code
+        location_codes, unique_locations = pd.factorize(df_clean[loc_col])
+        normalized = [normalize_location(loc) for loc in unique_locations]
 
-        progress_bar.empty()
+        # Only places the persistent cache has never seen go to the geocoder
+        geocode_cache = get_geocode_cache()
+        known = geocode_cache.get_many(normalized)
+        to_geocode = {}
+        for loc, key in zip(unique_locations, normalized):
+            if key not in known:
+                to_geocode.setdefault(key, loc)
+
+        if to_geocode:
+            n_keys = len(set(normalized))
+            _notify('info', f"{n_keys - len(to_geocode)} of {n_keys} locations found in the geocode cache. Looking up {len(to_geocode)} new locations...")
+            progress_bar = st.progress(0, text="Geocoding locations...")
+            key_for_location = {loc: key for key, loc in to_geocode.items()}
+            new_results = {}
+
+            def on_result(loc, position):
+                key = key_for_location[loc]
+                new_results[key] = position if position else (None, None)
+                # Persist in small batches so an interrupted run keeps what it already paid for
+                if len(new_results) >= 50:
+                    geocode_cache.put_many(new_results)
+                    new_results.clear()
 
-        df_clean['latitude'] = df_clean[loc_col].map(lambda loc: location_dict.get(loc, (None, None))[0])
-        df_clean['longitude'] = df_clean[loc_col].map(lambda loc: location_dict.get(loc, (None, None))[1])
+            def show_progress(done, total):
+                progress_bar.progress(done / total, text=f"Geocoding: {done} of {total} locations")
+                if on_progress is not None:
+                    on_progress(done, total)
+
+            positions, failed = geocode_locations(
+                get_geocoder(), to_geocode.values(), on_result=on_result, on_progress=show_progress
+            )
+            geocode_cache.put_many(new_results)
+            progress_bar.empty()
+
+            # Transient failures (timeout, service down) stay uncached so they are retried next time
+            if failed:
+                _notify('warning', f"{len(failed)} locations could not be looked up because the geocoding service was unavailable. They will be retried next time.")
+            for key, loc in to_geocode.items():
+                known[key] = positions[loc] if positions.get(loc) else (None, None)
+        else:
+            _notify('info', f"All {len(unique_locations)} locations found in the geocode cache.")
+
+        # One vectorized take maps the unique results back onto every row
+        coords = np.array([known.get(key, (None, None)) for key in normalized], dtype=float).reshape(-1, 2)
+        df_clean['latitude'] = coords[location_codes, 0]
+        df_clean['longitude'] = coords[location_codes, 1]
         
         geocoded_rows_before = len(df_clean)
         df_clean.dropna(subset=['latitude', 'longitude'], inplace=True)
         geocoded_rows_after = len(df_clean)
         
-        st.info(f"Geocoding complete. Successfully mapped {geocoded_rows_after} locations. Dropped {geocoded_rows_before - geocoded_rows_after} unmappable rows.")
+        _notify('info', f"Geocoding complete. Successfully mapped {geocoded_rows_after} locations. Dropped {geocoded_rows_before - geocoded_rows_after} unmappable rows.")
         
         if len(df_clean) == 0:
-            st.error("Geocoding failed for all valid locations. No data remaining.")
+            _notify('error', "Geocoding failed for all valid locations. No data remaining.")
             return None
         
-        # Step 4: Final Preparation
-        # This line CREATES the 'timestamp' column as a datetime object
-        df_clean['timestamp'] = pd.to_datetime(df_clean[time_col], dayfirst=True, errors='coerce')
-        df_clean.dropna(subset=['timestamp'], inplace=True)
-        
+        # Step 5: Final Preparation
         # Rename all columns to standard names for the app
         final_df = df_clean.rename(columns={
             loc_col: 'location',
@@ -150,10 +491,13 @@ def geocode_dataframe(df_processed, loc_col, time_col, source_col, label_col, re
         
         if region_col and region_col in final_df.columns:
             final_df = final_df.rename(columns={region_col: 'region'})
+
+        # Classify credibility once here, so charts never loop over rows
+        final_df['credibility'] = classify_credibility(final_df['label'])
             
-        st.success(f"Final data preparation complete. Ready for analysis. Total records: {len(final_df)}.")
+        _notify('success', f"Final data preparation complete. Ready for analysis. Total records: {len(final_df)}.")
         return final_df
 
     except Exception as e:
-        st.error(f"An error occurred during data preparation: {e}")
+        _notify('error', f"An error occurred during data preparation: {e}")
         return None
\ No newline at end of file
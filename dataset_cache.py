@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+import threading
+import importlib.util
+
+# --- Cache Settings ---
+# Columnar copies of uploads live at the top of the upload directory. Its disk budget
+# is owned by the upload store (upload_store.py), which trims it after every write.
+UPLOAD_DIRECTORY = "user_uploads"
+
+# Bump when geocode_dataframe changes what it produces, so older prepared copies are not reused
+# (2: timezone-aware timestamps).
+PREPARED_ARTIFACT_VERSION = 2
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def parquet_available():
+    """Parquet support needs pyarrow; without it the cache is silently skipped."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def file_sha256(path):
+    """
+    Hashes a file in fixed-size blocks, so large uploads are never read into memory at once.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _params_key(**params):
+    """Short, stable hash of the parameters an artifact was built with."""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:12]
+
+
+def raw_artifact_path(dataset_hash, usecols=None, category_cols=None, directory=UPLOAD_DIRECTORY):
+    key = _params_key(usecols=usecols, category_cols=category_cols)
+    return os.path.join(directory, f"{dataset_hash}.{key}.raw.parquet")
+
+
+def prepared_artifact_path(dataset_hash, column_mapping, directory=UPLOAD_DIRECTORY):
+    key = _params_key(version=PREPARED_ARTIFACT_VERSION, **column_mapping)
+    return os.path.join(directory, f"{dataset_hash}.{key}.prepared.parquet")
+
+
+def read_artifact(path):
+    """
+    Memory-maps a cached Parquet artifact. Returns None if it does not exist.
+    """
+    if not parquet_available() or not os.path.exists(path):
+        return None
+    # Imported here, so pages importing this module for its paths do not load pandas
+    import pandas as pd
+    df = pd.read_parquet(path, memory_map=True)
+    os.utime(path)  # Mark as recently used for eviction
+    return df
+
+
+def write_artifact(df, path, directory=UPLOAD_DIRECTORY):
+    """
+    Writes a DataFrame as Parquet (atomically) and has the upload store of `directory`
+    trim it back within its quota. Returns True if the artifact was written.
+    """
+    from upload_store import get_upload_store
+
+    if not parquet_available() or df is None:
+        return False
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Unique per writer, so sessions preparing the same dataset never share a temp file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    get_upload_store(directory).enforce_quotas(keep_paths=[path])
+    return True
+
+
+def evict_directory(directory, max_bytes, keep=()):
+    """
+    Deletes the least recently used files in `directory` until its total size is
+    at most `max_bytes`. Files listed in `keep` are never removed.
+    Returns the number of bytes freed.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    keep = {os.path.abspath(path) for path in keep}
+
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total - freed <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+            freed += size
+        except OSError:
+            pass  # Another session may have removed or be using it
+    return freed
@@ -1,8 +1,11 @@
 from sklearn.base import BaseEstimator, ClusterMixin
 from sklearn.cluster import KMeans
 from sklearn.ensemble import IsolationForest
+from sklearn.exceptions import NotFittedError
 import numpy as np
 
+from instrumentation import stage
+
 class EnhancedKMeans(BaseEstimator, ClusterMixin):
     """
     A custom K-Means clustering algorithm that integrates Isolation Forest for outlier removal.
@@ -47,7 +50,8 @@ class EnhancedKMeans(BaseEstimator, ClusterMixin):
         Fits the model to the data. This involves running Isolation Forest and then K-Means.
         """
         # Step 1: Use Isolation Forest to detect outliers
-        outlier_preds = self.iso_forest.fit_predict(X)
+        with stage("isolation_forest", rows_in=len(X)):
+            outlier_preds = self.iso_forest.fit_predict(X)
         
         # Identify the indices of the normal data points (inliers)
         inlier_mask = outlier_preds == 1
@@ -58,7 +62,8 @@ class EnhancedKMeans(BaseEstimator, ClusterMixin):
             raise ValueError(f"Not enough data points ({len(X_cleaned)}) remained after outlier removal to form {self.n_clusters} clusters. Try a lower outlier percentage.")
 
         # Step 2: Fit the K-Means algorithm ONLY on the cleaned data
-        self.kmeans.fit(X_cleaned)
+        with stage("kmeans", rows_in=len(X_cleaned)):
+            self.kmeans.fit(X_cleaned)
 
         # Store the results from the fitted K-Means model
         self.cluster_centers_ = self.kmeans.cluster_centers_
@@ -81,3 +86,188 @@ class EnhancedKMeans(BaseEstimator, ClusterMixin):
         """
         self.fit(X)
         return self.labels_
+
+    def _check_fitted(self):
+        if self.cluster_centers_ is None:
+            raise NotFittedError("This EnhancedKMeans instance is not fitted yet. Call 'fit' first.")
+
+    def predict(self, X):
+        """
+        Assigns new points to clusters. Points the fitted Isolation Forest flags as
+        outliers get the label -1; the rest get their nearest K-Means centroid.
+        """
+        self._check_fitted()
+        X = np.asarray(X)
+        labels = np.full(X.shape[0], -1, dtype=int)
+        if X.shape[0] == 0:
+            return labels
+
+        inlier_mask = self.iso_forest.predict(X) == 1
+        if inlier_mask.any():
+            labels[inlier_mask] = self.kmeans.predict(X[inlier_mask])
+        return labels
+
+    def score_samples(self, X):
+        """
+        Returns the Isolation Forest anomaly score of each point (the lower, the more
+        abnormal). Points scoring below `iso_forest.offset_` are treated as outliers.
+        """
+        self._check_fitted()
+        return self.iso_forest.score_samples(X)
+
+    def transform(self, X):
+        """
+        Returns the distance of each point to every cluster centroid, shape (n_samples, n_clusters).
+        """
+        self._check_fitted()
+        return self.kmeans.transform(X)
+
+
+class IncrementalEnhancedKMeans(EnhancedKMeans):
+    """
+    An online variant of EnhancedKMeans for reports that arrive in batches.
+
+    The first call to `partial_fit` runs a normal fit. Later batches are labelled with
+    the current models, and inliers move their centroids with mini-batch k-means updates
+    (each centroid's learning rate is 1 / number of points it has absorbed). The
+    Isolation Forest is refitted every `refresh_every` points on a sliding window of the
+    last `window_size` points, so the cost of a batch depends on the batch and the
+    window, never on the full history.
+
+    Drift against the reference fit is tracked in `drift_`, and `needs_refit()` says
+    when the stream has moved far enough that a full refit is worth doing.
+    """
+    def __init__(self, n_clusters=5, contamination=0.1, random_state=None, window_size=50000,
+                 refresh_every=10000, drift_threshold=0.25, smoothing=0.2):
+        """
+        Parameters (in addition to EnhancedKMeans):
+        - window_size (int): Number of most recent points kept for refreshing the Isolation Forest.
+        - refresh_every (int): Points seen between Isolation Forest refreshes.
+        - drift_threshold (float): Drift score above which `needs_refit()` returns True.
+        - smoothing (float): Weight of the newest batch in the running drift statistics (0-1).
+        """
+        super().__init__(n_clusters=n_clusters, contamination=contamination, random_state=random_state)
+        self.window_size = window_size
+        self.refresh_every = refresh_every
+        self.drift_threshold = drift_threshold
+        self.smoothing = smoothing
+
+        self.counts_ = None
+        self.n_seen_ = 0
+        self.drift_ = None
+        self._window = None
+        self._window_pos = 0
+        self._window_full = False
+        self._since_refresh = 0
+        self._reference = None
+
+    def _push_window(self, X):
+        if self._window is None:
+            self._window = np.empty((self.window_size, X.shape[1]), dtype=float)
+        X = X[-self.window_size:]
+        end = self._window_pos + len(X)
+        if end <= self.window_size:
+            self._window[self._window_pos:end] = X
+        else:
+            split = self.window_size - self._window_pos
+            self._window[self._window_pos:] = X[:split]
+            self._window[:end - self.window_size] = X[split:]
+            self._window_full = True
+        self._window_pos = end % self.window_size
+        if end == self.window_size:
+            self._window_full = True
+
+    def _window_data(self):
+        return self._window if self._window_full else self._window[:self._window_pos]
+
+    @staticmethod
+    def _batch_stats(X, labels, centers, n_clusters):
+        inliers = labels != -1
+        proportions = np.bincount(labels[inliers], minlength=n_clusters) / max(inliers.sum(), 1)
+        if inliers.any():
+            diffs = X[inliers] - centers[labels[inliers]]
+            mean_sq_distance = float((diffs ** 2).sum(axis=1).mean())
+        else:
+            mean_sq_distance = 0.0
+        return {
+            'outlier_rate': float(1.0 - inliers.mean()) if len(labels) else 0.0,
+            'mean_sq_distance': mean_sq_distance,
+            'proportions': proportions
+        }
+
+    def partial_fit(self, X, y=None):
+        """
+        Updates the model with a new batch of points.
+        """
+        X = np.asarray(X, dtype=float)
+        if len(X) == 0:
+            return self
+
+        if self.cluster_centers_ is None:
+            # First batch: a normal fit gives the reference state that drift is measured against
+            self.fit(X)
+            self.counts_ = np.bincount(self.labels_[self.labels_ != -1], minlength=self.n_clusters).astype(float)
+            self.n_seen_ = len(X)
+            self._push_window(X)
+            self._reference = self._batch_stats(X, self.labels_, self.cluster_centers_, self.n_clusters)
+            self.drift_ = {'outlier_rate_change': 0.0, 'distance_ratio': 1.0, 'proportion_shift': 0.0,
+                           'score': 0.0, 'batches': 0, 'points_since_fit': 0}
+            return self
+
+        labels = self.predict(X)
+        inliers = labels != -1
+
+        # --- Mini-batch centroid update: each centroid moves toward the mean of its new points ---
+        if inliers.any():
+            batch_labels = labels[inliers]
+            batch_counts = np.bincount(batch_labels, minlength=self.n_clusters).astype(float)
+            batch_sums = np.zeros_like(self.cluster_centers_, dtype=float)
+            np.add.at(batch_sums, batch_labels, X[inliers])
+
+            touched = batch_counts > 0
+            self.counts_ += batch_counts
+            centers = self.cluster_centers_.astype(float)
+            centers[touched] += (batch_sums[touched] - batch_counts[touched, None] * centers[touched]) / self.counts_[touched, None]
+            self.cluster_centers_ = centers
+            self.kmeans.cluster_centers_ = centers
+
+        self.labels_ = labels
+        self.n_seen_ += len(X)
+        self._push_window(X)
+        self._update_drift(X, labels)
+
+        # --- Periodic Isolation Forest refresh on the sliding window ---
+        self._since_refresh += len(X)
+        if self._since_refresh >= self.refresh_every:
+            self.iso_forest = IsolationForest(contamination=self.contamination, random_state=self.random_state)
+            self.iso_forest.fit(self._window_data())
+            self._since_refresh = 0
+
+        return self
+
+    def _update_drift(self, X, labels):
+        stats = self._batch_stats(X, labels, self.cluster_centers_, self.n_clusters)
+        ref = self._reference
+        current = {
+            'outlier_rate_change': abs(stats['outlier_rate'] - ref['outlier_rate']),
+            'distance_ratio': stats['mean_sq_distance'] / ref['mean_sq_distance'] if ref['mean_sq_distance'] > 0 else 1.0,
+            # Total variation distance between the reference and batch cluster proportions
+            'proportion_shift': 0.5 * float(np.abs(stats['proportions'] - ref['proportions']).sum())
+        }
+
+        a = self.smoothing
+        for key, value in current.items():
+            self.drift_[key] = (1 - a) * self.drift_[key] + a * value
+        self.drift_['batches'] += 1
+        self.drift_['points_since_fit'] += len(X)
+
+        # One score combining the three signals; each term is ~0 when nothing has changed
+        self.drift_['score'] = max(
+            self.drift_['proportion_shift'],
+            abs(self.drift_['distance_ratio'] - 1.0) / 2,
+            self.drift_['outlier_rate_change'] / max(self.contamination, 1e-9) / 4
+        )
+
+    def needs_refit(self):
+        """Returns True when the drift score has passed `drift_threshold`."""
+        return self.drift_ is not None and self.drift_['score'] > self.drift_threshold
@@ -0,0 +1,124 @@
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from contextlib import contextmanager
+
+# --- Cache Location ---
+# The cache lives under the app directory so every session and every user
+# served by this process (and any other process on the machine) shares it.
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+GEOCODE_CACHE_PATH = os.path.join(CACHE_DIRECTORY, "geocode_cache.sqlite")
+
+# Places the geocoder could not find are remembered for a week, then retried.
+NEGATIVE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# SQLite limits the number of bound parameters per statement.
+_QUERY_BATCH_SIZE = 500
+
+
+def normalize_location(location):
+    """
+    Normalizes a raw location string so that trivially different spellings
+    ("Quezon City", " quezon  city, ") share one cache entry.
+    """
+    text = unicodedata.normalize('NFKC', str(location)).lower()
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip(' ,.;')
+
+
+class GeocodeCache:
+    """
+    A persistent location -> (latitude, longitude) store backed by SQLite.
+
+    Entries are keyed on normalized location strings. Successful lookups are kept
+    forever; failed lookups are stored with a NULL position and expire after
+    `negative_ttl` seconds so they are eventually retried.
+    """
+    def __init__(self, path=GEOCODE_CACHE_PATH, negative_ttl=NEGATIVE_TTL_SECONDS):
+        """
+        Parameters:
+        - path (str): Location of the SQLite database file.
+        - negative_ttl (int): Seconds a "not found" result stays valid.
+        """
+        self.path = path
+        self.negative_ttl = negative_ttl
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS geocodes (
+                    location TEXT PRIMARY KEY,
+                    latitude REAL,
+                    longitude REAL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A fresh connection per call keeps the cache safe to use from any thread.
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, locations):
+        """
+        Looks up normalized locations. Returns a dict containing only the keys that
+        have a valid entry: (lat, lon) for hits and (None, None) for unexpired misses.
+        """
+        keys = list(dict.fromkeys(locations))
+        found = {}
+        expiry = time.time() - self.negative_ttl
+
+        with self._connect() as conn:
+            for start in range(0, len(keys), _QUERY_BATCH_SIZE):
+                batch = keys[start:start + _QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT location, latitude, longitude, updated_at FROM geocodes WHERE location IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for location, lat, lon, updated_at in rows:
+                    if lat is None or lon is None:
+                        if updated_at < expiry:
+                            continue  # Expired negative result, geocode again
+                        found[location] = (None, None)
+                    else:
+                        found[location] = (lat, lon)
+        return found
+
+    def put_many(self, results):
+        """
+        Stores a dict of normalized location -> (lat, lon). Use (None, None) to
+        record that a location could not be geocoded.
+        """
+        if not results:
+            return
+        now = time.time()
+        rows = [(loc, lat, lon, now) for loc, (lat, lon) in results.items()]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO geocodes (location, latitude, longitude, updated_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+    def purge_expired(self):
+        """Removes negative results older than the TTL. Returns the number of rows removed."""
+        expiry = time.time() - self.negative_ttl
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM geocodes WHERE latitude IS NULL AND updated_at < ?",
+                (expiry,)
+            )
+            return cursor.rowcount
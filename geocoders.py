@@ -0,0 +1,440 @@
+import os
+import re
+import time
+import heapq
+import difflib
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+from geopy.geocoders import Nominatim
+from geopy.exc import GeopyError, GeocoderUnavailable, GeocoderServiceError, GeocoderTimedOut
+
+from geocode_cache import normalize_location
+
+# --- Gazetteer Location ---
+# A local table of Philippine provinces, cities, municipalities and barangays.
+# Either file works; Parquet is preferred when both exist.
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+GAZETTEER_PATHS = [
+    os.path.join(DATA_DIRECTORY, "ph_gazetteer.parquet"),
+    os.path.join(DATA_DIRECTORY, "ph_gazetteer.csv"),
+]
+
+# --- Nominatim Settings ---
+# Point NOMINATIM_DOMAIN at a self-hosted instance and raise NOMINATIM_RATE to
+# geocode far faster than the 1 request/second allowed by the public service.
+NOMINATIM_DOMAIN = os.environ.get("NOMINATIM_DOMAIN") or None
+NOMINATIM_RATE = float(os.environ.get("NOMINATIM_RATE", "1"))
+
+# Number of locations geocoded concurrently. Each backend still honours its own rate budget.
+GEOCODE_WORKERS = int(os.environ.get("GEOCODE_WORKERS", "8"))
+
+# When a name appears at several administrative levels (e.g. "Quezon"), the
+# larger unit wins, since that is what news reports usually mean.
+LEVEL_PRIORITY = {'region': 0, 'province': 1, 'city': 2, 'municipality': 3, 'barangay': 4}
+
+# Words that carry no location information and are dropped for normalized matching.
+# "city" is kept (as "<name> city"), because many cities share their province's name:
+# Cebu City and Quezon City are not the provinces of Cebu and Quezon.
+_NOISE_WORDS = re.compile(r'\b(municipality of|province of|municipality|province|brgy|barangay|philippines)\b')
+_CITY_OF = re.compile(r'\bcity of\b')
+_NON_ALNUM = re.compile(r'[^0-9a-z ]+')
+
+
+def _canonical(name):
+    """
+    Reduces a place name to its bare words for normalized matching. "City of Cebu"
+    and "Cebu City" both become "cebu city".
+    """
+    text = normalize_location(name)
+    text = _NOISE_WORDS.sub(' ', text)
+    text = _NON_ALNUM.sub(' ', text)
+    if _CITY_OF.search(text):
+        text = _CITY_OF.sub(' ', text) + ' city'
+    return ' '.join(text.split())
+
+
+def _without_city(key):
+    """A canonical key without the word "city" ("cebu city" -> "cebu")."""
+    return ' '.join(word for word in key.split() if word != 'city')
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class GazetteerGeocoder:
+    """
+    An offline geocoder backed by an in-memory index of a local gazetteer.
+
+    Locations are resolved by exact name, then by normalized name (case, spacing,
+    punctuation and words like "Province of" ignored), then by trigram-filtered fuzzy
+    matching. A name saying "city" resolves to the city, never to a province of the
+    same name. Returns None for places it cannot resolve so another backend can try.
+    """
+    name = "gazetteer"
+
+    def __init__(self, gazetteer, fuzzy_cutoff=0.85, max_candidates=20, max_postings=500, min_trigrams=3):
+        """
+        Parameters:
+        - gazetteer (DataFrame or str): A table, or a path to a CSV/Parquet file, with
+          'name', 'latitude' and 'longitude' columns and optional 'level' and 'province'.
+        - fuzzy_cutoff (float): Minimum similarity ratio (0-1) for a fuzzy match.
+        - max_candidates (int): Number of trigram candidates scored per fuzzy lookup.
+        - max_postings (int): Trigrams shared by more names than this (" sa", "san")
+          are skipped when collecting candidates, as they barely narrow the search.
+        - min_trigrams (int): The rarest trigrams of a name that are counted even when
+          they are shared by more names than `max_postings`.
+        """
+        if isinstance(gazetteer, str):
+            gazetteer = load_gazetteer(gazetteer)
+
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.max_candidates = max_candidates
+        self.max_postings = max_postings
+        self.min_trigrams = min_trigrams
+
+        self._exact = {}
+        self._normalized = {}
+        self._with_parent = {}
+        self._trigram_index = defaultdict(set)
+        self._fuzzy_memo = {}
+
+        levels = gazetteer['level'] if 'level' in gazetteer.columns else pd.Series('', index=gazetteer.index)
+        parents = gazetteer['province'] if 'province' in gazetteer.columns else pd.Series('', index=gazetteer.index)
+        priorities = levels.fillna('').astype(str).str.lower().map(LEVEL_PRIORITY).fillna(len(LEVEL_PRIORITY))
+
+        # Sort so that for duplicate names the highest-priority entry is inserted first and kept
+        order = priorities.reset_index(drop=True).sort_values(kind='stable').index
+        names = gazetteer['name'].astype(str).to_numpy()
+        lats = gazetteer['latitude'].to_numpy(dtype=float)
+        lons = gazetteer['longitude'].to_numpy(dtype=float)
+        parents = parents.fillna('').astype(str).to_numpy()
+
+        levels = levels.fillna('').astype(str).str.lower().to_numpy()
+        for i in order:
+            position = (float(lats[i]), float(lons[i]))
+            exact_key = normalize_location(names[i])
+            canonical_key = _canonical(names[i])
+            self._exact.setdefault(exact_key, position)
+            if not canonical_key:
+                continue
+            # A city is found both as "<name> city" and, if no larger unit has it, as "<name>"
+            keys = [canonical_key]
+            if levels[i] == 'city' or 'city' in canonical_key.split():
+                bare_key = _without_city(canonical_key)
+                keys = [f"{bare_key} city", bare_key] if bare_key else keys
+            parent_key = _canonical(parents[i])
+            for key in keys:
+                self._normalized.setdefault(key, position)
+                if parent_key:
+                    self._with_parent.setdefault((key, parent_key), position)
+
+        for key in self._normalized:
+            for gram in _trigrams(key):
+                self._trigram_index[gram].add(key)
+
+    def __len__(self):
+        return len(self._exact)
+
+    def _fuzzy(self, key):
+        if key in self._fuzzy_memo:
+            return self._fuzzy_memo[key]
+
+        # Candidates come from the selective trigrams (and at least the `min_trigrams`
+        # rarest), so a lookup never walks the huge posting lists of common trigrams
+        postings = sorted((self._trigram_index[gram] for gram in _trigrams(key) if gram in self._trigram_index), key=len)
+        n_selective = sum(len(names) <= self.max_postings for names in postings)
+        counts = Counter()
+        for names in postings[:max(self.min_trigrams, n_selective)]:
+            counts.update(names)
+
+        best, best_ratio = None, self.fuzzy_cutoff
+        top = heapq.nsmallest(self.max_candidates, counts.items(), key=lambda item: (-item[1], item[0]))
+        for candidate, _ in top:
+            ratio = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if ratio > best_ratio or (ratio == best_ratio and best is None):
+                best, best_ratio = candidate, ratio
+
+        result = self._normalized[best] if best is not None else None
+        self._fuzzy_memo[key] = result
+        return result
+
+    def geocode(self, location):
+        """Returns (latitude, longitude) for a location string, or None if not found."""
+        exact = self._exact.get(normalize_location(location))
+        if exact is not None:
+            return exact
+
+        # "Barangay, City, Province": try the full string, then each part with its parent,
+        # then each part alone from the most specific to the least specific
+        parts = [p for p in (_canonical(part) for part in str(location).split(',')) if p]
+        if not parts:
+            return None
+
+        full = ' '.join(parts)
+        found = self._normalized.get(full)
+        if found is not None:
+            return found
+
+        for i, part in enumerate(parts):
+            for parent in parts[i + 1:]:
+                found = self._with_parent.get((part, parent))
+                if found is not None:
+                    return found
+
+        for part in parts:
+            found = self._normalized.get(part)
+            if found is not None:
+                return found
+
+        for part in parts:
+            found = self._fuzzy(part)
+            if found is not None:
+                return found
+        return None
+
+
+# Set in job worker processes (see share_rate_budget), so concurrent jobs draw from one
+# Nominatim budget instead of one each.
+_shared_budget_state = None
+
+
+def share_rate_budget(lock, next_slot):
+    """
+    Makes the RateBudgets created afterwards in this process share their schedule with
+    every other process given the same `lock` and `next_slot` (multiprocessing Manager
+    Lock and Value('d') proxies).
+    """
+    global _shared_budget_state
+    _shared_budget_state = (lock, next_slot)
+
+
+class RateBudget:
+    """
+    A thread-safe request budget: callers of `acquire` are spaced at least
+    1 / rate_per_second seconds apart, no matter how many threads share it. With
+    `shared` state (see share_rate_budget) the spacing holds across processes too.
+    """
+    def __init__(self, rate_per_second, shared=None):
+        self.interval = 1.0 / rate_per_second if rate_per_second and rate_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._shared = shared if shared is not None else _shared_budget_state
+
+    def _reserve(self):
+        """Reserves the next free slot and returns (slot, now)."""
+        if self._shared is None:
+            with self._lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot)
+                self._next_slot = slot + self.interval
+            return slot, now
+        # Wall-clock time, since the slot is compared across processes
+        lock, next_slot = self._shared
+        with lock:
+            now = time.time()
+            slot = max(now, next_slot.value)
+            next_slot.value = slot + self.interval
+        return slot, now
+
+    def acquire(self):
+        if self.interval == 0.0:
+            return
+        slot, now = self._reserve()
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class NominatimGeocoder:
+    """
+    Online geocoding through Nominatim, restricted to the Philippines.
+
+    Requests share one RateBudget, so the backend can be called from many threads.
+    The public service allows 1 request per second; a self-hosted instance (set
+    `domain`) can be given a much larger budget. Timeouts are retried with
+    exponential backoff. Raises GeopyError on transient failures so callers do not
+    mistake an outage for "place not found". After `max_consecutive_failures`
+    connection errors in a row the backend pauses itself for `cooldown_seconds`, so an
+    offline machine does not wait out a timeout for every remaining location. After the
+    pause one trial request is let through: a success closes the breaker, a failure
+    pauses it again.
+    """
+    name = "nominatim"
+
+    def __init__(self, user_agent="spatiotemporal_analysis_app", timeout=10, rate_per_second=1.0,
+                 domain=None, max_retries=2, backoff_seconds=1.0, max_consecutive_failures=3,
+                 cooldown_seconds=60.0):
+        kwargs = {'user_agent': user_agent, 'timeout': timeout}
+        if domain:
+            kwargs['domain'] = domain
+        self._geolocator = Nominatim(**kwargs)
+        self.budget = RateBudget(rate_per_second)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown_seconds = cooldown_seconds
+        # Shared by every geocoding thread, so the breaker state is only touched under the lock
+        self._breaker_lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._retry_at = 0.0
+
+    @property
+    def available(self):
+        with self._breaker_lock:
+            return (self._consecutive_failures < self.max_consecutive_failures
+                    or time.monotonic() >= self._retry_at)
+
+    def _admit(self):
+        """Whether a request may go out; lets one trial through per cooldown while open."""
+        with self._breaker_lock:
+            if self._consecutive_failures < self.max_consecutive_failures:
+                return True
+            now = time.monotonic()
+            if now >= self._retry_at:
+                self._retry_at = now + self.cooldown_seconds
+                return True
+            return False
+
+    def _record(self, success):
+        with self._breaker_lock:
+            if success:
+                self._consecutive_failures = 0
+                return
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.max_consecutive_failures:
+                self._retry_at = time.monotonic() + self.cooldown_seconds
+
+    def geocode(self, location):
+        """Returns (latitude, longitude), None if not found, or raises GeopyError."""
+        for attempt in range(self.max_retries + 1):
+            if not self._admit():
+                raise GeocoderUnavailable("Nominatim paused after repeated connection failures.")
+            self.budget.acquire()
+            try:
+                location_data = self._geolocator.geocode(f"{location}, Philippines")
+            except GeocoderTimedOut:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff_seconds * (2 ** attempt))
+                continue
+            except (GeocoderUnavailable, GeocoderServiceError):
+                self._record(success=False)
+                raise
+            self._record(success=True)
+            return (location_data.latitude, location_data.longitude) if location_data else None
+
+
+class ChainGeocoder:
+    """
+    Tries a list of backends in order and returns the first position found.
+
+    A location counts as "not found" only if every backend answered cleanly. If any
+    backend failed transiently, the last GeopyError is re-raised so the result is not
+    cached as a permanent miss.
+    """
+    name = "chain"
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+
+    def geocode(self, location):
+        error = None
+        for backend in self.backends:
+            try:
+                position = backend.geocode(location)
+            except GeopyError as e:
+                error = e
+                continue
+            if position is not None:
+                return position
+        if error is not None:
+            raise error
+        return None
+
+
+def load_gazetteer(path):
+    """
+    Loads a gazetteer from a CSV or Parquet file and keeps only usable rows.
+    """
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    df.columns = [str(col).strip().lower() for col in df.columns]
+
+    missing = {'name', 'latitude', 'longitude'} - set(df.columns)
+    if missing:
+        raise ValueError(f"Gazetteer '{path}' is missing required columns: {', '.join(sorted(missing))}")
+
+    return df.dropna(subset=['name', 'latitude', 'longitude'])
+
+
+def find_gazetteer_path():
+    """Returns the first gazetteer file found in the data directory, or None."""
+    return next((path for path in GAZETTEER_PATHS if os.path.exists(path)), None)
+
+
+def build_default_geocoder(gazetteer_path=None, use_nominatim=True):
+    """
+    Builds the geocoder used by the app: the local gazetteer when one is available,
+    with Nominatim as a fallback for misses.
+    """
+    backends = []
+    gazetteer_path = gazetteer_path or find_gazetteer_path()
+    if gazetteer_path:
+        backends.append(GazetteerGeocoder(gazetteer_path))
+    if use_nominatim:
+        backends.append(NominatimGeocoder(domain=NOMINATIM_DOMAIN, rate_per_second=NOMINATIM_RATE))
+
+    if not backends:
+        raise ValueError("No geocoder backend available: add a gazetteer file or enable Nominatim.")
+    return backends[0] if len(backends) == 1 else ChainGeocoder(backends)
+
+
+def geocode_locations(geocoder, locations, max_workers=GEOCODE_WORKERS, on_result=None,
+                      on_progress=None, progress_interval=0.5):
+    """
+    Geocodes unique locations on a bounded thread pool.
+
+    Parameters:
+    - geocoder: Any backend with a `geocode(location)` method.
+    - locations (iterable): Location strings to resolve.
+    - max_workers (int): Size of the worker pool.
+    - on_result (callable): Called on the calling thread as on_result(location, position)
+      for every location answered cleanly (position is None when not found).
+    - on_progress (callable): Called on the calling thread as on_progress(done, total),
+      at most once every `progress_interval` seconds and once at the end.
+
+    Returns a tuple (positions, failed): a dict of location -> (lat, lon) or None, in the
+    same order as `locations`, and the list of locations that failed transiently.
+    """
+    locations = list(dict.fromkeys(locations))
+    total = len(locations)
+    answers = {}
+    failed = set()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total or 1))) as pool:
+        futures = {pool.submit(geocoder.geocode, loc): loc for loc in locations}
+        last_report = time.monotonic()
+        for done, future in enumerate(as_completed(futures), start=1):
+            loc = futures[future]
+            try:
+                answers[loc] = future.result()
+            except GeopyError:
+                failed.add(loc)
+            else:
+                if on_result is not None:
+                    on_result(loc, answers[loc])
+
+            now = time.monotonic()
+            if on_progress is not None and (now - last_report >= progress_interval or done == total):
+                on_progress(done, total)
+                last_report = now
+
+    # Rebuild in input order so results never depend on thread scheduling
+    positions = {loc: answers.get(loc) for loc in locations}
+    return positions, [loc for loc in locations if loc in failed]
@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:
+    get_script_run_ctx = None
+
+# --- Instrumentation Settings ---
+# Every finished stage is logged as one JSON line on this logger and added to in-memory
+# totals, which are exported to an OpenMetrics text file that monitoring can scrape
+# (set METRICS_FILE to "" to disable). The file is rewritten at most once every
+# METRICS_WRITE_INTERVAL seconds, after each background job, and at exit.
+logger = logging.getLogger("talasuri.metrics")
+METRICS_FILE = os.environ.get(
+    "METRICS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "metrics.prom")
+)
+METRICS_WRITE_INTERVAL = float(os.environ.get("METRICS_WRITE_INTERVAL", 10))
+MAX_RECORDS = 1000
+
+_records = deque(maxlen=MAX_RECORDS)
+_totals = {}
+_lock = threading.Lock()
+# One writer at a time, so concurrent sessions never replace newer totals with older ones
+_write_lock = threading.Lock()
+_last_write = 0.0
+
+
+def rss_mb():
+    """Current resident memory of this process in MB (Linux), else the peak, else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _count_rows(value):
+    """Best-effort row count of a pipeline input or output."""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, dict):
+        value = value.get('data')
+    if hasattr(value, 'shape') and getattr(value, 'ndim', 0) >= 1:
+        return int(value.shape[0])
+    return None
+
+
+def _session_id():
+    if get_script_run_ctx is None:
+        return None
+    try:
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except TypeError:  # Older Streamlit versions have no suppress_warning
+        ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def _finish(stage, started, rss_before, rows_in, rows_out, error):
+    rss_after = rss_mb()
+    record = {
+        'stage': stage,
+        'started_at': round(started, 3),
+        'duration_seconds': round(time.time() - started, 4),
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'memory_delta_mb': round(rss_after - rss_before, 1) if rss_after is not None and rss_before is not None else None,
+        'error': error,
+        'session': _session_id()
+    }
+    with _lock:
+        _records.append(record)
+        totals = _totals.setdefault(stage, {'count': 0, 'seconds': 0.0, 'rows': 0, 'errors': 0})
+        totals['count'] += 1
+        totals['seconds'] += record['duration_seconds']
+        totals['rows'] += rows_in or 0
+        totals['errors'] += 1 if error else 0
+    logger.info(json.dumps(record))
+    _write_openmetrics_throttled()
+    return record
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Records one pipeline stage run as a `with` block. The yielded dict can be given
+    a 'rows_out' value before the block ends.
+    """
+    info = {'rows_out': None}
+    started, rss_before, error = time.time(), rss_mb(), None
+    try:
+        yield info
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _finish(name, started, rss_before, rows_in, info['rows_out'], error)
+
+
+def instrument(name=None):
+    """
+    Decorator recording duration, rows in/out and memory delta of every call.
+    Rows in are read from the first positional argument.
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows_in = _count_rows(args[0]) if args else None
+            with stage(stage_name, rows_in=rows_in) as info:
+                result = func(*args, **kwargs)
+                info['rows_out'] = _count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def get_records(session_id=None):
+    """Recorded stage runs, newest last; only the given session's when `session_id` is set."""
+    with _lock:
+        records = list(_records)
+    if session_id is not None:
+        records = [r for r in records if r['session'] == session_id]
+    return records
+
+
+def clear_records():
+    """Forgets the recorded stage runs (totals are kept), e.g. when a worker starts a new job."""
+    with _lock:
+        _records.clear()
+
+
+def add_records(records, sessions=()):
+    """
+    Adds stage records produced in another process (e.g. a background job). Totals are
+    counted once; a copy of each record is kept for every session in `sessions`.
+    """
+    with _lock:
+        for record in records:
+            totals = _totals.setdefault(record['stage'], {'count': 0, 'seconds': 0.0, 'rows': 0, 'errors': 0})
+            totals['count'] += 1
+            totals['seconds'] += record['duration_seconds']
+            totals['rows'] += record['rows_in'] or 0
+            totals['errors'] += 1 if record['error'] else 0
+            for session_id in sessions or [None]:
+                _records.append(dict(record, session=session_id))
+    write_openmetrics()
+
+
+def current_session_id():
+    return _session_id()
+
+
+def _write_openmetrics_throttled():
+    """
+    Writes the metrics file unless it was written less than METRICS_WRITE_INTERVAL ago
+    or another thread is writing it right now.
+    """
+    if not METRICS_FILE or time.time() - _last_write < METRICS_WRITE_INTERVAL:
+        return
+    if _write_lock.acquire(blocking=False):
+        try:
+            _write_openmetrics(METRICS_FILE)
+        finally:
+            _write_lock.release()
+
+
+def write_openmetrics(path=None):
+    """
+    Writes cumulative per-stage totals in OpenMetrics text format (atomically).
+    """
+    path = METRICS_FILE if path is None else path
+    if not path:
+        return
+    with _write_lock:
+        _write_openmetrics(path)
+
+
+def _write_openmetrics(path):
+    global _last_write
+    with _lock:
+        totals = {stage: dict(values) for stage, values in _totals.items()}
+        _last_write = time.time()
+
+    lines = [
+        "# TYPE talasuri_stage_duration_seconds summary",
+        "# HELP talasuri_stage_duration_seconds Wall time spent in each pipeline stage.",
+    ]
+    for stage_name, values in sorted(totals.items()):
+        lines.append(f'talasuri_stage_duration_seconds_sum{{stage="{stage_name}"}} {values["seconds"]:.6f}')
+        lines.append(f'talasuri_stage_duration_seconds_count{{stage="{stage_name}"}} {values["count"]}')
+    lines += [
+        "# TYPE talasuri_stage_rows counter",
+        "# HELP talasuri_stage_rows Rows passed into each pipeline stage.",
+    ]
+    for stage_name, values in sorted(totals.items()):
+        lines.append(f'talasuri_stage_rows_total{{stage="{stage_name}"}} {values["rows"]}')
+    lines += [
+        "# TYPE talasuri_stage_errors counter",
+        "# HELP talasuri_stage_errors Pipeline stage runs that raised an exception.",
+    ]
+    for stage_name, values in sorted(totals.items()):
+        lines.append(f'talasuri_stage_errors_total{{stage="{stage_name}"}} {values["errors"]}')
+    lines.append("# EOF")
+
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.warning("Could not write metrics file %s", path)
+
+
+# Whatever the throttle held back is written when the server stops
+atexit.register(write_openmetrics)
+
+
+def record_duration(name, started, budget_seconds=None):
+    """
+    Records a stage that began at `started` (a time.time() value) and ends now, such as
+    a whole page run. Logs a warning when it took longer than `budget_seconds`.
+    """
+    record = _finish(name, started, None, None, None, None)
+    if budget_seconds is not None and record['duration_seconds'] > budget_seconds:
+        logger.warning(json.dumps({
+            'over_budget': name,
+            'duration_seconds': record['duration_seconds'],
+            'budget_seconds': budget_seconds
+        }))
+    return record
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import instrumentation
+
+# --- Job Queue Settings ---
+# Heavy pipeline steps run in worker processes so they survive Streamlit reruns and
+# do not tie up the server thread of the session that started them.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", max(1, min(4, (os.cpu_count() or 2) - 1))))
+MAX_FINISHED_JOBS = 50
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+def job_id_for(kind, dataset_hash, **params):
+    """
+    Jobs are identified by what they compute: the same dataset and parameters give the
+    same id, so identical requests from different users share one job.
+    """
+    payload = json.dumps({'kind': kind, 'dataset': dataset_hash, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class Job:
+    """A submitted job: its status, progress, result and the stages it recorded."""
+    def __init__(self, job_id, kind):
+        self.job_id = job_id
+        self.kind = kind
+        self.status = PENDING
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.records = []
+        self.sessions = set()
+        self.future = None
+
+
+def _init_worker(rate_lock, rate_next_slot, cpus_per_worker):
+    # Workers hand their stage records back with the result; only the server writes metrics
+    instrumentation.METRICS_FILE = ""
+    # Jobs run side by side, so each one's parallel steps (n_jobs=-1, BLAS threads) get a
+    # share of the cores instead of all of them. Set before numpy and joblib are imported.
+    for variable in ("LOKY_MAX_CPU_COUNT", "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[variable] = str(cpus_per_worker)
+    # Online geocoding in every worker shares one request budget (public Nominatim: 1 req/s)
+    from geocoders import share_rate_budget
+    share_rate_budget(rate_lock, rate_next_slot)
+
+
+def _run_job(func, progress, job_id, args, kwargs):
+    """Runs a job function in a worker and returns (result, stage records)."""
+    def report(fraction, message=""):
+        progress[job_id] = (float(fraction), message)
+
+    report(0.0, "Starting...")
+    # A worker runs one job at a time, so everything recorded from here on is this job's
+    instrumentation.clear_records()
+    result = func(*args, report=report, **kwargs)
+    records = instrumentation.get_records()
+    report(1.0, "Done")
+    return result, records
+
+
+class JobManager:
+    """
+    A process-wide job queue backed by a process pool.
+
+    `submit` de-duplicates by job id: while a job with the same id is pending, running
+    or done, its existing Job is returned instead of starting a new one. Failed jobs
+    can be resubmitted. The most recent MAX_FINISHED_JOBS finished jobs are kept so
+    results can be picked up after reruns or reconnects.
+    """
+    def __init__(self, max_workers=JOB_WORKERS):
+        self.max_workers = max_workers
+        self._jobs = OrderedDict()
+        # Reentrant: a future that is already done runs _finish inside submit
+        self._lock = threading.RLock()
+        self._start_pool()
+
+    def _start_pool(self):
+        """Starts the worker pool and the Manager holding its shared progress and rate budget."""
+        context = multiprocessing.get_context("spawn")
+        self._manager = context.Manager()
+        self._progress = self._manager.dict()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=context, initializer=_init_worker,
+            initargs=(self._manager.Lock(), self._manager.Value('d', 0.0),
+                      max(1, (os.cpu_count() or 1) // self.max_workers))
+        )
+
+    def _restart_pool(self, broken_pool):
+        """
+        Replaces a pool that broke (a worker crashed or was killed). Every job still in
+        it has failed with BrokenProcessPool; jobs submitted afterwards get the new pool.
+        """
+        with self._lock:
+            if self._pool is not broken_pool:
+                return  # Already replaced
+            old_manager = self._manager
+            self._start_pool()
+        broken_pool.shutdown(wait=False, cancel_futures=True)
+        try:
+            old_manager.shutdown()
+        except Exception:
+            pass  # Its process may have gone down with the pool
+
+    def submit(self, job_id, kind, func, *args, session_id=None, rerun=False, **kwargs):
+        """
+        Starts `func(*args, report=..., **kwargs)` in a worker unless the same job already
+        exists. `session_id` is the Streamlit session asking for it; the stage timings of
+        the job are shown to every session that asked. With `rerun`, a finished job is
+        run again (e.g. when the artifact it produced was evicted).
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status != FAILED and not (rerun and job.status == DONE):
+                self._jobs.move_to_end(job_id)
+                job.sessions.add(session_id)
+                return job
+
+            job = Job(job_id, kind)
+            job.sessions.add(session_id)
+            self._jobs[job_id] = job
+            for attempt in range(2):
+                pool = self._pool
+                try:
+                    self._progress[job_id] = (0.0, "Waiting for a free worker...")
+                    job.future = pool.submit(_run_job, func, self._progress, job_id, args, kwargs)
+                    break
+                except BrokenProcessPool as e:
+                    if attempt:
+                        job.error = f"{type(e).__name__}: {e}"
+                        job.status = FAILED
+                        job.finished_at = time.time()
+                        return job
+                    self._restart_pool(pool)
+            job.status = RUNNING
+            job.future.add_done_callback(lambda future, job=job, pool=pool: self._finish(job, future, pool))
+            self._trim()
+            return job
+
+    def _finish(self, job, future, pool):
+        try:
+            job.result, job.records = future.result()
+            instrumentation.add_records(job.records, sessions=job.sessions)
+            job.status = DONE
+        except BrokenProcessPool as e:
+            job.error = f"{type(e).__name__}: a worker process stopped unexpectedly ({e})"
+            job.status = FAILED
+            # Replaced from another thread: this callback runs on the broken pool's own thread
+            threading.Thread(target=self._restart_pool, args=(pool,), daemon=True).start()
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+        job.finished_at = time.time()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+            self._progress.pop(job_id, None)
+
+    def get(self, job_id):
+        """Returns the Job with this id, or None if it is unknown (or was trimmed)."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def progress(self, job_id):
+        """Returns (fraction, message) last reported by the job."""
+        try:
+            return self._progress.get(job_id, (0.0, ""))
+        except (OSError, EOFError):
+            return (0.0, "")  # The Manager is being replaced after a worker crash
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._manager.shutdown()
+
+
+# --- Job Functions (run inside worker processes) ---
+
+def prepare_dataset_job(filepath, raw_path, usecols, category_cols, column_mapping, prepared_path, report):
+    """
+    Loads the upload, geocodes it and chooses k. The prepared data is written as a
+    columnar artifact when possible, so only its path travels back to the page.
+
+    The status messages of loading and geocoding come back as 'messages', (level, text)
+    pairs for the page to show; when preparation fails, its error messages are the
+    job's error.
+    """
+    from data_processing import load_and_clean_data, geocode_dataframe, collect_messages
+    from dataset_cache import read_artifact, write_artifact
+    from analysis import prepare_data_for_clustering, select_k, build_strata
+
+    def failure(messages, default):
+        errors = [text for level, text in messages if level == 'error']
+        return ValueError(" ".join(errors) if errors else default)
+
+    with collect_messages() as messages:
+        prepared_data = read_artifact(prepared_path)
+        if prepared_data is None:
+            report(0.05, "Loading data...")
+            raw_data = read_artifact(raw_path)
+            if raw_data is None:
+                raw_data = load_and_clean_data(filepath, usecols=usecols, category_cols=category_cols)
+                if raw_data is not None and not raw_data.empty:
+                    write_artifact(raw_data, raw_path)
+            if raw_data is None or raw_data.empty:
+                raise failure(messages, "The uploaded file could not be read.")
+
+            report(0.15, "Geocoding locations...")
+            prepared_data = geocode_dataframe(
+                raw_data,
+                column_mapping['location'],
+                column_mapping['timestamp'],
+                column_mapping['source'],
+                column_mapping['label'],
+                region_col=column_mapping.get('region'),
+                # Lookups fill the progress between loading (0.15) and choosing k (0.7)
+                on_progress=lambda done, total: report(0.15 + 0.55 * done / total,
+                                                       f"Geocoding: {done:,} of {total:,} locations")
+            )
+            if prepared_data is None or prepared_data.empty:
+                raise failure(messages, "Failed to prepare data. Please check your file format.")
+            written = write_artifact(prepared_data, prepared_path)
+        else:
+            written = True
+
+    report(0.7, "Finding optimal patterns...")
+    scaled_data, _, scaler, _ = prepare_data_for_clustering(prepared_data, n_components=None, return_transformers=True)
+    elbow_report = select_k(scaled_data, strata=build_strata(prepared_data))
+
+    return {
+        'prepared_path': prepared_path if written else None,
+        'prepared_data': None if written else prepared_data,
+        'elbow_report': elbow_report,
+        # Fitted on the prepared data, so the analysis job does not refit it
+        'scaler': scaler,
+        'messages': messages
+    }
+
+
+def analysis_job(prepared_path, prepared_data, n_clusters, report, scaler=None, rows=None, partition_by=None):
+    """
+    Runs the enhanced analysis on the prepared data (reusing the elbow step's scaler),
+    or on just the row positions `rows` of it. With `partition_by` ('region', 'tile' or
+    'auto') the partitions are clustered in parallel and merged.
+    """
+    from dataset_cache import read_artifact
+    from analysis import run_enhanced_analysis, run_partitioned_analysis
+
+    if prepared_data is None:
+        report(0.05, "Loading prepared data...")
+        prepared_data = read_artifact(prepared_path) if prepared_path else None
+        if prepared_data is None:
+            raise ValueError("The prepared data is no longer stored. Please start a new analysis.")
+    if rows is not None:
+        prepared_data = prepared_data.iloc[rows].reset_index(drop=True)
+    if partition_by:
+        report(0.2, "Running Enhanced Analysis per region...")
+        return run_partitioned_analysis(prepared_data, n_clusters, partition_by=partition_by, scaler=scaler)
+    report(0.2, "Running Enhanced Analysis...")
+    return run_enhanced_analysis(prepared_data, n_clusters, scaler=scaler)
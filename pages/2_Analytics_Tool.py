@@ -1,22 +1,25 @@
 # pages/2_Analytics_Tool.py
 import streamlit as st
-import pandas as pd
 import streamlit_authenticator as stauth
-import yaml
-from yaml.loader import SafeLoader
 import os
+import time
 import datetime
 
 # --- Import your project files ---
-from data_processing import load_and_clean_data, geocode_dataframe, auto_detect_columns
-from analysis import run_enhanced_analysis, find_optimal_k, prepare_data_for_clustering
-from ui_components import (
-    display_temporal_heatmap,
-    display_elbow_plot,
-    display_parallel_coordinates,
-    display_bubble_map,
-    display_source_credibility
+# Data loading (geopy), analysis (sklearn) and chart modules (altair, plotly) are imported
+# inside the steps that use them, so the login redirect and the upload form start quickly.
+# None of the modules imported here load pandas (dataset_cache imports it when reading an
+# artifact), though Streamlit's login cookie component still does on the first render.
+from static_cache import load_auth_config
+from dataset_cache import (
+    UPLOAD_DIRECTORY,
+    raw_artifact_path,
+    prepared_artifact_path,
+    read_artifact
 )
+from upload_store import get_upload_store
+from instrumentation import get_records, current_session_id
+from jobs import JobManager, job_id_for, prepare_dataset_job, analysis_job, DONE, FAILED
 
 # --- App Configuration ---
 st.set_page_config(
@@ -39,14 +42,17 @@ st.markdown(
 # --- END NEW CSS ---
 
 
+# --- Admin Users ---
+# Admins see the pipeline performance panel. A user is an admin if their credentials in
+# config.yaml carry the 'admin' role, or if their username is listed in TALASURI_ADMINS.
+ADMIN_USERNAMES = {user.strip() for user in os.environ.get("TALASURI_ADMINS", "").split(",") if user.strip()}
+
 # --- File Storage Setup ---
-UPLOAD_DIRECTORY = "user_uploads"
 if not os.path.exists(UPLOAD_DIRECTORY):
     os.makedirs(UPLOAD_DIRECTORY)
 
 # --- USER AUTHENTICATION (Needed for auth check and logout) ---
-with open('config.yaml') as file:
-    config = yaml.load(file, Loader=SafeLoader)
+config = load_auth_config('config.yaml')
 
 authenticator = stauth.Authenticate(
     config['credentials'],
@@ -55,10 +61,60 @@ authenticator = stauth.Authenticate(
     config['cookie']['expiry_days']
 )
 
+# --- BACKGROUND JOBS ---
+# One job queue per server process, shared by every session.
+@st.cache_resource
+def get_job_manager():
+    return JobManager()
+
+# --- SPATIO-TEMPORAL INDEX ---
+# Built once per prepared dataset (keyed by its preparation job), so area, period and
+# source filters are quick lookups instead of scans of the prepared data.
+@st.cache_resource(max_entries=4)
+def get_data_index(prepare_job_id, _prepared_data):
+    from spatial_index import build_spatiotemporal_index
+    return build_spatiotemporal_index(_prepared_data)
+
+# --- ADMIN: PIPELINE PERFORMANCE PANEL ---
+def show_admin_panel():
+    """Shows admins the stage timings of this session, including those of finished jobs."""
+    user_roles = st.session_state.get('roles') or []
+    if 'admin' in user_roles or username in ADMIN_USERNAMES:
+        from ui_components import display_instrumentation_panel
+        display_instrumentation_panel(get_records(current_session_id()))
+
+def submit_preparation(job_id, prepare_args, rerun=False):
+    """
+    Queues the preparation job (loading, geocoding and choosing k) of an upload. Its
+    artifacts are pinned so the store does not evict them while they are in use.
+    """
+    filepath, raw_path, usecols, category_cols, column_mapping, prepared_path = prepare_args
+    upload_store.pin_artifacts([raw_path, prepared_path])
+    job_manager.submit(
+        job_id, 'prepare', prepare_dataset_job,
+        filepath, raw_path, usecols, category_cols, column_mapping, prepared_path,
+        session_id=current_session_id(), rerun=rerun
+    )
+    st.session_state.prepare_job_id = job_id
+    st.session_state.prepare_args = prepare_args
+
+def show_job_progress(job_id):
+    """Shows a running job's progress, then reruns the page a second later to poll again."""
+    fraction, message = job_manager.progress(job_id)
+    st.progress(min(max(fraction, 0.0), 1.0), text=message or "Working...")
+    st.caption("You can refresh or come back later; the work continues in the background.")
+    # The rerun below ends this script run, so the panel is rendered here
+    show_admin_panel()
+    time.sleep(1)
+    st.rerun()
+
 # --- ROBUST SESSION STATE INITIALIZATION (copy from app.py) ---
 default_session_state = {
-    "step": "upload", "data": None, "detected_cols": {}, "prepared_data": None,
-    "analysis_results": None, "optimal_k": 4, "inertias": None
+    "step": "upload", "detected_cols": {}, "prepared_data": None,
+    "analysis_results": None, "optimal_k": 4, "inertias": None, "dataset_hash": None,
+    "elbow_report": None, "prepare_job_id": None, "analysis_job_id": None,
+    "upload_sha": None, "upload_name": None, "upload_file_id": None, "analysis_filter": None,
+    "prepare_messages": None, "prepare_args": None
 }
 for key, value in default_session_state.items():
     if key not in st.session_state:
@@ -82,6 +138,7 @@ if authentication_status:
         # On logout, reset session state
         for key, value in default_session_state.items():
             st.session_state[key] = value
+        st.query_params.clear()
         # Force navigation to home page by using rerun, which will trigger auth guard
         # and redirect unauthenticated users
         st.rerun()
@@ -101,12 +158,27 @@ if not authentication_status:
 # --- MAIN APP (This code only runs AFTER successful login) ---
 # (The old sidebar/logout logic has been removed from here)
 
+# The job queue's worker processes and the upload index are only started for logged-in users
+upload_store = get_upload_store()
+job_manager = get_job_manager()
+
+# --- RECONNECT TO RUNNING OR FINISHED JOBS ---
+# Job ids are kept in the URL, so a refreshed tab or a new session picks its work back up.
+if st.session_state.prepare_job_id is None and st.query_params.get("prepare_job"):
+    if job_manager.get(st.query_params["prepare_job"]) is not None:
+        st.session_state.prepare_job_id = st.query_params["prepare_job"]
+        st.session_state.analysis_job_id = st.query_params.get("analysis_job")
+        st.session_state.step = "preparing"
+
 st.title("TalaSuri: A Spatio-Temporal Fake News Detection and Localization System")
 st.caption("Analyze spatiotemporal patterns in your news reports.")
 
 
 # --- STEP 1: UPLOAD ---
 if st.session_state.step == "upload":
+    from data_processing import auto_detect_columns, read_csv_sample, get_geocode_cache
+    from timestamps import parse_timestamps
+
     st.header("Welcome!")
     st.markdown("""
     This tool helps you analyze your news report data to find out who did the posts,
@@ -118,60 +190,181 @@ if st.session_state.step == "upload":
     
     uploaded_file = st.file_uploader("Upload your News Data (CSV)", type=['csv'])
 
+    # --- Previously uploaded datasets ---
+    past_datasets = upload_store.list_datasets(username)
+    if past_datasets:
+        with st.expander("📂 Open one of your previous datasets"):
+            labels = {
+                dataset['sha256']: f"{dataset['filename']} ({dataset['size'] / 1024 ** 2:.1f} MB, "
+                                   f"uploaded {datetime.datetime.fromtimestamp(dataset['uploaded_at']):%Y-%m-%d %H:%M})"
+                for dataset in past_datasets
+            }
+            chosen = st.selectbox("Dataset:", list(labels), format_func=labels.get)
+            if st.button("Open Dataset"):
+                st.session_state.upload_sha = chosen
+                st.session_state.upload_name = next(d['filename'] for d in past_datasets if d['sha256'] == chosen)
+                st.rerun()
+
+    # --- File Database Logic ---
+    # Each new upload is streamed into the store once, not on every rerun
     if uploaded_file:
-        # --- File Database Logic ---
-        now = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"{now}_{username}_{uploaded_file.name}"
-        filepath = os.path.join(UPLOAD_DIRECTORY, filename)
-        
-        with open(filepath, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
-        st.success(f"✅ File saved as '{filename}'.")
+        file_id = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+        if st.session_state.upload_file_id != file_id:
+            try:
+                uploaded_file.seek(0)
+                sha256, _ = upload_store.add(username, uploaded_file, uploaded_file.name)
+            except ValueError as e:
+                st.error(f"❌ {e} Remove some of your previous datasets or upload a smaller file.")
+                st.stop()
+            st.session_state.upload_file_id = file_id
+            st.session_state.upload_sha = sha256
+            st.session_state.upload_name = uploaded_file.name
+
+    filepath = upload_store.open(username, st.session_state.upload_sha) if st.session_state.upload_sha else None
+    if st.session_state.upload_sha and filepath is None:
+        st.warning("That dataset is no longer stored. Please upload it again.")
+        st.session_state.upload_sha = None
+
+    if filepath:
+        st.success(f"✅ Using '{st.session_state.upload_name}'.")
 
         # --- Load and Process the file ---
-        raw_data = load_and_clean_data(filepath)
-        if not raw_data.empty:
-            st.session_state.data = raw_data
-            st.dataframe(st.session_state.data.head())
-            st.session_state.detected_cols = auto_detect_columns(st.session_state.data.columns)
+        # Detect columns from the header and a bounded sample of rows first, so only the
+        # mapped columns are read into memory
+        sample = read_csv_sample(filepath)
+        detected_cols, candidates = auto_detect_columns(
+            sample.columns, sample=sample, geocode_cache=get_geocode_cache(), return_candidates=True
+        )
+        required_cols = [detected_cols[key] for key in ('location', 'timestamp', 'source', 'label')]
+        if not all(required_cols):
+            missing = [key for key in ('location', 'timestamp', 'source', 'label') if not detected_cols[key]]
+            hints = [f"{key}: " + ", ".join(f"'{col}' ({score:.0%})" for col, score in candidates[key])
+                     for key in missing if candidates[key]]
+            st.warning(f"⚠️ Could not confidently detect the {', '.join(missing)} column(s)."
+                       + (" Closest candidates — " + "; ".join(hints) if hints else ""))
+        # Check the timestamps on the sample now, before any geocoding is paid for
+        if detected_cols['timestamp']:
+            _, timestamp_report = parse_timestamps(sample[detected_cols['timestamp']], return_report=True)
+            if timestamp_report['failed']:
+                st.warning(f"⚠️ {timestamp_report['failure_rate']:.1%} of the sampled timestamps in "
+                           f"'{detected_cols['timestamp']}' could not be parsed. Those rows will be skipped.")
+        usecols = [col for col in detected_cols.values() if col] if all(required_cols) else None
+        category_cols = [detected_cols[key] for key in ('location', 'source', 'label', 'region') if detected_cols[key]]
+
+        # The full file is loaded by the preparation job, off this script thread; re-opening
+        # the same file there memory-maps its columnar copy instead of re-parsing the CSV
+        dataset_hash = st.session_state.upload_sha
+        raw_path = raw_artifact_path(dataset_hash, usecols, category_cols)
+
+        if not sample.empty:
+            st.session_state.dataset_hash = dataset_hash
+            st.dataframe(sample.head())
+            st.session_state.detected_cols = detected_cols
             
             if st.button("🚀 Analyze My Data", type="primary", use_container_width=True):
                 # --- AUTOMATIC STEP 2: Column Mapping (Hidden from user) ---
-                with st.spinner("🔍 Detecting columns and preparing data..."):
-                    # Use auto-detected columns
-                    loc_col = st.session_state.detected_cols['location']
-                    time_col = st.session_state.detected_cols['timestamp']
-                    source_col = st.session_state.detected_cols['source']
-                    label_col = st.session_state.detected_cols['label']
-                    
-                    # Prepare data with geocoding
-                    prepared_data = geocode_dataframe(
-                        st.session_state.data,
-                        loc_col,
-                        time_col,
-                        source_col,
-                        label_col
-                    )
-                    
-                    if prepared_data is not None and not prepared_data.empty:
-                        st.session_state.prepared_data = prepared_data
-                        
-                        # --- AUTOMATIC STEP 3: Find Optimal K (Hidden from user) ---
-                        st.spinner("📊 Finding optimal patterns...")
-                        scaled_data, _ = prepare_data_for_clustering(prepared_data, n_components=None)
-                        inertias, optimal_k = find_optimal_k(scaled_data)
-                        st.session_state.inertias = inertias
-                        st.session_state.optimal_k = optimal_k
-                        
-                        # Move directly to analysis
-                        st.session_state.step = "analysis"
-                        st.rerun()
-                    else:
-                        st.error("❌ Failed to prepare data. Please check your file format.")
+                column_mapping = {
+                    'location': detected_cols['location'],
+                    'timestamp': detected_cols['timestamp'],
+                    'source': detected_cols['source'],
+                    'label': detected_cols['label']
+                }
+                # The region column is only carried along when the file has one
+                if detected_cols.get('region'):
+                    column_mapping['region'] = detected_cols['region']
+
+                # --- AUTOMATIC STEP 3: Geocoding + Optimal K, as a background job ---
+                # Identical requests (same file and mapping) share one job, even across users
+                job_id = job_id_for('prepare', dataset_hash, **column_mapping)
+                submit_preparation(job_id, (filepath, raw_path, usecols, category_cols, column_mapping,
+                                            prepared_artifact_path(dataset_hash, column_mapping)))
+                st.query_params["prepare_job"] = job_id
+                st.session_state.step = "preparing"
+                st.rerun()
+
+
+# --- STEP 1b: WAIT FOR DATA PREPARATION ---
+if st.session_state.step == "preparing":
+    st.header("Preparing Your Data")
+    job = job_manager.get(st.session_state.prepare_job_id)
+
+    if job is None:
+        st.error("❌ This preparation job is no longer available. Please upload your file again.")
+        if st.button("Start Over"):
+            for key, value in default_session_state.items():
+                st.session_state[key] = value
+            st.query_params.clear()
+            st.rerun()
+    elif job.status == FAILED:
+        st.error(f"❌ Failed to prepare data. Please check your file format. ({job.error})")
+        if st.button("Start Over"):
+            for key, value in default_session_state.items():
+                st.session_state[key] = value
+            st.query_params.clear()
+            st.rerun()
+    elif job.status == DONE:
+        result = job.result
+        prepared_data = result['prepared_data']
+        if prepared_data is None:
+            prepared_data = read_artifact(result['prepared_path'])
+        if prepared_data is None:
+            # The prepared copy was evicted since the job finished: prepare it again
+            if st.session_state.prepare_args is None:
+                st.error("❌ The prepared data is no longer stored. Please upload your file again.")
+                if st.button("Start Over"):
+                    for key, value in default_session_state.items():
+                        st.session_state[key] = value
+                    st.query_params.clear()
+                    st.rerun()
+                st.stop()
+            submit_preparation(job.job_id, st.session_state.prepare_args, rerun=True)
+            st.rerun()
+        st.session_state.prepared_data = prepared_data
+        st.session_state.inertias = result['elbow_report']['inertias']
+        st.session_state.optimal_k = result['elbow_report']['optimal_k']
+        st.session_state.elbow_report = result['elbow_report']
+        st.session_state.prepare_messages = result.get('messages')
+
+        # Move directly to analysis
+        st.session_state.step = "analysis"
+        st.rerun()
+    else:
+        show_job_progress(job.job_id)
 
 
 # --- STEP 2: RUN ANALYSIS & SHOW RESULTS ---
+def submit_analysis(n_clusters, rows=None, filters=None, partition_by=None):
+    """
+    Queues the analysis of the prepared data, or of the row positions `rows` of it,
+    optionally clustered per region or tile (`partition_by`).
+    """
+    # Keyed by the preparation job, so it identifies the dataset and column mapping
+    params = {'n_clusters': n_clusters}
+    if filters:
+        params['filters'] = filters
+    if partition_by:
+        params['partition_by'] = partition_by
+    job_id = job_id_for('analysis', st.session_state.prepare_job_id, **params)
+    prepare_result = job_manager.get(st.session_state.prepare_job_id)
+    prepared_path = prepare_result.result['prepared_path'] if prepare_result and prepare_result.result else None
+    if prepared_path and not os.path.exists(prepared_path):
+        prepared_path = None  # Evicted; the job gets the copy this session still holds
+    # The elbow step's scaler was fitted on all rows, so a selection gets its own
+    scaler = prepare_result.result.get('scaler') if prepare_result and prepare_result.result and rows is None else None
+    job_manager.submit(
+        job_id, 'analysis', analysis_job,
+        prepared_path,
+        None if prepared_path else st.session_state.prepared_data,
+        n_clusters,
+        scaler=scaler,
+        rows=rows,
+        partition_by=partition_by,
+        session_id=current_session_id()
+    )
+    st.session_state.analysis_results = None
+    st.session_state.analysis_job_id = job_id
+    st.query_params["analysis_job"] = job_id
+
 if st.session_state.step == "analysis":
 
     # --- "GO BACK" BUTTON ---
@@ -180,30 +373,88 @@ if st.session_state.step == "analysis":
         # Reset all session state keys, but keep user logged in
         for key, value in default_session_state.items():
             st.session_state[key] = value
+        st.query_params.clear()
         st.rerun()
     st.sidebar.write("---")
     # --- END BUTTON ---
 
     st.header("Analysis Results")
     
+    # Keep the prepared copy from being evicted while this session works with it
+    prepare_job = job_manager.get(st.session_state.prepare_job_id)
+    if prepare_job is not None and prepare_job.result and prepare_job.result['prepared_path']:
+        upload_store.pin_artifacts([prepare_job.result['prepared_path']])
+
     # Use optimal K automatically (hidden from non-technical users)
     n_clusters = st.session_state.optimal_k
 
-    if st.session_state.analysis_results is None:
+    elbow_report = st.session_state.elbow_report
+    if elbow_report and elbow_report['mode'] != 'full':
+        st.caption(f"Large dataset: the number of patterns (K={n_clusters}) was chosen using {elbow_report['rows_used']:,} rows "
+                   f"({elbow_report['mode']} mode), with {elbow_report['confidence']:.0%} confidence against the full data.")
+
+    # Messages from the background preparation (skipped rows, locations to retry, ...)
+    prepare_messages = st.session_state.prepare_messages or []
+    if prepare_messages:
+        has_warnings = any(level in ('warning', 'error') for level, _ in prepare_messages)
+        with st.expander("Data preparation details", expanded=has_warnings):
+            for level, text in prepare_messages:
+                getattr(st, level)(text)
+
+    # --- SUBSET FILTER ---
+    if st.session_state.prepared_data is not None:
+        from ui_components import display_subset_filter
+
+        data_index = get_data_index(st.session_state.prepare_job_id, st.session_state.prepared_data)
+        with st.expander("🔎 Focus on an area, period or source", expanded=bool(st.session_state.analysis_filter)):
+            filters, positions = display_subset_filter(data_index)
+            col1, col2 = st.columns(2)
+            if col1.button("Re-run analysis on this selection", use_container_width=True,
+                           disabled=not filters or len(positions) <= n_clusters):
+                submit_analysis(n_clusters, rows=positions, filters=filters)
+                st.session_state.analysis_filter = filters
+                st.rerun()
+            if st.session_state.analysis_filter and col2.button("Back to all data", use_container_width=True):
+                st.session_state.analysis_filter = None
+                st.session_state.analysis_results = None
+                st.session_state.analysis_job_id = None
+                st.query_params.pop("analysis_job", None)
+                st.rerun()
+        if st.session_state.analysis_filter:
+            st.caption("Results below cover the filtered selection only.")
+
+    if st.session_state.analysis_results is None and st.session_state.analysis_job_id:
+        job = job_manager.get(st.session_state.analysis_job_id)
+        if job is None or job.status == FAILED:
+            st.error(f"Analysis failed: {job.error if job else 'the job is no longer available.'}")
+            st.session_state.analysis_job_id = None
+            st.query_params.pop("analysis_job", None)
+        elif job.status == DONE:
+            st.session_state.analysis_results = job.result
+            st.rerun()
+        else:
+            show_job_progress(job.job_id)
+
+    if st.session_state.analysis_results is None and not st.session_state.analysis_job_id:
         st.info(f"Click the button below to run the analysis.")
         st.write("---")
 
+        partitioned = st.checkbox(
+            "Analyze each region separately", value=False,
+            help="Clusters every region (or map tile, when the file has no region column) in parallel, "
+                 "then combines them. Faster for national-scale datasets."
+        )
         if st.button("🔬 Run Analysis", type="primary", use_container_width=True):
-            with st.spinner("Running Enhanced Analysis..."):
-                st.session_state.analysis_results = run_enhanced_analysis(
-                    st.session_state.prepared_data, 
-                    n_clusters
-                )
+            submit_analysis(n_clusters, partition_by='auto' if partitioned else None)
             st.rerun()
-    else:
+    elif st.session_state.analysis_results is not None:
         # Analysis already run, allow re-running if K changes
         
             st.info(f"Analysis Completed")
+            partitions = st.session_state.analysis_results.get('partitions')
+            if partitions is not None:
+                with st.expander(f"Clustered {len(partitions)} parts of the map separately", expanded=False):
+                    st.dataframe(partitions, hide_index=True, use_container_width=True)
         
             
     if st.session_state.analysis_results:
@@ -212,6 +463,8 @@ if st.session_state.step == "analysis":
         if 'error' in st.session_state.analysis_results:
             st.error(f"Analysis failed: {st.session_state.analysis_results['error']}")
         else:
+            from ui_components import display_source_credibility, display_bubble_map, display_temporal_heatmap
+
             st.subheader("Detailed Analysis")
             st.markdown("Click on any card below to view the analysis:")
             
@@ -269,4 +522,9 @@ if st.session_state.step == "analysis":
             
             else:
                 # Show message when no card is selected yet
-                st.info("👆 Click on any card above to view the detailed analysis.")
\ No newline at end of file
+                st.info("👆 Click on any card above to view the detailed analysis.")
+
+
+# --- ADMIN: PIPELINE PERFORMANCE PANEL ---
+# Rendered last so it includes every stage that ran during this script run.
+show_admin_panel()
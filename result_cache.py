@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from dataset_cache import evict_directory
+
+# --- Result Cache Settings ---
+# Analysis results are shared by every session (and worker process) through these files.
+RESULT_CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "results")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 512 * 1024 ** 2))
+
+# Bump when the analysis changes in a way that makes stored results stale.
+RESULT_CACHE_VERSION = 1
+
+
+def fingerprint_dataframe(df):
+    """
+    A content fingerprint of a DataFrame: column names, dtypes and a vectorized hash of
+    every row. Equal data gives the same fingerprint whichever session loaded it.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def analysis_cache_key(df, **params):
+    """Cache key for an analysis of `df` with the given parameters."""
+    payload = json.dumps({'data': fingerprint_dataframe(df), 'params': params, 'version': RESULT_CACHE_VERSION},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class ResultCache:
+    """
+    A directory of compressed .npz files, one per analysis, evicted least recently
+    used first once the directory grows past `max_bytes`.
+    """
+    def __init__(self, directory=RESULT_CACHE_DIRECTORY, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def pipeline_path(self, key):
+        """Where the fitted pipeline of a cached analysis is saved (see ClusteringPipeline.save)."""
+        return os.path.join(self.directory, f"{key}.pipeline.joblib")
+
+    def get(self, key):
+        """Returns the stored arrays as a dict, or None on a miss."""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                arrays = {name: stored[name] for name in stored.files}
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # Mark as recently used for eviction
+        return arrays
+
+    def put(self, key, **arrays):
+        """Stores named arrays under `key` and trims the cache."""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        evict_directory(self.directory, self.max_bytes, keep=[path, self.pipeline_path(key)])
+
+
+_result_cache = None
+
+
+def get_result_cache():
+    """Returns the process-wide ResultCache."""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrument
+
+# --- Spatio-Temporal Index Settings ---
+# The index sorts row positions once per prepared dataset: by grid cell, by time and by
+# category code. Every filter is then a handful of binary searches over those orders,
+# and filters are combined by checking the smallest candidate set against the others,
+# so a selection costs time in proportion to its size rather than to the dataset's.
+INDEX_CELL_DEGREES = 0.1  # Roughly 11 km at PH latitudes
+INDEX_CATEGORY_COLUMNS = ['source', 'label', 'region', 'credibility', 'location']
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _haversine_km(latitude, longitude, center_latitude, center_longitude):
+    """Great-circle distance in km from one point to arrays of points."""
+    lat1, lon1 = np.radians(center_latitude), np.radians(center_longitude)
+    lat2, lon2 = np.radians(latitude), np.radians(longitude)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _utc_nanoseconds(timestamps):
+    """int64 nanoseconds of a datetime Series (UTC for timezone-aware values); NaT sorts last."""
+    if getattr(timestamps.dt, 'tz', None) is not None:
+        timestamps = timestamps.dt.tz_convert('UTC').dt.tz_localize(None)
+    values = timestamps.to_numpy(dtype='datetime64[ns]').view(np.int64).copy()
+    values[values == np.iinfo(np.int64).min] = np.iinfo(np.int64).max
+    return values
+
+
+class SpatioTemporalIndex:
+    """
+    Row selections over a prepared dataset by area, time and category.
+
+    Selections are sorted arrays of row positions, suitable for `data.iloc[...]`.
+    """
+    def __init__(self, data, cell_degrees=INDEX_CELL_DEGREES, category_columns=INDEX_CATEGORY_COLUMNS):
+        """
+        Parameters:
+        - data (DataFrame): Prepared data with 'latitude', 'longitude' and 'timestamp'.
+        - cell_degrees (float): Grid cell size of the spatial index.
+        - category_columns (list): Columns indexed by category code, where present.
+        """
+        self.n_rows = len(data)
+        self.cell_degrees = cell_degrees
+        self.latitude = data['latitude'].to_numpy(dtype=float)
+        self.longitude = data['longitude'].to_numpy(dtype=float)
+
+        # Spatial grid: positions sorted by row-major cell key
+        self._n_cols = int(360.0 / cell_degrees) + 1
+        keys = self._cell_rows(self.latitude) * self._n_cols + self._cell_cols(self.longitude)
+        self._spatial_order = np.argsort(keys, kind='stable')
+        self._sorted_cells = keys[self._spatial_order]
+
+        # Time: positions sorted by UTC nanoseconds
+        self.timezone = getattr(data['timestamp'].dt, 'tz', None) if 'timestamp' in data.columns else None
+        if 'timestamp' in data.columns:
+            self._times = _utc_nanoseconds(data['timestamp'])
+            self._time_order = np.argsort(self._times, kind='stable')
+            self._sorted_times = self._times[self._time_order]
+        else:
+            self._times = None
+
+        # Categories: positions sorted by code, with where each code's run starts
+        self.categories = {}
+        self._codes = {}
+        self._code_order = {}
+        self._code_starts = {}
+        for column in category_columns:
+            if column not in data.columns:
+                continue
+            codes, uniques = pd.factorize(data[column])
+            self.categories[column] = pd.Index(uniques)
+            self._codes[column] = codes
+            self._code_order[column] = np.argsort(codes, kind='stable')
+            self._code_starts[column] = np.searchsorted(codes[self._code_order[column]], np.arange(-1, len(uniques) + 1))
+
+    def _cell_rows(self, latitude):
+        return np.floor((np.asarray(latitude) + 90.0) / self.cell_degrees).astype(np.int64)
+
+    def _cell_cols(self, longitude):
+        return np.floor((np.asarray(longitude) + 180.0) / self.cell_degrees).astype(np.int64)
+
+    def rows_with(self, column, value):
+        """Positions of the rows whose `column` equals `value` (in index order)."""
+        codes = self._category_codes(column, [value])
+        if not len(codes):
+            return np.empty(0, dtype=np.intp)
+        starts = self._code_starts[column]
+        return self._code_order[column][starts[codes[0] + 1]:starts[codes[0] + 2]]
+
+    def center_of(self, column, value):
+        """Mean (lat, lon) of the rows whose `column` equals `value`, or None if there are none."""
+        positions = self.rows_with(column, value)
+        if not len(positions):
+            return None
+        return float(self.latitude[positions].mean()), float(self.longitude[positions].mean())
+
+    def time_range(self):
+        """First and last timestamp in the data's timezone, or (None, None) without timestamps."""
+        valid = self._sorted_times[self._sorted_times != np.iinfo(np.int64).max] if self._times is not None else []
+        if not len(valid):
+            return None, None
+        first, last = pd.Timestamp(valid[0], tz='UTC'), pd.Timestamp(valid[-1], tz='UTC')
+        if self.timezone is None:
+            return first.tz_localize(None), last.tz_localize(None)
+        return first.tz_convert(self.timezone), last.tz_convert(self.timezone)
+
+    # --- Candidate positions, one filter at a time ---
+
+    def _bbox_candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """Positions in the grid cells overlapping the box (a superset of the box)."""
+        first_col, last_col = self._cell_cols([min_lon, max_lon])
+        runs = []
+        for row in range(self._cell_rows(min_lat), self._cell_rows(max_lat) + 1):
+            lo, hi = np.searchsorted(self._sorted_cells, [row * self._n_cols + first_col, row * self._n_cols + last_col + 1])
+            if hi > lo:
+                runs.append(self._spatial_order[lo:hi])
+        return np.concatenate(runs) if runs else np.empty(0, dtype=np.intp)
+
+    def _time_bounds(self, start, end):
+        """Nanosecond bounds [start, end) of a time range; naive bounds are local to the data."""
+        bounds = []
+        for value, default in ((start, np.iinfo(np.int64).min), (end, np.iinfo(np.int64).max)):
+            if value is None:
+                bounds.append(default)
+                continue
+            value = pd.Timestamp(value)
+            if value.tzinfo is None and self.timezone is not None:
+                value = value.tz_localize(self.timezone)
+            if value.tzinfo is not None:
+                value = value.tz_convert('UTC').tz_localize(None)
+            bounds.append(value.as_unit('ns').value)
+        return bounds
+
+    def _category_codes(self, column, values):
+        wanted = self.categories[column].get_indexer(pd.Index(list(values)))
+        return np.unique(wanted[wanted >= 0])
+
+    def _filters(self, bbox, center, radius_km, start, end, categories):
+        """(size, candidates, test) for every requested filter; `test` checks given positions."""
+        filters = []
+        if center is not None and radius_km is not None:
+            # The radius becomes a bounding box for the grid, then exact distances are checked
+            center_lat, center_lon = center
+            lat_span = radius_km / 111.32
+            lon_span = radius_km / max(111.32 * np.cos(np.radians(center_lat)), 1e-6)
+            box = (center_lat - lat_span, center_lon - lon_span, center_lat + lat_span, center_lon + lon_span)
+
+            def test(positions, center_lat=center_lat, center_lon=center_lon):
+                return _haversine_km(self.latitude[positions], self.longitude[positions], center_lat, center_lon) <= radius_km
+            filters.append((None, lambda box=box: self._bbox_candidates(*box), test))
+
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+
+            def test(positions):
+                lat, lon = self.latitude[positions], self.longitude[positions]
+                return (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+            filters.append((None, lambda: self._bbox_candidates(min_lat, min_lon, max_lat, max_lon), test))
+
+        if (start is not None or end is not None) and self._times is not None:
+            low, high = self._time_bounds(start, end)
+            lo, hi = np.searchsorted(self._sorted_times, [low, high])
+
+            def test(positions):
+                times = self._times[positions]
+                return (times >= low) & (times < high)
+            filters.append((hi - lo, lambda: self._time_order[lo:hi], test))
+
+        for column, values in categories.items():
+            if values is None or column not in self.categories:
+                continue
+            codes = self._category_codes(column, values)
+            # Starts are offset by one so the run of missing values (code -1) comes first
+            starts = self._code_starts[column]
+            runs = [self._code_order[column][starts[code + 1]:starts[code + 2]] for code in codes]
+            allowed = np.zeros(len(self.categories[column]) + 1, dtype=bool)
+            allowed[codes + 1] = True
+
+            def test(positions, column=column, allowed=allowed):
+                return allowed[self._codes[column][positions] + 1]
+            filters.append((sum(len(run) for run in runs),
+                            lambda runs=runs: np.concatenate(runs) if runs else np.empty(0, dtype=np.intp), test))
+        return filters
+
+    def select(self, bbox=None, center=None, radius_km=None, start=None, end=None, **categories):
+        """
+        Positions of the rows matching every given filter, in row order.
+
+        Parameters:
+        - bbox (tuple): (min_lat, min_lon, max_lat, max_lon), inclusive.
+        - center (tuple), radius_km (float): Rows within `radius_km` of (lat, lon).
+        - start, end: Time range [start, end); dates or timestamps, naive ones in the
+          data's timezone.
+        - **categories: Allowed values per indexed column, e.g. source=['GMA'].
+
+        With no filters, every row is selected.
+        """
+        filters = self._filters(bbox, center, radius_km, start, end, categories)
+        if not filters:
+            return np.arange(self.n_rows)
+
+        # Materialize the smallest candidate set (spatial sets are sized by materializing)
+        sized = []
+        for size, candidates, test in filters:
+            if size is None:
+                positions = candidates()
+                size, candidates = len(positions), (lambda positions=positions: positions)
+            sized.append((size, candidates, test))
+        sized.sort(key=lambda item: item[0])
+
+        positions = sized[0][1]()
+        # Spatial candidates cover whole cells, so every test runs, including the smallest's own
+        for _, _, test in sized:
+            if not len(positions):
+                break
+            positions = positions[test(positions)]
+        return np.sort(positions)
+
+
+@instrument("build_spatiotemporal_index")
+def build_spatiotemporal_index(data, cell_degrees=INDEX_CELL_DEGREES):
+    """Builds the SpatioTemporalIndex of a prepared dataset."""
+    return SpatioTemporalIndex(data, cell_degrees=cell_degrees)
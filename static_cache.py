@@ -0,0 +1,40 @@
+import os
+import base64
+
+import yaml
+from yaml.loader import SafeLoader
+import streamlit as st
+
+# --- Static File Cache ---
+# Images and the auth config are read once per server process instead of on every
+# rerun. Entries are keyed on the file's modification time, so an edited file is
+# picked up on the next rerun without restarting the server.
+
+
+def _mtime(path):
+    return os.stat(path).st_mtime_ns
+
+
+@st.cache_resource(max_entries=32)
+def _encode_base64(path, mtime_ns):
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+
+def get_base64_image(image_path):
+    """Base64 text of an image file, for inline CSS backgrounds."""
+    return _encode_base64(image_path, _mtime(image_path))
+
+
+@st.cache_data(max_entries=4)
+def _parse_yaml(path, mtime_ns):
+    with open(path) as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def load_auth_config(path="config.yaml"):
+    """
+    The parsed authentication config. Every call gets its own copy, since
+    streamlit_authenticator writes login state into the credentials it is given.
+    """
+    return _parse_yaml(path, _mtime(path))
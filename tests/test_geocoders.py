@@ -0,0 +1,37 @@
+import pandas as pd
+
+from geocoders import GazetteerGeocoder
+
+
+def _gazetteer():
+    rows = [
+        ("Cebu", "province", 10.30, 123.90),
+        ("Cebu City", "city", 10.32, 123.89),
+        ("Quezon", "province", 14.03, 122.11),
+        ("Quezon City", "city", 14.68, 121.04),
+        ("Zamboanga City", "city", 6.92, 122.08),
+    ]
+    # Many names sharing the common trigrams of "San ...", as in a real gazetteer
+    rows += [(f"San Isidro {i}", "barangay", 12.0, 121.0) for i in range(50)]
+    return pd.DataFrame(rows, columns=["name", "level", "latitude", "longitude"])
+
+
+def test_misspelled_names_are_matched_fuzzily():
+    geocoder = GazetteerGeocoder(_gazetteer())
+    assert geocoder.geocode("Zamboanga Ctiy") == (6.92, 122.08)
+    assert geocoder.geocode("Qezon City") == (14.68, 121.04)
+    assert geocoder.geocode("Atlantis") is None
+
+
+def test_fuzzy_matching_skips_common_trigrams_without_losing_rare_ones():
+    # With a tiny posting cap, every trigram of "San Isidro" counts as common
+    geocoder = GazetteerGeocoder(_gazetteer(), max_postings=5)
+    assert geocoder.geocode("Zamboanga Ctiy") == (6.92, 122.08)
+    assert geocoder.geocode("San Isidro 7x") == (12.0, 121.0)
+
+
+def test_cities_are_kept_apart_from_provinces():
+    geocoder = GazetteerGeocoder(_gazetteer())
+    assert geocoder.geocode("Cebu City, Philippines") == (10.32, 123.89)
+    assert geocoder.geocode("City of Cebu") == (10.32, 123.89)
+    assert geocoder.geocode("Cebu") == (10.30, 123.90)
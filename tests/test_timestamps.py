@@ -0,0 +1,29 @@
+import pandas as pd
+
+from timestamps import infer_timestamp_formats, parse_timestamps
+
+
+def test_iso_dates_with_small_days_are_not_read_day_first():
+    expected = pd.Series(pd.date_range("2024-03-01", "2024-03-20 23:00", freq="h"))
+    values = expected.dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    assert infer_timestamp_formats(values) == ["%Y-%m-%d %H:%M:%S"]
+    parsed = parse_timestamps(values, timezone="")
+    assert (parsed == expected).all()
+
+
+def test_iso_dates_reaching_the_fallback_are_not_read_day_first():
+    parsed = parse_timestamps(pd.Series(["2024-03-09T10:00:00", "2024-03-04"]), formats=[], timezone="")
+    assert list(parsed) == [pd.Timestamp("2024-03-09 10:00"), pd.Timestamp("2024-03-04")]
+
+
+def test_slash_dates_are_read_day_first():
+    parsed = parse_timestamps(pd.Series(["03/04/2024 09:15", "16/10/2026 10:00"]), timezone="")
+    assert list(parsed) == [pd.Timestamp("2024-04-03 09:15"), pd.Timestamp("2026-10-16 10:00")]
+
+
+def test_naive_timestamps_are_local_to_the_timezone():
+    parsed, report = parse_timestamps(pd.Series(["2024-03-04 10:00:00", "garbage"]), timezone="Asia/Manila",
+                                      return_report=True)
+    assert parsed[0] == pd.Timestamp("2024-03-04 10:00", tz="Asia/Manila")
+    assert report["failed"] == 1
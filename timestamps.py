@@ -0,0 +1,132 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from instrumentation import instrument
+
+# --- Timestamp Parsing Settings ---
+# Timestamps are parsed once per distinct string, in one vectorized pass per format
+# inferred from a sample, and converted to this timezone. Naive timestamps are taken
+# to be local time there; an empty setting keeps them naive.
+TIMESTAMP_TIMEZONE = os.environ.get("TIMESTAMP_TIMEZONE", "Asia/Manila")
+TIMESTAMP_SAMPLE_SIZE = 500   # Distinct values the formats are inferred from
+MAX_TIMESTAMP_FORMATS = 4     # Passes with an explicit format before the per-element fallback
+
+
+def infer_timestamp_formats(values, sample_size=TIMESTAMP_SAMPLE_SIZE, max_formats=MAX_TIMESTAMP_FORMATS, seed=0):
+    """
+    Infers the dominant strptime formats of a set of timestamp strings.
+
+    Parameters:
+    - values (array-like): Distinct timestamp strings.
+    - sample_size (int): How many of them to guess formats from.
+    - max_formats (int): Most formats to return.
+
+    Returns the formats ordered by how many sampled values they match, most first.
+    Day-first readings are preferred for ambiguous dates like 03/04/2024.
+    """
+    values = pd.Series(values, dtype=object).dropna()
+    if len(values) > sample_size:
+        values = values.sample(sample_size, random_state=seed)
+    return pd.Series([_guess_format(str(value)) for value in values], dtype=object).dropna() \
+        .value_counts().head(max_formats).index.tolist()
+
+
+def _guess_format(value):
+    """
+    strptime format of one timestamp string. Year-first strings (ISO and the like) are
+    always year-month-day; only the others are read day-first.
+    """
+    with warnings.catch_warnings():
+        # Day-first-only strings like 16/10/2026 warn here; they are guessed day-first below
+        warnings.simplefilter("ignore", UserWarning)
+        guess = guess_datetime_format(value)
+    if guess is None or guess.startswith('%Y'):
+        return guess
+    return guess_datetime_format(value, dayfirst=True) or guess
+
+
+def _to_utc(parsed, timezone):
+    """Naive UTC datetime64 values of parsed timestamps; naive input is local time in `timezone`."""
+    parsed = pd.Series(parsed)
+    if parsed.dt.tz is None:
+        parsed = parsed.dt.tz_localize(timezone or 'UTC', ambiguous='NaT', nonexistent='NaT')
+    return parsed.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+
+
+def _from_utc(values, timezone, index=None, name=None):
+    """Timestamps in `timezone` (naive local time when it is empty) from naive UTC values."""
+    parsed = pd.Series(values, index=index, name=name, dtype='datetime64[ns]').dt.tz_localize('UTC')
+    if not timezone:
+        return parsed.dt.tz_localize(None)
+    return parsed.dt.tz_convert(timezone)
+
+
+@instrument("parse_timestamps")
+def parse_timestamps(values, formats=None, timezone=TIMESTAMP_TIMEZONE, fallback=True, return_report=False):
+    """
+    Parses a column of timestamp strings.
+
+    Every distinct string is parsed once and the results are broadcast back to the
+    rows. The distinct strings go through one vectorized pass per format (inferred
+    from a sample unless given); whatever none of the formats matched gets a final
+    per-element pass that accepts mixed formats, so odd rows still parse.
+
+    Parameters:
+    - values (Series): Raw timestamp values (strings, categoricals or datetimes).
+    - formats (list): strptime formats to try, in order. Inferred when None.
+    - timezone (str): Timezone of the result (see TIMESTAMP_TIMEZONE).
+    - fallback (bool): Whether to run the per-element pass for unmatched values.
+    - return_report (bool): Also return a dict with 'formats', 'total', 'failed'
+      and 'failure_rate'.
+
+    Returns a datetime Series aligned with `values` (NaT where parsing failed).
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        parsed = _from_utc(_to_utc(values, timezone), timezone, index=values.index, name=values.name)
+    else:
+        # Parse each distinct string once
+        codes, uniques = pd.factorize(values)
+        uniques = pd.Index(uniques).astype(str)
+        if formats is None:
+            formats = infer_timestamp_formats(uniques)
+
+        utc = np.full(len(uniques), np.datetime64('NaT'), dtype='datetime64[ns]')
+        remaining = np.ones(len(uniques), dtype=bool)
+        passes = [{'format': fmt} for fmt in formats]
+        if fallback:
+            # ISO strings first, since the day-first mixed pass would read 2024-03-09 as 3 September
+            passes.append({'format': 'ISO8601'})
+            passes.append({'format': 'mixed', 'dayfirst': True})
+        for options in passes:
+            if not remaining.any():
+                break
+            pending = uniques[remaining]
+            try:
+                attempt = pd.to_datetime(pending, errors='coerce', **options)
+            except ValueError:
+                # Offsets differ between values (or only some have one), so parse as UTC
+                attempt = pd.to_datetime(pending, errors='coerce', utc=True, **options)
+            attempt = _to_utc(attempt, timezone)
+            positions = np.flatnonzero(remaining)[~np.isnat(attempt)]
+            utc[positions] = attempt[~np.isnat(attempt)]
+            remaining[positions] = False
+
+        # Missing values (code -1) stay NaT
+        utc = np.where(codes >= 0, utc[np.maximum(codes, 0)], np.datetime64('NaT'))
+        parsed = _from_utc(utc, timezone, index=values.index, name=values.name)
+
+    if not return_report:
+        return parsed
+    failed = int(parsed.isna().sum())
+    report = {
+        'formats': list(formats or []),
+        'total': len(parsed),
+        'failed': failed,
+        'failure_rate': failed / len(parsed) if len(parsed) else 0.0
+    }
+    return parsed, report
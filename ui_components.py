@@ -5,6 +5,11 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
+from instrumentation import instrument
+from aggregates import (get_chart_cube, rollup, choose_cell_degrees, bin_locations, MAX_MAP_MARKERS,
+                        time_series, choose_time_period, TIME_SERIES_PERIODS,
+                        get_parallel_summary, PARALLEL_FEATURES)
+
 # --- Helper Function for Color Mapping ---
 def get_colors(num_colors):
     """Returns a list of distinct hex colors."""
@@ -15,6 +20,7 @@ def get_colors(num_colors):
     return [colors[i % len(colors)] for i in range(num_colors)]
 
 # --- Elbow Plot Function ---
+@instrument("ui.display_elbow_plot")
 def display_elbow_plot(inertias, optimal_k):
     """Displays the Elbow Method plot to help choose K."""
     st.subheader("Optimal K Determination (Elbow Method)")
@@ -41,40 +47,34 @@ def display_elbow_plot(inertias, optimal_k):
     st.success(f"**Data-Driven Recommendation:** The optimal number of clusters (K) found for this dataset is **{optimal_k}**. The slider in the sidebar has been set to this value.")
 
 # --- NEW: Source Credibility Chart ---
+@instrument("ui.display_source_credibility")
 def display_source_credibility(analysis_results):
     """Displays a stacked bar chart of source credibility."""
     st.subheader("News Source Credibility Analysis")
     
-    # Use the original data from the results, which contains 'source' and 'label'
-    data = analysis_results['data'].copy()
-    
-    if 'source' not in data.columns or 'label' not in data.columns:
+    columns = analysis_results['data'].columns
+    if 'source' not in columns or 'label' not in columns:
         st.warning("Could not find 'source' or 'label' columns. Please re-check your column mapping in Step 2.")
         return
 
-    # Create a simple "credible" vs "not credible" categorization
-    # This makes assumptions, you may need to adjust the keywords
-    def categorize_label(label):
-        label_str = str(label).lower()
-        if 'not' in label_str or 'fake' in label_str or 'false' in label_str:
-            return 'Not Credible'
-        if 'credible' in label_str or 'real' in label_str or 'true' in label_str:
-            return 'Credible'
-        return 'Other/Uncategorized'
-
-    data['Credibility'] = data['label'].apply(categorize_label)
+    # Counts per source and credibility come from the pre-aggregated cube, so the
+    # chart spec grows with the number of sources rather than the number of posts
+    source_counts = rollup(get_chart_cube(analysis_results)['source'], ['source', 'credibility'])
+    source_counts = source_counts.rename(columns={'credibility': 'Credibility'})
+    source_counts['Credibility'] = source_counts['Credibility'].astype(str)
     
     # Create the stacked bar chart
-    chart = alt.Chart(data).mark_bar().encode(
+    chart = alt.Chart(source_counts).mark_bar().encode(
         # X-axis shows the count of posts
-        x=alt.X('count()', title="Number of Posts"),
+        x=alt.X('count:Q', title="Number of Posts"),
         # Y-axis shows the news source/brand
-        y=alt.Y('source', title="News Source / Brand", sort='-x'),
+        y=alt.Y('source:N', title="News Source / Brand",
+                sort=alt.EncodingSortField(field='count', op='sum', order='descending')),
         # Color segments the bar by credibility
-        color=alt.Color('Credibility', scale=alt.Scale(domain=['Credible', 'Not Credible', 'Other/Uncategorized'],
+        color=alt.Color('Credibility:N', scale=alt.Scale(domain=['Credible', 'Not Credible', 'Uncategorized'],
                                                     range=['#1f77b4', '#d62728', '#7f7f7f'])),
         # Tooltip for interactivity
-        tooltip=['source', 'Credibility', 'count()']
+        tooltip=['source:N', 'Credibility:N', 'count:Q']
     ).properties(
         title="Post Credibility by News Source"
     ).interactive()
@@ -84,10 +84,32 @@ def display_source_credibility(analysis_results):
 
 
 # --- Bubble Map ---
+# Map detail choices: grid cell size in degrees, None for exact locations
+MAP_DETAIL_LEVELS = {
+    "Auto": "auto",
+    "Exact locations": None,
+    "~1 km grid": 0.01,
+    "~5 km grid": 0.05,
+    "~25 km grid": 0.25,
+    "~100 km grid": 1.0,
+}
+
+
+def _map_traces():
+    """
+    Plotly 5.24 added MapLibre map traces and later releases dropped the Mapbox ones;
+    returns (scatter trace, density trace, layout key) for whichever this install has.
+    """
+    if hasattr(go, 'Scattermap'):
+        return go.Scattermap, go.Densitymap, 'map'
+    return go.Scattermapbox, go.Densitymapbox, 'mapbox'
+
+
+@instrument("ui.display_bubble_map")
 def display_bubble_map(analysis_results):
     """Displays an interactive map showing credibility hotspots."""
     st.subheader("Geographical Distribution of News Reports")
-    data = analysis_results['data'].copy()
+    data = analysis_results['data']
     
     if data.empty:
         st.warning("No data available to display.")
@@ -102,24 +124,14 @@ def display_bubble_map(analysis_results):
         st.warning("Credibility label column not available.")
         return
     
-    # Filter out any invalid coordinates
-    data = data.dropna(subset=['latitude', 'longitude', 'label'])
-    
-    # Classify as Fake or Credible based on label (same logic as source credibility chart)
-    def categorize_label(label):
-        label_str = str(label).lower()
-        if 'not' in label_str or 'fake' in label_str or 'false' in label_str:
-            return 'Fake News'
-        if 'credible' in label_str or 'real' in label_str or 'true' in label_str:
-            return 'Credible News'
-        return 'Unknown'
-    
-    data['credibility'] = data['label'].apply(categorize_label)
+    # Per-location counts from the pre-aggregated cube (invalid coordinates never
+    # make it into the cube). Same categories as the source credibility chart.
+    location_cube = get_chart_cube(analysis_results)['location']
     
-    # Filter out Unknown categories for cleaner visualization
-    data = data[data['credibility'] != 'Unknown']
+    # Filter out uncategorized labels for cleaner visualization
+    location_cube = location_cube[location_cube['credibility'] != 'Uncategorized']
     
-    if data.empty:
+    if location_cube.empty:
         st.warning("No credibility data available after filtering.")
         return
     
@@ -133,30 +145,61 @@ def display_bubble_map(analysis_results):
         horizontal=True
     )
     
-    # Aggregate data by location for cleaner display
-    map_data = data.groupby(['location', 'latitude', 'longitude', 'credibility']).size().reset_index(name='count')
+    # Already aggregated by location for cleaner display
+    map_data = location_cube
     
     # Filter based on selection
     if map_filter == "Fake News Only":
-        map_data = map_data[map_data['credibility'] == 'Fake News']
+        map_data = map_data[map_data['credibility'] == 'Not Credible']
     elif map_filter == "Credible News Only":
-        map_data = map_data[map_data['credibility'] == 'Credible News']
+        map_data = map_data[map_data['credibility'] == 'Credible']
+    
+    # With many distinct places, markers are merged on a grid so the browser never
+    # receives more than MAX_MAP_MARKERS points; very large maps default to a heatmap
+    many_places = len(map_data) > MAX_MAP_MARKERS
+    col1, col2 = st.columns(2)
+    with col1:
+        map_style = st.radio("Map style:", ["Bubbles", "Density heatmap"], index=1 if many_places else 0, horizontal=True)
+    with col2:
+        detail = st.selectbox("Map detail:", list(MAP_DETAIL_LEVELS), index=0)
+    
+    requested_cell = MAP_DETAIL_LEVELS[detail]
+    if requested_cell == "auto":
+        cell_degrees = choose_cell_degrees(map_data)
+    else:
+        cell_degrees = choose_cell_degrees(map_data, min_cell_degrees=requested_cell)
+        if cell_degrees != requested_cell:
+            st.caption(f"That detail level would draw more than {MAX_MAP_MARKERS:,} markers; showing a ~{cell_degrees * 100:g} km grid instead.")
+    map_data = bin_locations(map_data, cell_degrees)
     
     # Create separate traces for better control
-    fake_data = map_data[map_data['credibility'] == 'Fake News']
-    credible_data = map_data[map_data['credibility'] == 'Credible News']
+    fake_data = map_data[map_data['credibility'] == 'Not Credible']
+    credible_data = map_data[map_data['credibility'] == 'Credible']
     
     # Create the interactive map using Plotly with separate traces
+    scatter_trace, density_trace, map_layout = _map_traces()
     fig = go.Figure()
     
+    if map_style == "Density heatmap":
+        fig.add_trace(density_trace(
+            lat=map_data['latitude'],
+            lon=map_data['longitude'],
+            z=map_data['count'],
+            radius=20,
+            colorscale='YlOrRd',
+            customdata=map_data[['location', 'count']],
+            hovertemplate='<b>%{customdata[0]}</b><br>Reports: %{customdata[1]}<extra></extra>',
+            name='Report Density'
+        ))
+    
     # Add Credible News first (will be behind)
-    if not credible_data.empty:
-        fig.add_trace(go.Scattermapbox(
+    if map_style == "Bubbles" and not credible_data.empty:
+        fig.add_trace(scatter_trace(
             lat=credible_data['latitude'],
             lon=credible_data['longitude'],
             mode='markers',
             marker=dict(
-                size=credible_data['count'].apply(lambda x: min(x/2 + 10, 35)),
+                size=np.minimum(credible_data['count'].to_numpy() / 2 + 10, 35),
                 color='#44bb44',
                 opacity=0.8
             ),
@@ -167,13 +210,13 @@ def display_bubble_map(analysis_results):
         ))
     
     # Add Fake News second (will be on top) with slightly smaller size to show both
-    if not fake_data.empty:
-        fig.add_trace(go.Scattermapbox(
+    if map_style == "Bubbles" and not fake_data.empty:
+        fig.add_trace(scatter_trace(
             lat=fake_data['latitude'],
             lon=fake_data['longitude'],
             mode='markers',
             marker=dict(
-                size=fake_data['count'].apply(lambda x: min(x/2 + 10, 35)),
+                size=np.minimum(fake_data['count'].to_numpy() / 2 + 10, 35),
                 color='#ff4444',
                 opacity=0.8
             ),
@@ -184,11 +227,11 @@ def display_bubble_map(analysis_results):
         ))
     
     fig.update_layout(
-        mapbox=dict(
+        **{map_layout: dict(
             style='open-street-map',
             center=dict(lat=12.8797, lon=121.7740),
             zoom=5
-        ),
+        )},
         showlegend=True,
         legend=dict(
             title='News Type',
@@ -209,9 +252,9 @@ def display_bubble_map(analysis_results):
     st.caption("💡 Use the filter above to toggle between viewing all reports, only fake news, or only credible news. Click on markers for details.")
     st.caption("💡 Zoom, pan, and click on markers to explore the data. Red markers indicate fake news hotspots requiring attention.")
     # Calculate insights
-    fake_count = len(data[data['credibility'] == 'Fake News'])
-    credible_count = len(data[data['credibility'] == 'Credible News'])
-    total_count = len(data)
+    fake_count = int(location_cube.loc[location_cube['credibility'] == 'Not Credible', 'count'].sum())
+    credible_count = int(location_cube.loc[location_cube['credibility'] == 'Credible', 'count'].sum())
+    total_count = fake_count + credible_count
     fake_percentage = (fake_count / total_count * 100) if total_count > 0 else 0
     
     st.info(f"🔴 **Fake News Reports:** {fake_count} ({fake_percentage:.1f}%) | 🟢 **Credible Reports:** {credible_count} ({100-fake_percentage:.1f}%)")
@@ -221,8 +264,9 @@ def display_bubble_map(analysis_results):
     # --- TOP LOCATIONS BAR CHART ---
     st.markdown("### 📍 Top 10 Locations by Report Count")
     
-    location_counts = data.groupby(['location', 'credibility']).size().reset_index(name='count')
-    top_locations = location_counts.groupby('location')['count'].sum().nlargest(10).index
+    location_counts = rollup(location_cube, ['location', 'credibility'])
+    location_counts['credibility'] = location_counts['credibility'].astype(str)
+    top_locations = location_counts.groupby('location', observed=True)['count'].sum().nlargest(10).index
     top_location_data = location_counts[location_counts['location'].isin(top_locations)]
     
     bar_chart = alt.Chart(top_location_data).mark_bar().encode(
@@ -230,7 +274,7 @@ def display_bubble_map(analysis_results):
         y=alt.Y('location:N', title='Location', sort='-x'),
         color=alt.Color('credibility:N',
                        scale=alt.Scale(
-                           domain=['Fake News', 'Credible News'],
+                           domain=['Not Credible', 'Credible'],
                            range=['#ff4444', '#44bb44']
                        ),
                        title='News Type'
@@ -248,7 +292,7 @@ def display_bubble_map(analysis_results):
     st.altair_chart(bar_chart, use_container_width=True)
     
     # Get top fake news location
-    fake_by_location = data[data['credibility'] == 'Fake News'].groupby('location').size().reset_index(name='count')
+    fake_by_location = rollup(location_cube[location_cube['credibility'] == 'Not Credible'], ['location'])
     if not fake_by_location.empty:
         top_fake_location = fake_by_location.loc[fake_by_location['count'].idxmax()]
         st.warning(f"⚠️ **Highest Fake News Activity:** {top_fake_location['location']} with {int(top_fake_location['count'])} fake news reports")
@@ -257,55 +301,66 @@ def display_bubble_map(analysis_results):
 
 
 # --- Temporal Heatmap ---
+@instrument("ui.display_temporal_heatmap")
 def display_temporal_heatmap(analysis_results):
     """Displays temporal analysis with line chart (trend) and bar chart (hourly distribution)."""
     st.subheader("Temporal Pattern Analysis")
-    data = analysis_results['data'][analysis_results['data']['cluster'] != -1].copy()
+    # Counts come from the pre-aggregated cube; outliers (cluster -1) are left out
+    cube = get_chart_cube(analysis_results)
 
-    if 'hour' not in data.columns or 'day_of_week' not in data.columns:
+    if 'hour' not in cube or 'weekday' not in cube:
         st.warning("Temporal features not found. Cannot display temporal patterns.")
         return
     
-    # Ensure we have a proper datetime column for time series
-    if 'timestamp' in data.columns:
-        data['date'] = pd.to_datetime(data['timestamp']).dt.date
-    
     # --- 1. LINE CHART: Reports Over Time ---
     st.markdown("### 📈 News Reports Trend Over Time")
     
-    if 'date' in data.columns:
-        # Group by date to count reports per day
-        daily_counts = data.groupby('date').size().reset_index(name='count')
-        daily_counts['date'] = pd.to_datetime(daily_counts['date'])
+    if 'date' in cube and not cube['date'].empty:
+        # Daily, weekly and monthly counts were computed with the analysis
+        daily_counts = time_series(cube, 'date')
+        first_day, last_day = daily_counts['date'].min().date(), daily_counts['date'].max().date()
         
-        # Filter to show only 2013-2024 date range
-        daily_counts = daily_counts[
-            (daily_counts['date'] >= '2013-01-01') & 
-            (daily_counts['date'] <= '2024-12-31')
-        ]
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            window = st.date_input("Date window:", value=(first_day, last_day),
+                                   min_value=first_day, max_value=last_day)
+        with col2:
+            resolution = st.selectbox("Resolution:", ["Auto"] + list(TIME_SERIES_PERIODS))
         
-        # Sort by date to ensure proper line connection
-        daily_counts = daily_counts.sort_values('date')
+        # While a range is being picked the widget briefly holds only its start
+        window = tuple(window) if isinstance(window, (tuple, list)) else (window,)
+        start = window[0] if window else first_day
+        end = window[1] if len(window) > 1 else last_day
         
-        line_chart = alt.Chart(daily_counts).mark_line(
+        # Too many daily points for the chart width are shown per week or month instead
+        if resolution == "Auto":
+            period = choose_time_period(cube, start, end)
+        else:
+            period = TIME_SERIES_PERIODS[resolution]
+        period_name = {'date': 'Daily', 'week': 'Weekly', 'month': 'Monthly'}[period]
+        period_counts = time_series(cube, period, start, end)
+        daily_counts = time_series(cube, 'date', start, end)
+        
+        line_chart = alt.Chart(period_counts).mark_line(
             point=alt.OverlayMarkDef(filled=True, size=60),
             color='#1f77b4'
         ).encode(
             x=alt.X('date:T', 
                     title='Date', 
                     axis=alt.Axis(
-                        format='%b %d, %Y',
+                        format='%b %Y' if period == 'month' else '%b %d, %Y',
                         labelAngle=-45,
                         labelOverlap=False
                     )
             ),
             y=alt.Y('count:Q', title='Number of Reports'),
             tooltip=[
-                alt.Tooltip('date:T', title='Date', format='%B %d, %Y'),
+                alt.Tooltip('date:T', title='Month' if period == 'month' else ('Week of' if period == 'week' else 'Date'),
+                            format='%B %Y' if period == 'month' else '%B %d, %Y'),
                 alt.Tooltip('count:Q', title='Reports')
             ]
         ).properties(
-            title="Daily Report Activity (2013-2024)",
+            title=f"{period_name} Report Activity ({start.strftime('%b %d, %Y')} to {end.strftime('%b %d, %Y')})",
             height=300
         ).interactive()
         
@@ -315,12 +370,10 @@ def display_temporal_heatmap(analysis_results):
         if not daily_counts.empty:
             peak_day = daily_counts.loc[daily_counts['count'].idxmax()]
             avg_daily = daily_counts['count'].mean()
-            total_days = len(daily_counts)
-            date_range = f"{daily_counts['date'].min().strftime('%b %d, %Y')} to {daily_counts['date'].max().strftime('%b %d, %Y')}"
             
             st.info(f"**Peak Activity:** {peak_day['date'].strftime('%B %d, %Y')} with **{int(peak_day['count'])}** reports | **Average:** {avg_daily:.1f} reports per day")
         else:
-            st.warning("No data found in the 2013-2024 date range.")
+            st.warning("No reports found in the selected date window.")
     else:
         st.warning("Timestamp column not available for trend analysis.")
     
@@ -329,7 +382,7 @@ def display_temporal_heatmap(analysis_results):
     # --- 2. BAR CHART: Distribution by Hour of Day ---
     st.markdown("### ⏰ Activity Distribution by Hour of Day")
     
-    hourly_counts = data.groupby('hour').size().reset_index(name='count')
+    hourly_counts = rollup(cube['hour'], ['hour'], inliers_only=True)
     
     # Convert 24-hour to 12-hour format with AM/PM
     def hour_to_12hr(hour):
@@ -380,8 +433,8 @@ def display_temporal_heatmap(analysis_results):
     day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     day_map = {0: 'Monday', 1: 'Tuesday', 2: 'Wednesday', 3: 'Thursday', 4: 'Friday', 5: 'Saturday', 6: 'Sunday'}
     
-    data['day_name'] = data['day_of_week'].map(day_map)
-    weekly_counts = data.groupby('day_name').size().reset_index(name='count')
+    weekly_counts = rollup(cube['weekday'], ['day_of_week'], inliers_only=True)
+    weekly_counts['day_name'] = weekly_counts['day_of_week'].map(day_map)
     
     # Sort by day of week
     weekly_counts['day_order'] = weekly_counts['day_name'].map({day: i for i, day in enumerate(day_names)})
@@ -410,45 +463,138 @@ def display_temporal_heatmap(analysis_results):
 
 
 # --- Parallel Coordinates Plot ---
+@instrument("ui.display_parallel_coordinates")
 def display_parallel_coordinates(analysis_results):
     """Displays a parallel coordinates plot to show cluster characteristics."""
     st.subheader("Cluster Characteristics (Parallel Coordinates)")
-    data = analysis_results['data'][analysis_results['data']['cluster'] != -1].copy()
+    clusters = analysis_results['data']['cluster']
     
-    if data.empty:
+    if not (clusters != -1).any():
         st.warning("No clustered data available to display.")
         return
         
-    num_clusters = data['cluster'].max() + 1
+    num_clusters = int(clusters.max()) + 1
     cluster_names = [f'Cluster {i}' for i in range(num_clusters)]
     hex_colors = get_colors(num_clusters)
     
-    data['cluster_name'] = data['cluster'].apply(lambda x: f'Cluster {int(x)}')
-    
     # Features to plot
-    features = ['latitude', 'longitude', 'hour', 'day_of_week']
-    
-    chart = alt.Chart(data).transform_window(
-        index='count()'
-    ).transform_fold(
-        features,
-        as_=['Feature', 'Value']
-    ).transform_joinaggregate(
-        min='min(Value)',
-        max='max(Value)',
-        groupby=['Feature']
-    ).transform_calculate(
-        # Normalize each feature to a 0-1 scale
-        normalized_value='(datum.Value - datum.min) / (datum.max - datum.min)'
-    ).mark_line(opacity=0.3).encode(
-        x='Feature:N',
+    features = PARALLEL_FEATURES
+    
+    # Lines are a stratified per-cluster sample; means and quartile bands come from every row
+    summary = get_parallel_summary(analysis_results)
+    lines, centroids, bands = summary['lines'], summary['centroids'], summary['bands']
+    for table in (lines, centroids, bands):
+        table['cluster_name'] = np.array(cluster_names)[table['cluster'].to_numpy()]
+    
+    show_lines = st.checkbox("Show sampled data points", value=True)
+    
+    color = alt.Color('cluster_name:N', scale=alt.Scale(domain=cluster_names, range=hex_colors), title="Cluster")
+    x = alt.X('Feature:N', sort=features)
+    
+    band_layer = alt.Chart(bands).mark_area(opacity=0.15).encode(
+        x=x,
+        y=alt.Y('low:Q', title='normalized_value'),
+        y2='high:Q',
+        color=color,
+        detail='cluster_name:N'
+    )
+    centroid_layer = alt.Chart(centroids).mark_line(strokeWidth=3, point=True).encode(
+        x=x,
         y='normalized_value:Q',
-        color=alt.Color('cluster_name:N', scale=alt.Scale(domain=cluster_names, range=hex_colors), title="Cluster"),
-        detail='index:N',
-        tooltip=['cluster_name', 'location']
-    ).properties(
+        color=color,
+        detail='cluster_name:N',
+        tooltip=['cluster_name', 'Feature', alt.Tooltip('normalized_value:Q', title='Mean', format='.2f')]
+    )
+    layers = [band_layer]
+    if show_lines:
+        layers.append(alt.Chart(lines).mark_line(opacity=0.2, strokeWidth=1).encode(
+            x=x,
+            y='normalized_value:Q',
+            color=color,
+            detail='line:N',
+            tooltip=['cluster_name', 'location'] if 'location' in lines.columns else ['cluster_name']
+        ))
+    layers.append(centroid_layer)
+    
+    chart = alt.layer(*layers).properties(
         title="Parallel Coordinates Plot of Cluster Features"
     ).interactive()
     
     st.altair_chart(chart, use_container_width=True)
-    st.caption("This plot shows how each cluster is defined across all 4 original features. Each line is a data point. This helps visualize the 4D patterns the algorithm found.")
\ No newline at end of file
+    st.caption(f"This plot shows how each cluster is defined across all 4 original features. Thin lines are a sample of {lines['line'].nunique():,} of {summary['total_points']:,} data points, bold lines are cluster means and shaded bands span the middle 50% of each cluster. This helps visualize the 4D patterns the algorithm found.")
+
+
+# --- Subset Filter ---
+def display_subset_filter(index):
+    """
+    Controls for narrowing the analysis to an area, period, source or region.
+
+    Parameters:
+    - index (SpatioTemporalIndex): Index of the prepared data.
+
+    Returns (filters, positions): the keyword arguments for `index.select` (empty when
+    nothing is filtered) and the positions of the matching rows.
+    """
+    filters = {}
+
+    area = st.radio("Area:", ["Everywhere", "Around a location", "Bounding box"], horizontal=True)
+    if area == "Around a location" and 'location' in index.categories:
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            place = st.selectbox("Location:", sorted(index.categories['location'].astype(str)))
+        with col2:
+            radius_km = st.number_input("Radius (km):", min_value=1.0, max_value=1000.0, value=25.0, step=5.0)
+        center = index.center_of('location', place)
+        if center is not None:
+            filters['center'], filters['radius_km'] = center, radius_km
+    elif area == "Bounding box":
+        col1, col2, col3, col4 = st.columns(4)
+        min_lat = col1.number_input("South (lat):", -90.0, 90.0, float(np.floor(index.latitude.min())))
+        max_lat = col2.number_input("North (lat):", -90.0, 90.0, float(np.ceil(index.latitude.max())))
+        min_lon = col3.number_input("West (lon):", -180.0, 180.0, float(np.floor(index.longitude.min())))
+        max_lon = col4.number_input("East (lon):", -180.0, 180.0, float(np.ceil(index.longitude.max())))
+        filters['bbox'] = (min_lat, min_lon, max_lat, max_lon)
+
+    first, last = index.time_range()
+    if first is not None:
+        window = st.date_input("Period:", value=(first.date(), last.date()),
+                               min_value=first.date(), max_value=last.date(), key="subset_period")
+        window = tuple(window) if isinstance(window, (tuple, list)) else (window,)
+        start = window[0] if window else first.date()
+        end = window[1] if len(window) > 1 else last.date()
+        if (start, end) != (first.date(), last.date()):
+            # The end day is included in full
+            filters['start'], filters['end'] = pd.Timestamp(start), pd.Timestamp(end) + pd.Timedelta(days=1)
+
+    for column, title in (('source', "Sources:"), ('region', "Regions:")):
+        if column in index.categories:
+            chosen = st.multiselect(title, sorted(index.categories[column].astype(str)), key=f"subset_{column}")
+            if chosen:
+                filters[column] = chosen
+
+    positions = index.select(**filters)
+    st.caption(f"{len(positions):,} of {index.n_rows:,} reports match.")
+    return filters, positions
+
+
+# --- Pipeline Instrumentation Panel (admins only) ---
+def display_instrumentation_panel(records):
+    """Shows per-stage timings, row counts and memory deltas in the sidebar."""
+    with st.sidebar.expander("⏱️ Pipeline Performance", expanded=False):
+        if not records:
+            st.caption("No pipeline stages recorded in this session yet.")
+            return
+
+        timings = pd.DataFrame(records)
+        latest = timings.groupby('stage', sort=False).tail(1)
+        latest = latest.sort_values('started_at', ascending=False)
+        st.dataframe(
+            latest[['stage', 'duration_seconds', 'rows_in', 'rows_out', 'memory_delta_mb']].rename(columns={
+                'stage': 'Stage', 'duration_seconds': 'Seconds', 'rows_in': 'Rows In',
+                'rows_out': 'Rows Out', 'memory_delta_mb': 'Memory Δ (MB)'
+            }),
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(f"Latest run of each stage. {len(timings)} stage runs recorded this session.")
+
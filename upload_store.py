@@ -0,0 +1,292 @@
+import os
+import glob
+import time
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+
+from dataset_cache import UPLOAD_DIRECTORY
+
+# --- Upload Store Settings ---
+# Uploads are stored once per distinct content (named by SHA-256) and referenced by
+# every user who uploaded them. The store owns the whole upload directory's disk
+# budget: each user's referenced bytes are kept under the per-user quota, and the
+# uploads plus their columnar (Parquet) artifacts under the global quota. Artifacts can
+# be rebuilt from their upload, so they are evicted first, least recently used first.
+UPLOAD_USER_QUOTA_BYTES = int(os.environ.get("UPLOAD_USER_QUOTA_BYTES", 500 * 1024 ** 2))
+UPLOAD_GLOBAL_QUOTA_BYTES = int(os.environ.get("UPLOAD_GLOBAL_QUOTA_BYTES", 5 * 1024 ** 3))
+# Artifacts a session or job is using are pinned for this long (renewed while in use),
+# and are not evicted meanwhile.
+ARTIFACT_PIN_SECONDS = int(os.environ.get("ARTIFACT_PIN_SECONDS", 3600))
+
+_COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadStore:
+    """
+    A content-addressed store of uploaded files with a SQLite index of who uploaded what.
+
+    Files live in `<directory>/store/blobs/<sha256>` next to the index in
+    `<directory>/store/index.sqlite`; the index records each file's size and every
+    user's reference to it (with the name it was uploaded under), so a user's past
+    datasets can be listed without scanning the directory. Artifacts derived from an
+    upload sit at the top of `<directory>` as `<sha256>.*`.
+    """
+    def __init__(self, directory=UPLOAD_DIRECTORY, user_quota_bytes=UPLOAD_USER_QUOTA_BYTES,
+                 global_quota_bytes=UPLOAD_GLOBAL_QUOTA_BYTES):
+        """
+        Parameters:
+        - directory (str): Upload directory (the columnar artifacts live here too).
+        - user_quota_bytes (int): Most bytes of datasets one user may keep.
+        - global_quota_bytes (int): Most bytes of uploads stored in total.
+        """
+        self.directory = directory
+        self.store_directory = os.path.join(directory, "store")
+        self.blob_directory = os.path.join(self.store_directory, "blobs")
+        self.index_path = os.path.join(self.store_directory, "index.sqlite")
+        self.user_quota_bytes = user_quota_bytes
+        self.global_quota_bytes = global_quota_bytes
+        os.makedirs(self.blob_directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS refs (
+                    username TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    uploaded_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (username, sha256)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pins (
+                    path TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A fresh connection per call keeps the store safe to use from any thread.
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_directory, sha256)
+
+    def add(self, username, fileobj, filename):
+        """
+        Stores an uploaded file for `username`, reading it in blocks while hashing.
+        A file whose content is already stored is not written again.
+
+        Returns (sha256, path). Raises ValueError if the file alone is larger than the
+        per-user quota.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.blob_directory, f".upload.{os.getpid()}.{time.time_ns()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                for block in iter(lambda: fileobj.read(_COPY_BLOCK_SIZE), b""):
+                    digest.update(block)
+                    f.write(block)
+                    size += len(block)
+            if size > self.user_quota_bytes:
+                raise ValueError(f"The file is larger than your storage quota of {self.user_quota_bytes / 1024 ** 2:.0f} MB.")
+
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO blobs (sha256, size, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET last_used = excluded.last_used",
+                (sha256, size, now)
+            )
+            conn.execute(
+                "INSERT INTO refs (username, sha256, filename, uploaded_at, last_used) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(username, sha256) DO UPDATE SET filename = excluded.filename, last_used = excluded.last_used",
+                (username, sha256, filename, now, now)
+            )
+        self.enforce_quotas(username, keep=sha256)
+        return sha256, path
+
+    def list_datasets(self, username):
+        """
+        A user's stored datasets, most recently used first, as dicts with
+        'sha256', 'filename', 'size', 'uploaded_at' and 'last_used'.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT refs.sha256, refs.filename, blobs.size, refs.uploaded_at, refs.last_used "
+                "FROM refs JOIN blobs ON blobs.sha256 = refs.sha256 "
+                "WHERE refs.username = ? ORDER BY refs.last_used DESC",
+                (username,)
+            ).fetchall()
+        return [
+            {'sha256': sha256, 'filename': filename, 'size': size, 'uploaded_at': uploaded_at, 'last_used': last_used}
+            for sha256, filename, size, uploaded_at, last_used in rows
+        ]
+
+    def open(self, username, sha256):
+        """
+        Returns the path of one of the user's datasets and marks it as recently used,
+        or None if the user has no such dataset (or it was evicted).
+        """
+        path = self.blob_path(sha256)
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE refs SET last_used = ? WHERE username = ? AND sha256 = ?", (now, username, sha256)
+            ).rowcount
+            if not updated or not os.path.exists(path):
+                return None
+            conn.execute("UPDATE blobs SET last_used = ? WHERE sha256 = ?", (now, sha256))
+        return path
+
+    def remove(self, username, sha256):
+        """Drops a user's reference to a dataset; the file goes once nobody references it."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM refs WHERE username = ? AND sha256 = ?", (username, sha256))
+        self._delete_unreferenced([sha256])
+
+    def pin_artifacts(self, paths, seconds=ARTIFACT_PIN_SECONDS):
+        """
+        Keeps the artifacts at `paths` from being evicted for the next `seconds` (pins
+        live in the index, so they hold for every process). Pinning again renews them.
+        """
+        expires_at = time.time() + seconds
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO pins (path, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET expires_at = MAX(expires_at, excluded.expires_at)",
+                [(os.path.abspath(path), expires_at) for path in paths if path]
+            )
+
+    def _pinned_paths(self, conn):
+        now = time.time()
+        conn.execute("DELETE FROM pins WHERE expires_at <= ?", (now,))
+        return {path for (path,) in conn.execute("SELECT path FROM pins")}
+
+    def _artifacts(self):
+        """(mtime, size, path) of every artifact file, oldest first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Removed by another process meanwhile
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def enforce_quotas(self, username=None, keep=None, keep_paths=()):
+        """
+        Evicts least recently used data until `username` is within the per-user quota
+        and uploads plus artifacts are within the global quota. Artifacts go first; then
+        whole datasets (with their artifacts). The dataset `keep`, the files in
+        `keep_paths` and pinned artifacts (see pin_artifacts) are never evicted.
+        Returns the number of references removed.
+        """
+        removed = 0
+        keep_paths = {os.path.abspath(path) for path in keep_paths}
+        with self._connect() as conn:
+            keep_paths |= self._pinned_paths(conn)
+            if username is not None:
+                rows = conn.execute(
+                    "SELECT refs.sha256, blobs.size FROM refs JOIN blobs ON blobs.sha256 = refs.sha256 "
+                    "WHERE refs.username = ? ORDER BY refs.last_used ASC",
+                    (username,)
+                ).fetchall()
+                total = sum(size for _, size in rows)
+                for sha256, size in rows:
+                    if total <= self.user_quota_bytes:
+                        break
+                    if sha256 == keep:
+                        continue
+                    conn.execute("DELETE FROM refs WHERE username = ? AND sha256 = ?", (username, sha256))
+                    total -= size
+                    removed += 1
+
+            # Unreferenced files count against the global quota until they are deleted below
+            rows = conn.execute("SELECT sha256, size FROM blobs ORDER BY last_used ASC").fetchall()
+            total = sum(size for _, size in rows)
+            artifacts = self._artifacts()
+            total += sum(size for _, size, _ in artifacts)
+            for _, size, path in artifacts:
+                if total <= self.global_quota_bytes:
+                    break
+                if os.path.abspath(path) in keep_paths:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass  # Another session may have removed it
+            for sha256, size in rows:
+                if total <= self.global_quota_bytes:
+                    break
+                if sha256 == keep:
+                    continue
+                removed += conn.execute("DELETE FROM refs WHERE sha256 = ?", (sha256,)).rowcount
+                total -= size
+        self._delete_unreferenced()
+        return removed
+
+    def _delete_unreferenced(self, candidates=None):
+        """Deletes stored files (and their columnar artifacts) that no user references."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT sha256 FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM refs)"
+            ).fetchall()
+            orphans = [sha256 for (sha256,) in rows if candidates is None or sha256 in candidates]
+            for sha256 in orphans:
+                conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            pinned = self._pinned_paths(conn)
+
+        for sha256 in orphans:
+            for path in [self.blob_path(sha256)] + glob.glob(os.path.join(self.directory, f"{sha256}.*")):
+                if os.path.abspath(path) in pinned:
+                    continue  # Still in use; evicted once its pin lapses
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # Already removed by another process
+        return orphans
+
+
+_upload_stores = {}
+
+
+def get_upload_store(directory=UPLOAD_DIRECTORY):
+    """Returns the process-wide UploadStore of `directory`."""
+    if directory not in _upload_stores:
+        _upload_stores[directory] = UploadStore(directory)
+    return _upload_stores[directory]